@@ -0,0 +1,207 @@
+"""Статистика испытаний на адгезию.
+
+Все величины считаются векторно (NumPy) за один проход по массиву значений
+силы и возвращаются одним неизменяемым объектом AdhesionStats, который
+используют таблица, график и выводы отчёта.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+
+# Допуск от среднего значения адгезии для диапазона на графике и в таблице
+BAND_FRACTION = 0.15
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+@dataclass(frozen=True)
+class AdhesionStats:
+    """Результаты расчёта адгезии по серии испытаний"""
+    forces: np.ndarray  # Значения силы отрыва, кН
+    square: float  # Площадь отрыва, см²
+    normative_value: float  # Нормативное значение, МПа
+    adhesion: np.ndarray  # Величина адгезии по участкам, МПа
+    conforms: np.ndarray  # Соответствие нормативу по участкам
+    within_band: np.ndarray  # Попадание в диапазон ±15% от среднего по участкам
+    mean: float
+    min: float
+    max: float
+    std: float  # Выборочное стандартное отклонение
+    cv: float  # Коэффициент вариации (доля, не проценты)
+    lower_bound: float  # Среднее -15%
+    upper_bound: float  # Среднее +15%
+
+    @property
+    def count(self):
+        return len(self.adhesion)
+
+    @property
+    def plot_numbers(self):
+        """Номера участков: 1, 2, ..., count"""
+        return list(range(1, self.count + 1))
+
+    @property
+    def all_conform(self):
+        return bool(self.conforms.all())
+
+    @property
+    def average_text(self):
+        """Среднее значение адгезии для таблицы: два знака, десятичная запятая"""
+        return str(round(self.mean, 2)).replace(".", ",")
+
+
+def adhesion_of(forces, square):
+    """Величина адгезии, МПа, для массива значений силы"""
+    # =(значение_силы*1000)/(площадь*100)
+    return forces * 1000 / (square * 100)
+
+
+def conformity_of(forces, square, normative_value):
+    """Соответствие нормативу для массива значений силы"""
+    # Правило соответствия, как в исходной таблице отчёта
+    return forces / (square * 100) < normative_value
+
+
+def compute_adhesion_stats(forces, square, normative_value=0.1, band_fraction=BAND_FRACTION):
+    """Считает адгезию и статистику по серии значений силы"""
+    forces = _readonly(np.array(forces, dtype=float))
+    if forces.size == 0:
+        raise ValueError("Нет значений силы для расчёта адгезии")
+    square = float(square)
+    normative_value = float(normative_value)
+
+    adhesion = _readonly(adhesion_of(forces, square))
+
+    mean = float(adhesion.mean())
+    std = float(adhesion.std(ddof=1)) if adhesion.size > 1 else 0.0
+    lower_bound = mean * (1 - band_fraction)
+    upper_bound = mean * (1 + band_fraction)
+
+    conforms = _readonly(conformity_of(forces, square, normative_value))
+    within_band = _readonly((adhesion >= lower_bound) & (adhesion <= upper_bound))
+
+    return AdhesionStats(
+        forces=forces,
+        square=square,
+        normative_value=normative_value,
+        adhesion=adhesion,
+        conforms=conforms,
+        within_band=within_band,
+        mean=mean,
+        min=float(adhesion.min()),
+        max=float(adhesion.max()),
+        std=std,
+        cv=std / mean if mean else 0.0,
+        lower_bound=lower_bound,
+        upper_bound=upper_bound,
+    )
+
+
+def combine_adhesion_stats(stats_list, band_fraction=BAND_FRACTION):
+    """Сводная статистика по нескольким участкам для общих выводов отчёта.
+
+    Серии участков объединяются в одну. Площадь отрыва у участков может
+    быть разной, поэтому адгезия и соответствие берутся уже посчитанными;
+    square в сводке — общая площадь участков или nan, если она различается.
+    """
+    stats_list = list(stats_list)
+    if not stats_list:
+        raise ValueError("Нет значений силы для расчёта адгезии")
+    if len(stats_list) == 1:
+        return stats_list[0]
+
+    squares = {stats.square for stats in stats_list}
+    normatives = {stats.normative_value for stats in stats_list}
+    forces = _readonly(np.concatenate([stats.forces for stats in stats_list]))
+    adhesion = _readonly(np.concatenate([stats.adhesion for stats in stats_list]))
+    conforms = _readonly(np.concatenate([stats.conforms for stats in stats_list]))
+
+    mean = float(adhesion.mean())
+    std = float(adhesion.std(ddof=1)) if adhesion.size > 1 else 0.0
+    lower_bound = mean * (1 - band_fraction)
+    upper_bound = mean * (1 + band_fraction)
+
+    return AdhesionStats(
+        forces=forces,
+        square=squares.pop() if len(squares) == 1 else float("nan"),
+        normative_value=normatives.pop() if len(normatives) == 1 else float("nan"),
+        adhesion=adhesion,
+        conforms=conforms,
+        within_band=_readonly((adhesion >= lower_bound) & (adhesion <= upper_bound)),
+        mean=mean,
+        min=float(adhesion.min()),
+        max=float(adhesion.max()),
+        std=std,
+        cv=std / mean if mean else 0.0,
+        lower_bound=lower_bound,
+        upper_bound=upper_bound,
+    )
+
+
+class AdhesionAccumulator:
+    """Статистика адгезии для потока значений силы (длинные серии измерений).
+
+    Значения поступают порциями и обрабатываются векторно; в памяти
+    хранятся только итоговые суммы, поэтому расход памяти не зависит
+    от числа измерений. Дисперсия объединяется по порциям (алгоритм Чана).
+    """
+
+    def __init__(self, square, normative_value=0.1, band_fraction=BAND_FRACTION):
+        self.square = float(square)
+        self.normative_value = float(normative_value)
+        self.band_fraction = band_fraction
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        self.all_conform = True
+        self._m2 = 0.0  # Сумма квадратов отклонений от среднего
+
+    def add(self, forces):
+        """Добавляет порцию значений силы, возвращает (адгезия, соответствие) по порции"""
+        forces = np.asarray(forces, dtype=float)
+        adhesion = adhesion_of(forces, self.square)
+        conforms = conformity_of(forces, self.square, self.normative_value)
+        if adhesion.size == 0:
+            return adhesion, conforms
+
+        chunk_count = adhesion.size
+        chunk_mean = float(adhesion.mean())
+        chunk_m2 = float(((adhesion - chunk_mean) ** 2).sum())
+        total = self.count + chunk_count
+        delta = chunk_mean - self.mean
+        self.mean += delta * chunk_count / total
+        self._m2 += chunk_m2 + delta * delta * self.count * chunk_count / total
+        self.count = total
+
+        chunk_min = float(adhesion.min())
+        chunk_max = float(adhesion.max())
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+        self.all_conform = self.all_conform and bool(conforms.all())
+        return adhesion, conforms
+
+    @property
+    def std(self):
+        """Выборочное стандартное отклонение"""
+        return (self._m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+    @property
+    def cv(self):
+        return self.std / self.mean if self.mean else 0.0
+
+    @property
+    def lower_bound(self):
+        return self.mean * (1 - self.band_fraction)
+
+    @property
+    def upper_bound(self):
+        return self.mean * (1 + self.band_fraction)
+
+    @property
+    def average_text(self):
+        return str(round(self.mean, 2)).replace(".", ",")
@@ -0,0 +1,404 @@
+"""Пакетное создание отчётов по манифесту.
+
+Манифест — CSV, JSON или XLSX, одна строка на отчёт. Столбцы:
+object_id или object_name, device_id или device_name (плюс device_number,
+device_valid_until), client, contract, plot_location, work_date, plot_name,
+square, values, а также необязательные output, page_name, user_info, test_type,
+chart_backend.
+
+Строки с одинаковым output собираются в один отчёт по нескольким
+контролируемым участкам: каждая строка — свой участок (plot_location,
+work_date, plot_name, square, values). Поля шапки (объект, прибор с датой
+поверки, заказчик, договор, тип испытания) во всех строках отчёта должны
+совпадать; если хотя бы одна строка отчёта с ошибкой, отчёт не создаётся
+целиком и в сводку попадает одна ошибка на весь отчёт.
+
+Справочные данные (объекты и приборы) берутся из базы одним запросом,
+отчёты создаются параллельно в пуле процессов:
+
+    python batch_report.py manifest.csv --workers 4 --output-dir отчёты
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from database import DEFAULT_DB_PATH, Database
+from report import (
+    DEFAULT_TEST_TYPE, validate_date, parse_values,
+    find_report_images, get_report_template_path
+)
+from report_layout import get_layout_test_types
+
+
+REQUIRED_FIELDS = ("client", "contract", "plot_location", "work_date", "plot_name", "values")
+
+# Поля шапки, одинаковые во всех строках отчёта по нескольким участкам
+HEADER_FIELDS = {
+    "o_n": "объект", "client_n": "заказчик", "contract_n": "договор", "d_n": "прибор",
+    "z_n": "номер прибора", "d_v_u": "дата поверки прибора", "layout": "тип испытания",
+}
+
+
+class BatchSummary:
+    """Итоги пакетного создания отчётов"""
+
+    def __init__(self, total):
+        self.total = total
+        self.created = []  # [(номер строки, путь к отчёту, время, с), ...]
+        self.failures = []  # [(номер строки, сообщение об ошибке), ...]
+        self.elapsed = 0.0
+        self.stage_totals = {}  # {этап: (время, процессорное время)} по всем отчётам
+
+    def add_stage_totals(self, stage_totals):
+        for name, (wall_s, cpu_s) in stage_totals.items():
+            total_wall, total_cpu = self.stage_totals.get(name, (0.0, 0.0))
+            self.stage_totals[name] = (total_wall + wall_s, total_cpu + cpu_s)
+
+    @property
+    def reports_per_second(self):
+        return len(self.created) / self.elapsed if self.elapsed else 0.0
+
+    def format(self):
+        lines = [
+            f"Создано отчётов: {len(self.created)} из {self.total} "
+            f"за {self.elapsed:.2f} с ({self.reports_per_second:.2f} отчётов/с)"
+        ]
+        if self.created:
+            times = [elapsed for _, _, elapsed in self.created]
+            lines.append(
+                f"Время на отчёт: среднее {sum(times) / len(times):.2f} с, "
+                f"максимальное {max(times):.2f} с"
+            )
+        if self.stage_totals:
+            stages = sorted(self.stage_totals.items(), key=lambda item: -item[1][0])
+            lines.append("Время по этапам (сумма по отчётам): " + ", ".join(
+                f"{name} {wall_s:.2f} с" for name, (wall_s, _) in stages
+            ))
+        if self.failures:
+            lines.append(f"Ошибок: {len(self.failures)}")
+            for row_number, message in sorted(self.failures):
+                lines.append(f"  строка {row_number}: {message}")
+        return "\n".join(lines)
+
+
+def read_manifest(manifest_path):
+    """Читает манифест (CSV, JSON или XLSX) и возвращает список словарей"""
+    ext = os.path.splitext(manifest_path)[1].lower()
+
+    if ext == ".json":
+        with open(manifest_path, encoding="utf-8") as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows.get("reports", [])
+        return [dict(row) for row in rows]
+
+    if ext in (".xlsx", ".xlsm"):
+        import openpyxl
+        wb = openpyxl.load_workbook(manifest_path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(name).strip() if name is not None else "" for name in next(rows, ())]
+            return [
+                {name: value for name, value in zip(header, row) if name and value is not None}
+                for row in rows
+                if any(value is not None for value in row)
+            ]
+        finally:
+            wb.close()
+
+    with open(manifest_path, encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        return [
+            {name.strip(): value for name, value in row.items() if name and value not in (None, "")}
+            for row in csv.DictReader(f, dialect=dialect)
+        ]
+
+
+def _to_int(value, field=None):
+    """Целое число из ячейки манифеста (в XLSX целые бывают вида 12.0).
+    Дробное или нечисловое значение — ValueError с понятным сообщением"""
+    if value in (None, ""):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = None
+    if number is None or not number.is_integer():
+        raise ValueError(f"{field or 'значение'} должно быть целым числом: {value}")
+    return int(number)
+
+
+def _collect_ids(rows, field):
+    """ID из столбца field для загрузки одним запросом; неверные значения
+    пропускаются — ошибка будет у своей строки"""
+    ids = []
+    for row in rows:
+        try:
+            value = _to_int(row.get(field), field)
+        except ValueError:
+            continue
+        if value is not None:
+            ids.append(value)
+    return ids
+
+
+def prepare_jobs(rows, db, output_dir=None, defaults=None):
+    """Проверяет строки манифеста и превращает их в задания для рабочих процессов.
+
+    Возвращает (задания, ошибки). Объекты и приборы загружаются из базы
+    одним запросом, изображения и шаблон — один раз на тип испытания.
+    Строки с одинаковым output проверяются вместе: отчёт с ошибкой хотя бы
+    в одной строке не попадает в задания (частичный отчёт не создаётся).
+    """
+    defaults = defaults or {}
+    jobs = []
+    failures = []
+
+    rows_with_defaults = [{**defaults, **row} for row in rows]
+    objects, devices = db.get_report_reference_data(
+        _collect_ids(rows_with_defaults, "object_id"), _collect_ids(rows_with_defaults, "device_id")
+    )
+
+    resources = {}
+    layout_test_types = set(get_layout_test_types())
+    jobs_by_output = {}  # {output: задание} для сборки участков в один отчёт
+    rows_by_output = {}  # {output: [номера строк]}
+    errors_by_output = {}  # {output: [(номер строки, ошибка), ...]}
+
+    for row_number, row in enumerate(rows, start=1):
+        row = {**defaults, **row}
+        output = row.get("output")
+        if output:
+            rows_by_output.setdefault(output, []).append(row_number)
+        try:
+            missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, "")]
+            if missing:
+                raise ValueError(f"не заполнены поля: {', '.join(missing)}")
+
+            work_date = str(row["work_date"]).strip()
+            is_valid, error_msg = validate_date(work_date)
+            if not is_valid:
+                raise ValueError(f"ошибка в дате проведения работ: {error_msg}")
+
+            values = row["values"]
+            if isinstance(values, (list, tuple)):
+                values = [float(v) for v in values]
+            else:
+                try:
+                    values = parse_values(str(values))
+                except ValueError:
+                    raise ValueError("неверный формат значений силы")
+            if not values:
+                raise ValueError("нет значений силы")
+
+            if row.get("object_id") not in (None, ""):
+                obj = objects.get(_to_int(row["object_id"], "object_id"))
+                if not obj:
+                    raise ValueError(f"объект с ID {row['object_id']} не найден")
+                object_name = obj[1]
+            elif row.get("object_name"):
+                object_name = str(row["object_name"])
+            else:
+                raise ValueError("укажите object_id или object_name")
+
+            if row.get("device_id") not in (None, ""):
+                device = devices.get(_to_int(row["device_id"], "device_id"))
+                if not device:
+                    raise ValueError(f"прибор с ID {row['device_id']} не найден")
+                device_id, device_name, model, inventory_number, valid_until, device_desc = device
+            elif row.get("device_name"):
+                device_name = str(row["device_name"])
+                inventory_number = row.get("device_number")
+                valid_until = row.get("device_valid_until")
+            else:
+                raise ValueError("укажите device_id или device_name")
+
+            test_type = row.get("test_type") or DEFAULT_TEST_TYPE
+            if test_type not in layout_test_types:
+                raise ValueError(f"нет макета отчёта для типа испытания '{test_type}'")
+            if test_type not in resources:
+                org_header, formula_image = find_report_images(db, test_type)
+                resources[test_type] = (org_header, formula_image, get_report_template_path(db, test_type))
+            org_header, formula_image, template_path = resources[test_type]
+
+            plot = dict(
+                plot_location=str(row["plot_location"]),
+                work_date=work_date,
+                plot_name=str(row["plot_name"]),
+                square=_to_int(row.get("square"), "square") or 25,
+                values=values,
+            )
+            header = dict(
+                o_n=object_name,
+                client_n=str(row["client"]),
+                contract_n=str(row["contract"]),
+                d_n=device_name,
+                z_n=str(inventory_number or "777"),
+                d_v_u=str(valid_until or "01.01.01"),
+                layout=test_type,
+            )
+            if output and output in jobs_by_output:
+                job = jobs_by_output[output]
+                report = job["report"]
+                differ = [HEADER_FIELDS[key] for key, value in header.items() if report[key] != value]
+                if differ:
+                    raise ValueError(f"{', '.join(differ)} отличается от первой строки отчёта {output}")
+                if "plots" not in report:
+                    report["plots"] = [dict(plot_location=report["p_l"], work_date=report["w_d"],
+                                            plot_name=report["p_name"], square=report["s"], values=report["v"])]
+                report["plots"].append(plot)
+                continue
+
+            result_file_name = str(output or f"Отчёт_{row_number}.xlsx")
+            page_name = str(row.get("page_name") or "Участок")
+
+            jobs.append({
+                "row_number": row_number,
+                "report": dict(
+                    r_f=result_file_name,
+                    p_n=page_name,
+                    **header,
+                    p_l=plot["plot_location"],
+                    w_d=plot["work_date"],
+                    p_name=plot["plot_name"],
+                    s=plot["square"],
+                    v=plot["values"],
+                    chart_backend=row.get("chart_backend") or None,
+                    output_dir=output_dir,
+                ),
+                "page_name": page_name,
+                "org_header": org_header,
+                "formula_image": formula_image,
+                "template_path": template_path,
+                "user_info": row.get("user_info"),
+            })
+            if output:
+                jobs_by_output[output] = jobs[-1]
+        except Exception as e:
+            if output:
+                errors_by_output.setdefault(output, []).append((row_number, str(e)))
+            else:
+                failures.append((row_number, str(e)))
+
+    # Отчёт по нескольким участкам создаётся только целиком
+    for output, errors in errors_by_output.items():
+        job = jobs_by_output.pop(output, None)
+        if job is not None:
+            jobs.remove(job)
+        group_rows = rows_by_output[output]
+        if len(group_rows) == 1:
+            failures.extend(errors)
+        else:
+            details = "; ".join(f"строка {row_number}: {message}" for row_number, message in errors)
+            failures.append((group_rows[0], f"отчёт {output} (строки {', '.join(map(str, group_rows))}) "
+                                            f"не создан: {details}"))
+
+    return jobs, failures
+
+
+def _init_worker(template_paths, chart_backend=None, chart_cache_db=None):
+    """Инициализация рабочего процесса: прогрев шаблонов и графиков"""
+    from betta_gidroisolation import set_chart_executor, set_default_chart_backend, warm_up
+    if chart_backend:
+        set_default_chart_backend(chart_backend)
+    # Отчёты и так создаются параллельно в процессах пула, график строится в том же процессе
+    set_chart_executor("off")
+    if chart_cache_db:
+        # Общая база графиков: процессы не строят заново график одной и той же серии
+        from chart_cache import configure_chart_cache
+        configure_chart_cache(disk_path=chart_cache_db)
+    warm_up(template_paths)
+
+
+def render_job(job):
+    """Создаёт один отчёт по заданию, возвращает (номер строки, путь, время, время по этапам)"""
+    from betta_gidroisolation import Gidroisolation_report
+
+    start = time.perf_counter()
+    report = Gidroisolation_report(**job["report"])
+    file_path = report.create_gidroisolation_report(
+        job["page_name"], job["org_header"], job["formula_image"], job["template_path"],
+        user_info=job["user_info"], use_cache=job.get("use_cache"), metrics_log=job.get("metrics_log")
+    )
+    return job["row_number"], file_path, time.perf_counter() - start, report.metrics.stage_totals()
+
+
+def run_batch(manifest_path, db_path=DEFAULT_DB_PATH, workers=None, output_dir=None, defaults=None,
+              chart_backend=None, use_cache=None, chart_cache_db=None, metrics_log=None):
+    """Создаёт отчёты по манифесту в пуле процессов и возвращает BatchSummary.
+    use_cache=False — не брать отчёты из кэша готовых отчётов;
+    chart_cache_db — файл SQLite с графиками, общий для рабочих процессов;
+    metrics_log — журнал замеров этапов (JSON Lines), общий для рабочих процессов"""
+    start = time.perf_counter()
+    rows = read_manifest(manifest_path)
+    summary = BatchSummary(len(rows))
+
+    jobs, failures = prepare_jobs(rows, Database(db_path), output_dir, defaults)
+    summary.failures.extend(failures)
+    # Строки одного отчёта по нескольким участкам считаются одним отчётом
+    summary.total = len(jobs) + len(failures)
+    for job in jobs:
+        job["use_cache"] = use_cache
+        job["metrics_log"] = metrics_log
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    if jobs:
+        template_paths = sorted({job["template_path"] for job in jobs if job["template_path"]})
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(template_paths, chart_backend, chart_cache_db)) as executor:
+            futures = {executor.submit(render_job, job): job["row_number"] for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    row_number, file_path, elapsed, stage_totals = future.result()
+                    summary.created.append((row_number, file_path, elapsed))
+                    summary.add_stage_totals(stage_totals)
+                except Exception as e:
+                    traceback.print_exc()
+                    summary.failures.append((futures[future], str(e)))
+
+    summary.elapsed = time.perf_counter() - start
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетное создание отчётов по манифесту")
+    parser.add_argument("manifest", help="манифест отчётов: .csv, .json или .xlsx")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="путь к базе данных (по умолчанию PSFOSL_DB или laboratory.db рядом с программой)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="число рабочих процессов (по умолчанию — число ядер)")
+    parser.add_argument("--output-dir", help="папка для отчётов (по умолчанию PSFOSL_OUTPUT_DIR или рабочий стол)")
+    parser.add_argument("--user-info", help="составитель отчёта для строк без user_info")
+    parser.add_argument("--chart-backend", choices=("matplotlib", "native"),
+                        help="график по умолчанию: растровый (matplotlib) или диаграмма Excel (native)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="не брать отчёты из кэша готовых отчётов, а создать заново")
+    parser.add_argument("--chart-cache-db",
+                        help="файл SQLite для кэша графиков, общий для рабочих процессов")
+    parser.add_argument("--metrics-log",
+                        help="журнал замеров этапов каждого отчёта (JSON Lines, по умолчанию PSFOSL_METRICS_LOG)")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        parser.error(f"база данных не найдена: {args.db}")
+
+    defaults = {"user_info": args.user_info} if args.user_info else None
+    summary = run_batch(args.manifest, args.db, args.workers, args.output_dir, defaults,
+                        args.chart_backend, use_cache=False if args.no_cache else None,
+                        chart_cache_db=args.chart_cache_db, metrics_log=args.metrics_log)
+    print(summary.format())
+    return 0 if not summary.failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
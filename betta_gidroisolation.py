@@ -1,18 +1,138 @@
 
 import openpyxl
 import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from openpyxl.drawing.image import Image  
-from openpyxl.styles import Font, PatternFill, Border, Alignment
 from datetime import datetime
-import openpyxl.styles
-import openpyxl.utils
-from openpyxl.worksheet.pagebreak import Break
-import matplotlib
-matplotlib.use('Agg') 
-import matplotlib.pyplot as plt
-import numpy as np
-import tempfile
-
+from openpyxl.chart import AreaChart, LineChart, Reference
+from openpyxl.chart.legend import LegendEntry
+from io import BytesIO
+from template_cache import COMPILER_VERSION, get_compiled_template
+from adhesion_stats import combine_adhesion_stats, compute_adhesion_stats
+from report_layout import get_layout
+from image_assets import ASSET_VERSION, get_image_bytes
+from report_cache import REPORT_CACHE_ENABLED, file_content_hash, make_cache_key, report_cache
+from report_metrics import NULL_RECORDER, MetricsRecorder, write_metrics_log
+
+
+# Способы построения графика адгезии:
+#   "matplotlib" — растровое PNG-изображение (требует matplotlib);
+#   "native"     — диаграмма Excel: без растеризации, меньше размер файла, редактируется в Excel
+CHART_BACKENDS = ("matplotlib", "native")
+
+# Способ по умолчанию для всех отчётов (можно задать переменной окружения PSFOSL_CHART_BACKEND)
+DEFAULT_CHART_BACKEND = os.environ.get("PSFOSL_CHART_BACKEND", "matplotlib")
+
+# Лист со скрытыми данными для диаграммы Excel
+CHART_DATA_SHEET = "Данные графика"
+
+# Больше точек — ряд адгезии рисуется без маркеров
+MAX_MARKED_POINTS = 60
+
+# Версия движка отчётов для ключа кэша готовых отчётов (report_cache).
+# Увеличивается при любом изменении, от которого меняется содержимое отчёта
+REPORT_ENGINE_VERSION = 1
+
+# Папка для отчётов по умолчанию (можно задать переменной окружения PSFOSL_OUTPUT_DIR)
+OUTPUT_DIR_ENV = "PSFOSL_OUTPUT_DIR"
+
+
+def default_output_dir():
+    """Папка для отчётов по умолчанию: PSFOSL_OUTPUT_DIR, рабочий стол,
+    а если рабочего стола нет — домашняя папка"""
+    output_dir = os.environ.get(OUTPUT_DIR_ENV)
+    if output_dir:
+        return output_dir
+    home = os.path.expanduser("~")
+    desktop_path = os.path.join(home, "Desktop")
+    return desktop_path if os.path.isdir(desktop_path) else home
+
+
+def set_default_chart_backend(backend):
+    """Задаёт способ построения графика по умолчанию для всех отчётов"""
+    global DEFAULT_CHART_BACKEND
+    if backend not in CHART_BACKENDS:
+        raise ValueError(f"Неизвестный способ построения графика: {backend}")
+    DEFAULT_CHART_BACKEND = backend
+
+
+# Где строится растровый график, пока собирается книга отчёта:
+#   "thread"  — в фоновом потоке;
+#   "process" — в отдельном процессе: растеризация не делит GIL со сборкой книги;
+#   "off"     — последовательно, во время вставки графика.
+# По умолчанию — поток, если ядер больше одного (переменная окружения PSFOSL_CHART_EXECUTOR)
+CHART_EXECUTORS = ("thread", "process", "off")
+CHART_EXECUTOR = os.environ.get("PSFOSL_CHART_EXECUTOR", "thread" if (os.cpu_count() or 1) > 1 else "off")
+
+_chart_executor = None
+_chart_executor_lock = threading.Lock()
+
+
+def _render_chart_png(series, dpi):
+    """Строит растровый график; выполняется в потоке или процессе.
+    Возвращает (PNG, время, процессорное время) — для замеров этапов"""
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    from chart_engine import render_adhesion_chart
+    data = render_adhesion_chart(*series, dpi=dpi).getvalue()
+    return data, time.perf_counter() - wall_start, time.thread_time() - cpu_start
+
+
+def _init_chart_process():
+    """Инициализация процесса построения графиков: matplotlib загружается заранее"""
+    from chart_engine import chart_engine
+    chart_engine.warm_up()
+
+
+def get_chart_executor():
+    """Возвращает общий исполнитель для построения графиков или None (CHART_EXECUTOR="off")"""
+    global _chart_executor
+    if CHART_EXECUTOR == "off":
+        return None
+    with _chart_executor_lock:
+        if _chart_executor is None:
+            workers = min(4, os.cpu_count() or 1)
+            if CHART_EXECUTOR == "process":
+                _chart_executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_chart_process)
+            else:
+                _chart_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chart")
+        return _chart_executor
+
+
+def set_chart_executor(kind):
+    """Задаёт, где строятся графики: "thread", "process" или "off" (см. CHART_EXECUTOR)"""
+    global CHART_EXECUTOR, _chart_executor
+    if kind not in CHART_EXECUTORS:
+        raise ValueError(f"Неизвестный способ построения графика в фоне: {kind}")
+    with _chart_executor_lock:
+        if _chart_executor is not None and kind != CHART_EXECUTOR:
+            _chart_executor.shutdown(wait=False)
+            _chart_executor = None
+        CHART_EXECUTOR = kind
+
+
+class ControlledPlot:
+    """Контролируемый участок: свой блок в таблице 1 и свой график в отчёте"""
+
+    def __init__(self, plot_location = "Распололжение контролируемого участка", work_date = "01.01.01",
+                 plot_name = "Название слоя", square = 25, values = None):
+        self.plot_location = plot_location
+        self.work_date = work_date
+        self.plot_name = plot_name
+        self.square = square
+        self.values = [] if values is None else values
+        self._stats = None
+
+    def get_stats(self, normative_value = 0.1):
+        """Статистика адгезии участка; пересчитывается только при изменении данных"""
+        key = (tuple(self.values), self.square, normative_value)
+        stats = self._stats
+        if stats is None or stats[0] != key:
+            stats = (key, compute_adhesion_stats(self.values, self.square, normative_value))
+            self._stats = stats
+        return stats[1]
 
 
 class Gidroisolation_report():
@@ -35,14 +155,15 @@ class Gidroisolation_report():
         self.normative_value = 0.1
         self.current_date = datetime.today().strftime("%d.%m.%y") # Получаем текущую дату
         self.sootv_status = "Соответствет"
-        self.velichina_adgezi = []
         self.last_cell = ""
 
     def __init__(self, r_f = "Отчёт_по_гидроизоляции.xlsx", p_n = "Участок",
                  o_n = "Объект", client_n = "Заказчик", contract_n = "Договор",
                  d_n = "Прибор",  z_n = "777", d_v_u = "01.01.01",
                  p_l = "Распололжение контролируемого участка", w_d = "01.01.01", 
-                 p_name = "Название слоя", s = 25, v = [1,2,3,4]):
+                 p_name = "Название слоя", s = 25, v = [1,2,3,4],
+                 chart_dpi = 150, chart_width = 760, chart_height = 456, chart_backend = None,
+                 layout = None, plots = None, output_dir = None):
         self.result_file_name = r_f
         self.page_name = p_n
         self.object_name = o_n
@@ -59,561 +180,679 @@ class Gidroisolation_report():
         self.normative_value = 0.1 
         self.current_date = datetime.today().strftime("%d.%m.%y") # Получаем текущую дату
         self.sootv_status = "соответствет"
-        self.velichina_adgezi = []
+        # Несколько контролируемых участков в одном отчёте: ControlledPlot или словари
+        # с его параметрами. Если не заданы, отчёт строится по одному участку из p_l, w_d, p_name, s, v
+        self.plots = [plot if isinstance(plot, ControlledPlot) else ControlledPlot(**plot)
+                      for plot in plots] if plots else None
+        self._own_plot = ControlledPlot()
         self.last_cell = ""
         self.table_end_row = 0  # Последняя строка таблицы с результатами
-        # Скрипт по сохранению файла
-        # result_ws.protection.sheet = False  # Отключаем защиту листа
-        # result_wb.security.lockStructure = False  # Отключаем защиту книги
-        # desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")  
-        # file_path = os.path.join(desktop_path, result_file_name)
-        # result_wb.save(file_path)
+        self.result_wb = None  # Книга отчёта, которая собирается в памяти
+        self.output_dir = output_dir  # Папка для отчёта; None — default_output_dir()
+        self._output = None  # Открытый двоичный поток, в который сохраняется отчёт
+        self.in_memory = False  # Режим конвейера: все этапы работают с одной книгой, сохранение одно
+        self._chart_jobs = {}  # {номер участка: Future с PNG графика}, см. start_chart_rendering
+        self.metrics = None  # Замеры этапов последнего create_gidroisolation_report (ReportMetrics)
+        # Ошибки этапов, после которых отчёт всё же собран (без графика или изображения):
+        # [(этап, сообщение), ...]; такой отчёт не сохраняется в кэш готовых отчётов
+        self.stage_errors = []
+        self._recorder = NULL_RECORDER
+        # Параметры графика: разрешение растра и размер на листе в пикселях.
+        # 150 dpi дают примерно двукратный запас к размеру на листе, этого хватает для печати
+        self.chart_dpi = chart_dpi
+        self.chart_width = chart_width
+        self.chart_height = chart_height
+        if chart_backend is not None and chart_backend not in CHART_BACKENDS:
+            raise ValueError(f"Неизвестный способ построения графика: {chart_backend}")
+        self.chart_backend = chart_backend  # None — использовать DEFAULT_CHART_BACKEND
+        # Макет отчёта: CompiledLayout или тип испытания (по умолчанию — гидроизоляция)
+        if layout is None or isinstance(layout, str):
+            layout = get_layout(layout) if layout else get_layout()
+        self.layout = layout
 
     def set_filename(self, f):
         self.set_filename = f
 
+    def get_result_path(self):
+        """Возвращает путь к файлу отчёта: имя файла в папке output_dir
+        (полный путь в имени файла используется как есть)"""
+        return os.path.join(self.output_dir or default_output_dir(), self.result_file_name)
+
+    def _prepare_result_path(self):
+        """Путь к файлу отчёта; папка создаётся, если её нет"""
+        result_path = self.get_result_path()
+        result_dir = os.path.dirname(result_path)
+        if result_dir:
+            os.makedirs(result_dir, exist_ok=True)
+        return result_path
+
+    def save_workbook_to(self, result_wb, output = None):
+        """Сохраняет книгу в поток output или в файл get_result_path().
+        Возвращает output или путь к файлу"""
+        if output is not None:
+            result_wb.save(output)
+            return output
+        result_path = self._prepare_result_path()
+        result_wb.save(result_path)
+        return result_path
+
+    def write_report_bytes(self, data, output = None):
+        """Записывает готовый отчёт (bytes) в поток output или в файл get_result_path().
+        Возвращает output или путь к файлу"""
+        if output is not None:
+            output.write(data)
+            return output
+        result_path = self._prepare_result_path()
+        with open(result_path, "wb") as f:
+            f.write(data)
+        return result_path
+
+    def get_cache_key(self, name = "Отчёт", organisation_header_image_path = None, formula_image_path = None,
+                      template_path = None, user_info = None):
+        """Ключ кэша готовых отчётов: SHA-256 от всех входных данных отчёта.
+
+        Учитываются поля отчёта и участков, дата отчёта, параметры графика,
+        содержимое шаблона, макета и изображений и версии движка. Имя
+        и папка файла отчёта на содержимое не влияют и в ключ не входят.
+        """
+        if not (template_path and os.path.exists(template_path)):
+            template_path = self.layout.template_path
+        images = {}
+        for image_name, image_path in (("organisation_header", organisation_header_image_path),
+                                       ("formula", formula_image_path)):
+            if image_name in self.layout.images and image_path and os.path.exists(image_path):
+                images[image_name] = file_content_hash(image_path)
+        return make_cache_key(dict(
+            engine=(REPORT_ENGINE_VERSION, COMPILER_VERSION, ASSET_VERSION, openpyxl.__version__),
+            page_name=name,
+            object_name=self.object_name,
+            client_name=self.client_name,
+            contract_name=self.contract_name,
+            device_name=self.device_name,
+            zav_number=self.zav_number,
+            device_valide_until=self.device_valide_until,
+            current_date=self.current_date,
+            normative_value=self.normative_value,
+            plots=[(plot.plot_location, plot.work_date, plot.plot_name, plot.square, list(plot.values))
+                   for plot in self.get_plots()],
+            user_info=user_info,
+            chart=(self.get_chart_backend(), self.chart_dpi, self.chart_width, self.chart_height),
+            layout=(self.layout.test_type, file_content_hash(self.layout.source_path)),
+            template=file_content_hash(template_path),
+            images=images,
+        ))
+
+    def load_result_workbook(self):
+        """Возвращает книгу отчёта: из памяти в режиме конвейера, иначе загружает с диска"""
+        if self.result_wb is None:
+            with self._recorder.stage("load"):
+                self.result_wb = openpyxl.load_workbook(self.get_result_path())
+        return self.result_wb
+
+    def save_result_workbook(self, force = False):
+        """Сохраняет книгу отчёта на диск.
+
+        В режиме конвейера (in_memory) промежуточные этапы не сохраняют файл,
+        книга записывается один раз в конце через force=True.
+        """
+        if self.in_memory and not force:
+            return
+        result_wb = self.result_wb
+        result_ws = result_wb.active
+        result_ws.protection.sheet = False  # Отключаем защиту листа
+        result_wb.security.lockStructure = False  # Отключаем защиту книги
+        try:
+            with self._recorder.stage("save"):
+                self.save_workbook_to(result_wb, self._output)
+        finally:
+            self.result_wb = None
+
+    def get_plots(self):
+        """Контролируемые участки отчёта.
+
+        Без списка plots отчёт состоит из одного участка, который описывают
+        атрибуты самого отчёта (plot_location, work_date, plot_name, square, values).
+        """
+        if self.plots:
+            return self.plots
+        plot = self._own_plot
+        plot.plot_location = self.plot_location
+        plot.work_date = self.work_date
+        plot.plot_name = self.plot_name
+        plot.square = self.square
+        plot.values = self.values
+        return [plot]
+
+    def get_stats(self):
+        """Возвращает статистику адгезии (AdhesionStats) по всем участкам отчёта.
+
+        Статистика участков кэшируется и пересчитывается только при изменении
+        значений, площади или норматива.
+        """
+        return combine_adhesion_stats(plot.get_stats(self.normative_value) for plot in self.get_plots())
+
+    @property
+    def velichina_adgezi(self):
+        """Величины адгезии по участкам, МПа"""
+        return [float(x) for x in self.get_stats().adhesion]
+
     # =(значение_силы*1000)/(площадь*100)
     def count_adgezi(self, val:float):
-        x = (val*1000)/(self.square*100)
-        self.velichina_adgezi.append(x)
-        return x
+        return (val*1000)/(self.square*100)
     
     # =СРЗНАЧ(M67:N70)
     def count_average_adgezi(self):
-        y = []
-        for i in self.values: y.append(self.count_adgezi(i))
-        x = round((sum(y)/len(self.values)), 2)
-        x = str(x).replace(".", ",")
-        return x
+        return self.get_stats().average_text
     
     def get_average_adgezi_value(self):
         """Возвращает среднее значение адгезии как число (не строку)"""
-        # Вычисляем величины адгезии если они ещё не вычислены
-        if len(self.velichina_adgezi) == 0:
-            for val in self.values:
-                self.count_adgezi(val)
-        
-        if len(self.velichina_adgezi) == 0:
-            return 0.0
-        
-        return sum(self.velichina_adgezi) / len(self.velichina_adgezi)
+        return self.get_stats().mean
     
-    def create_adhesion_chart(self):
-        """Создаёт график 'Величина адгезии vs. № участка' и возвращает путь к файлу изображения"""
-        # Убеждаемся, что величины адгезии вычислены
-        # (они должны быть вычислены в set_tables)
-        # Используем уже вычисленные значения, чтобы не дублировать
-        if len(self.velichina_adgezi) == 0:
-            # Если по какой-то причине значения не вычислены, вычисляем их
-            for val in self.values:
-                self.count_adgezi(val)
-        
-        if len(self.velichina_adgezi) == 0:
-            raise ValueError("Нет данных для построения графика")
-        
-        adhesion_values = self.velichina_adgezi.copy()
-        
-        # Номера участков (X)
-        plot_numbers = list(range(1, len(adhesion_values) + 1))
-        
-        # Среднее значение
-        average_value = self.get_average_adgezi_value()
-        
-        # Нормативное значение
+    def get_chart_series(self, plot = None, number_offset = 0):
+        """Возвращает данные графика: (номера участков, величины адгезии, среднее,
+        нормативное значение, -15% от среднего, +15% от среднего).
+        plot — контролируемый участок, по умолчанию все участки отчёта;
+        number_offset — сдвиг номеров, чтобы они совпадали со сквозной нумерацией таблицы"""
+        if plot is None:
+            if not any(item.values for item in self.get_plots()):
+                raise ValueError("Нет данных для построения графика")
+            stats = self.get_stats()
+        else:
+            if not plot.values:
+                raise ValueError("Нет данных для построения графика")
+            stats = plot.get_stats(self.normative_value)
         normative_value = float(self.normative_value) if self.normative_value else 0.1
-        
-        # ±15% диапазон
-        minus_15_percent = average_value * 0.85
-        plus_15_percent = average_value * 1.15
-        
-        # Создание графика
-        plt.figure(figsize=(10, 6))
-        
-        # Основной график - величина адгезии
-        plt.plot(plot_numbers, adhesion_values, 'o-', linewidth=2.5, markersize=10, 
-                label='Величина адгезии', color='#0066CC', markerfacecolor='#0066CC', 
-                markeredgecolor='white', markeredgewidth=1.5)
-        
-        # Нормативное значение (горизонтальная линия)
-        plt.axhline(y=normative_value, color='red', linestyle='--', linewidth=2.5, 
-                   label=f'Нормативное значение ({normative_value} МПа)', alpha=0.8)
-        
-        # Среднее значение (горизонтальная линия)
-        plt.axhline(y=average_value, color='green', linestyle='--', linewidth=2.5, 
-                   label=f'Среднее значение ({average_value:.2f} МПа)', alpha=0.8)
-        
-        # ±15% диапазон (заштрихованная область)
-        plt.axhspan(minus_15_percent, plus_15_percent, alpha=0.25, color='orange', 
-                   label=f'±15% диапазон ({minus_15_percent:.2f} - {plus_15_percent:.2f} МПа)')
-        
-        # Линии границ ±15%
-        plt.axhline(y=minus_15_percent, color='orange', linestyle=':', linewidth=2, alpha=0.8)
-        plt.axhline(y=plus_15_percent, color='orange', linestyle=':', linewidth=2, alpha=0.8)
-        
-        # Настройка осей
-        plt.xlabel('№ участка', fontsize=13, fontweight='bold')
-        plt.ylabel('Величина адгезии, МПа', fontsize=13, fontweight='bold')
-        plt.title('Величина адгезии vs. № участка', fontsize=15, fontweight='bold', pad=15)
-        plt.grid(True, alpha=0.4, linestyle='--', linewidth=0.8)
-        plt.legend(loc='upper right', fontsize=10, framealpha=0.9, shadow=True)
-        
-        # Установка меток на оси X как целые числа
-        plt.xticks(plot_numbers, fontsize=11)
-        plt.yticks(fontsize=11)
-        
-        # Улучшение внешнего вида
-        plt.tight_layout(pad=2.0)
-        
-        # Устанавливаем стиль для более профессионального вида
-        plt.style.use('default')
-        # Добавляем рамку вокруг графика
-        ax = plt.gca()
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.spines['left'].set_linewidth(1.2)
-        ax.spines['bottom'].set_linewidth(1.2)
-        
-        # Сохранение графика во временный файл
-        temp_dir = tempfile.gettempdir()
-        chart_path = os.path.join(temp_dir, f'adhesion_chart_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png')
-        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        return chart_path
+        plot_numbers = [number + number_offset for number in stats.plot_numbers] if number_offset else stats.plot_numbers
+        return (plot_numbers, [float(x) for x in stats.adhesion], stats.mean, normative_value,
+                stats.lower_bound, stats.upper_bound)
+
+    def get_chart_backend(self):
+        """Возвращает способ построения графика для этого отчёта"""
+        return self.chart_backend or DEFAULT_CHART_BACKEND
+
+    def create_adhesion_chart(self, series = None):
+        """Создаёт график 'Величина адгезии vs. № участка' и возвращает PNG в буфере BytesIO.
+        series — данные графика, по умолчанию get_chart_series().
+        Готовые графики берутся из кэша (chart_cache) по рядам данных и оформлению"""
+        from chart_cache import chart_cache, chart_cache_key
+
+        series = series or self.get_chart_series()
+        cache_key = None
+        if chart_cache.enabled:
+            cache_key = chart_cache_key(series, self.chart_dpi)
+            data = chart_cache.get(cache_key)
+            if data is not None:
+                return BytesIO(data)
+
+        # matplotlib нужен только для растрового графика
+        from chart_engine import render_adhesion_chart
+
+        (plot_numbers, adhesion_values, average_value, normative_value,
+         minus_15_percent, plus_15_percent) = series
+
+        # Построитель потокобезопасен: у каждого потока своя заранее оформленная фигура
+        chart_buffer = render_adhesion_chart(plot_numbers, adhesion_values, average_value, normative_value,
+                                             minus_15_percent, plus_15_percent, dpi=self.chart_dpi)
+        if cache_key is not None:
+            chart_cache.put(cache_key, chart_buffer.getvalue())
+        return chart_buffer
+
+    def submit_adhesion_chart(self, series, executor):
+        """Запускает построение растрового графика в executor и возвращает Future
+        с (PNG, время, процессорное время). График из кэша возвращается сразу,
+        уже выполненным Future с нулевым временем"""
+        from chart_cache import chart_cache, chart_cache_key
+
+        cache_key = chart_cache_key(series, self.chart_dpi) if chart_cache.enabled else None
+        data = chart_cache.get(cache_key) if cache_key else None
+        if data is not None:
+            future = Future()
+            future.set_result((data, 0.0, 0.0))
+            return future
+
+        future = executor.submit(_render_chart_png, series, self.chart_dpi)
+        if cache_key:
+            def remember(done):
+                if not done.cancelled() and done.exception() is None:
+                    chart_cache.put(cache_key, done.result()[0])
+            future.add_done_callback(remember)
+        return future
+
+    def start_chart_rendering(self):
+        """Запускает построение растровых графиков всех участков в фоне (CHART_EXECUTOR),
+        чтобы они строились одновременно со сборкой книги. Результаты забирает
+        insert_chart_into_report; для диаграмм Excel ничего не делает"""
+        self._chart_jobs = {}
+        # Проверка входных данных: без значений силы отчёт не строится
+        self.get_stats()
+        if self.get_chart_backend() != "matplotlib":
+            return
+        executor = get_chart_executor()
+        if executor is None:
+            return
+        number_offset = 0
+        for index, plot in enumerate(self.get_plots()):
+            series = self.get_chart_series(plot, number_offset)
+            number_offset += len(series[0])
+            self._chart_jobs[index] = self.submit_adhesion_chart(series, executor)
+
+    def cancel_chart_rendering(self):
+        """Отменяет графики, которые ещё не начали строиться"""
+        for future in self._chart_jobs.values():
+            future.cancel()
+        self._chart_jobs = {}
+
+    def create_native_adhesion_chart(self, result_wb, series = None, first_row = 1):
+        """Создаёт диаграмму Excel 'Величина адгезии vs. № участка' с теми же рядами,
+        что и растровый график. Данные записываются на скрытый лист CHART_DATA_SHEET.
+        Книга может быть и потоковой (write_only): лист данных заполняется через append.
+
+        Графики нескольких участков делят один лист данных: блок следующего
+        графика начинается с first_row, сразу под данными предыдущего."""
+        (plot_numbers, adhesion_values, average_value, normative_value,
+         minus_15_percent, plus_15_percent) = series or self.get_chart_series()
+
+        if first_row == 1:
+            if CHART_DATA_SHEET in result_wb.sheetnames:
+                result_wb.remove(result_wb[CHART_DATA_SHEET])
+            data_ws = result_wb.create_sheet(CHART_DATA_SHEET)
+            data_ws.sheet_state = "hidden"
+        else:
+            data_ws = result_wb[CHART_DATA_SHEET]
+
+        # Столбцы: A — № участка, B — адгезия, C — норматив, D — среднее,
+        # E — -15%, F — ширина диапазона ±15% (для закрашенной области), G — +15%
+        data_ws.append(["№ участка", "Величина адгезии",
+                        f"Нормативное значение ({normative_value} МПа)",
+                        f"Среднее значение ({average_value:.2f} МПа)",
+                        "-15%",
+                        f"±15% диапазон ({minus_15_percent:.2f} - {plus_15_percent:.2f} МПа)",
+                        "+15%"])
+        for number, value in zip(plot_numbers, adhesion_values):
+            data_ws.append([number, value, normative_value, average_value,
+                            minus_15_percent, plus_15_percent - minus_15_percent, plus_15_percent])
+        last_row = first_row + len(plot_numbers)
+        categories = Reference(data_ws, min_col=1, min_row=first_row + 1, max_row=last_row)
+
+        # Диапазон ±15%: нижняя граница — прозрачная подложка, сверху закрашенная ширина диапазона
+        band_chart = AreaChart()
+        band_chart.grouping = "stacked"
+        band_chart.add_data(Reference(data_ws, min_col=5, max_col=6, min_row=first_row, max_row=last_row), titles_from_data=True)
+        band_chart.set_categories(categories)
+        lower_series, band_series = band_chart.series
+        lower_series.graphicalProperties.noFill = True
+        lower_series.graphicalProperties.line.noFill = True
+        band_series.graphicalProperties.solidFill = "FFE3B3"
+        band_series.graphicalProperties.line.noFill = True
+
+        line_chart = LineChart()
+        line_chart.add_data(Reference(data_ws, min_col=2, max_col=4, min_row=first_row, max_row=last_row), titles_from_data=True)
+        line_chart.add_data(Reference(data_ws, min_col=5, min_row=first_row, max_row=last_row), titles_from_data=True)
+        line_chart.add_data(Reference(data_ws, min_col=7, min_row=first_row, max_row=last_row), titles_from_data=True)
+        line_chart.set_categories(categories)
+        adhesion_series, normative_series, average_series, lower_line, upper_line = line_chart.series
+
+        adhesion_series.graphicalProperties.line.solidFill = "0066CC"
+        adhesion_series.graphicalProperties.line.width = 31750  # 2,5 пт
+        adhesion_series.marker.symbol = "circle" if len(plot_numbers) <= MAX_MARKED_POINTS else "none"
+        adhesion_series.marker.size = 8
+        adhesion_series.marker.graphicalProperties.solidFill = "0066CC"
+        adhesion_series.marker.graphicalProperties.line.solidFill = "FFFFFF"
+        adhesion_series.smooth = False
+
+        for series, color, dash in ((normative_series, "FF0000", "dash"), (average_series, "008000", "dash"),
+                                    (lower_line, "FFA500", "sysDot"), (upper_line, "FFA500", "sysDot")):
+            series.graphicalProperties.line.solidFill = color
+            series.graphicalProperties.line.dashStyle = dash
+            series.graphicalProperties.line.width = 25400  # 2 пт
+            series.marker.symbol = "none"
+            series.smooth = False
+
+        band_chart += line_chart
+        band_chart.title = "Величина адгезии vs. № участка"
+        band_chart.x_axis.title = "№ участка"
+        band_chart.y_axis.title = "Величина адгезии, МПа"
+        band_chart.x_axis.delete = False
+        band_chart.y_axis.delete = False
+        band_chart.legend.position = "r"
+        # В легенде не показываем подложку диапазона и линии его границ
+        band_chart.legend.legendEntry = [LegendEntry(idx=0, delete=True),
+                                         LegendEntry(idx=5, delete=True),
+                                         LegendEntry(idx=6, delete=True)]
+
+        # Размер в сантиметрах, как у растрового графика в пикселях (96 точек на дюйм)
+        band_chart.width = self.chart_width / 96 * 2.54
+        band_chart.height = self.chart_height / 96 * 2.54
+        return band_chart
 
     def create_empty_report(self, page_name = "Отчёт", organisation_header_image_path = None, formula_image_path = None, template_path = None):
-        # Ищем файл шаблона
+        # Ищем файл шаблона: переданный или шаблон из макета отчёта
         if template_path and os.path.exists(template_path):
             top_page_name = template_path
         else:
-            # Ищем файл шаблона в текущей директории
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            top_page_name = os.path.join(script_dir, "gidroisolation_top.xlsx")
+            top_page_name = self.layout.template_path
         
         # Загружаем исходный файл
-        if not os.path.exists(top_page_name):
-            # Если шаблона нет, создаём пустой файл
-            result_wb = openpyxl.Workbook()
-            result_ws = result_wb.active
-            result_ws.title = page_name
-        else:
-            source_wb = openpyxl.load_workbook(top_page_name)
-            source_ws = source_wb.active  # Получаем лист с изображением
-
-            # Создаём новый файл
-            result_wb = openpyxl.Workbook()
-            result_ws = result_wb.active
-            result_ws.title = page_name
-
-            # Копируем данные (текст, числа и формулы)
-            # Копируем данные и стили (включая курсив)
-            result_ws.protection.sheet = False
-
-            for row in source_ws.iter_rows():
-                for cell in row:
-                    # Получаем ячейку в новом файле, создавая её автоматически
-                    new_cell = result_ws.cell(row=cell.row, column=cell.column)  
-                    new_cell.value = cell.value  # Копируем значение
-
-                    # Копируем шрифт (включая курсив)
-                    if cell.font:
-                        new_cell.font = Font(
-                            name=cell.font.name,
-                            size=cell.font.size,
-                            bold=cell.font.bold,
-                            italic=cell.font.italic,
-                            underline=cell.font.underline,
-                            strike=cell.font.strike,
-                            color=cell.font.color
-                        )
-
-                    # Копируем заполнение (если есть)
-                    if cell.fill:
-                        new_cell.fill = PatternFill(
-                            start_color=cell.fill.start_color,
-                            end_color=cell.fill.end_color,
-                            fill_type=cell.fill.fill_type
-                        )
-
-                    # Копируем границы (если есть)
-                    if cell.border:
-                        new_cell.border = Border(
-                            left=cell.border.left,
-                            right=cell.border.right,
-                            top=cell.border.top,
-                            bottom=cell.border.bottom,
-                            diagonal=cell.border.diagonal,
-                            diagonal_direction=cell.border.diagonal_direction,
-                            outline=cell.border.outline,
-                            vertical=cell.border.vertical,
-                            horizontal=cell.border.horizontal
-                        )
-
-                    # Копируем выравнивание (если есть)
-                    if cell.alignment:
-                        new_cell.alignment = Alignment(
-                            horizontal=cell.alignment.horizontal,
-                            vertical=cell.alignment.vertical,
-                            text_rotation=cell.alignment.text_rotation,
-                            wrap_text=cell.alignment.wrap_text,
-                            shrink_to_fit=cell.alignment.shrink_to_fit,
-                            indent=cell.alignment.indent
-                        )
-
-            # Копируем ширину вскех столбцов
-            for col_letter, col_dimension in source_ws.column_dimensions.items():
-                result_ws.column_dimensions[col_letter].width = col_dimension.width
-
-            #Копируем обхединения ячеек
-            for merged_range in source_ws.merged_cells.ranges:
-                result_ws.merge_cells(str(merged_range))
+        with self._recorder.stage("template"):
+            if not top_page_name or not os.path.exists(top_page_name):
+                # Если шаблона нет, создаём пустой файл
+                result_wb = openpyxl.Workbook()
+                result_ws = result_wb.active
+                result_ws.title = page_name
+            else:
+                # Шаблон компилируется один раз и берётся из кэша, здесь только клонирование
+                result_wb = get_compiled_template(top_page_name).clone(page_name)
+                result_ws = result_wb.active
         
         # Вставляем изображения, если пути переданы
-        if organisation_header_image_path and os.path.exists(organisation_header_image_path):
+        with self._recorder.stage("images"):
+            self.insert_images(result_ws, organisation_header_image_path, formula_image_path)
+
+        self.result_wb = result_wb
+        self.save_result_workbook()
+
+    def insert_images(self, result_ws, organisation_header_image_path = None, formula_image_path = None):
+        """Вставляет шапку организации и формулу; место и размер — из макета.
+        Вставляются подготовленные для печати варианты из кэша (см. image_assets)"""
+        images = (
+            ("organisation_header", organisation_header_image_path, "шапки организации"),
+            ("formula", formula_image_path, "формулы"),
+        )
+        for image_name, image_path, image_title in images:
+            if image_name not in self.layout.images or not image_path or not os.path.exists(image_path):
+                continue
             try:
-                organisation_header_image = Image(organisation_header_image_path)  
-                organisation_header_image.width = 800
-                organisation_header_image.height = 175
-                result_ws.add_image(organisation_header_image, "C1")
+                anchor, width, height = self.layout.images[image_name]
+                image = Image(BytesIO(get_image_bytes(image_path, width, height)))
+                image.width = width
+                image.height = height
+                result_ws.add_image(image, anchor)
             except Exception as e:
-                print(f"Ошибка при вставке шапки организации: {e}")
-
-        if formula_image_path and os.path.exists(formula_image_path):
-            try:
-                gidroisolation_formula_image = Image(formula_image_path)
-                gidroisolation_formula_image.width = 145
-                gidroisolation_formula_image.height = 70
-                result_ws.add_image(gidroisolation_formula_image, "K50")
-            except Exception as e:
-                print(f"Ошибка при вставке формулы: {e}")
-
-
-        
-        result_ws.protection.sheet = False  # Отключаем защиту листа
-        result_wb.security.lockStructure = False  # Отключаем защиту книги
-        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")  
-        file_path = os.path.join(desktop_path, self.result_file_name)
-        result_wb.save(file_path)
+                print(f"Ошибка при вставке {image_title}: {e}")
+                self.stage_errors.append(("images", f"{image_title}: {e}"))
 
     def create_conclusion(self):
-        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-        current_filename = os.path.join(desktop_path, self.result_file_name)
-        result_wb = openpyxl.load_workbook(current_filename)  # Загружаем существующий файл
+        result_wb = self.load_result_workbook()
         result_ws = result_wb.active
+        stats = self.get_stats()
 
-        # Вычисляем позицию выводов после графика
-        # График начинается на строке self.table_end_row + 2 (заголовок на строке table_end_row + 1, график на table_end_row + 2)
-        # График занимает примерно 23 строки (высота графика 456 пикселей / ~20 пикселей на строку)
-        # Добавляем отступ после графика
-        if hasattr(self, 'table_end_row') and self.table_end_row > 0:
-            chart_start_row = self.table_end_row + 2  # Заголовок на table_end_row + 1, график на table_end_row + 2
-            chart_end_row = chart_start_row + 23  # График занимает ~23 строки
-            row = chart_end_row + 2  # Отступ после графика
-        else:
-            # Если по какой-то причине table_end_row не установлен, используем старую логику
-            row = 67 + len(self.values) + 3
-        
-        cell = "C"+str(row)
-        result_ws[cell] = "4.ВЫВОДЫ."
-        result_ws[cell].font = Font(bold=True, size=14)
-        result_ws.row_breaks.append(Break(id=row))
-
-
-        row += 1
-        cell = "C"+str(row)
-        start_cell = "C"+str(row)
-        end_cell = "R"+str(row+1)
-        r = start_cell + ":" + end_cell
-        result_ws.merge_cells(r) 
-        result_ws.row_dimensions[row].height = 50
-        result_ws[cell] = '="4.1. В рамках выполнения работ по договору "&U29&" с "&U27&" на объекте по адресу: "&U25&" проведены работы по испытанию сцепления гидроизоляционных материалов."'
-        result_ws[cell].alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
-        result_ws[cell].font = Font(size = 14)
-
-        row += 2
-        cell = "C"+str(row)
-        start_cell = "C"+str(row)
-        end_cell = "R"+str(row+1)
-        r = start_cell + ":" + end_cell
-        result_ws.merge_cells(r) 
-        result_ws.row_dimensions[row].height = 50
-        controlir_uchast = "контролируемом участке"#если их потом будет несколько, то нужно будет поменять на "контролируемых участках"
-        result_ws[cell] = f'4.2. По результатам проведённых работ, приведенных в таблице 1 установлено: что фактическое значение велечины адгезии испытанного материала на {controlir_uchast} составляет от {min(self.velichina_adgezi)} до {max(self.velichina_adgezi)} МПа, что {self.sootv_status} требованиям СП 71.13330.2017 и номративной документации."'
-        result_ws[cell].alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
-        result_ws[cell].font = Font(size = 14)
-
-        row += 3
-        cell = "D" + str(row)
-        result_ws.merge_cells(f'D{row}:H{row}')
-        result_ws[cell] = f'=D37'
-        result_ws[cell].font = Font(size=14)
-        self.last_cell = f'R{row}'
+        # Выводы начинаются после графиков участков; их положение задаёт макет
+        with self._recorder.stage("conclusion"):
+            table_end_row = self.table_end_row or self.layout.table_end_row(stats.count)
+            self.last_cell = self.layout.write_conclusion(result_ws, self, stats, table_end_row,
+                                                          len(self.get_plots()))
 
-
-        result_ws.protection.sheet = False  # Отключаем защиту листа
-        result_wb.security.lockStructure = False  # Отключаем защиту книги
-        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")  
-        file_path = os.path.join(desktop_path, self.result_file_name)
-        result_wb.save(file_path)
+        self.save_result_workbook()
 
     
     def set_tables(self):
-        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-        current_filename = os.path.join(desktop_path, self.result_file_name)
-    ################################ Заполняем постоянные данные
-        result_wb = openpyxl.load_workbook(current_filename)  # Загружаем существующий файл
+        """Заполняет шапку и таблицу результатов по макету отчёта.
+        Участки идут в таблице блоками друг под другом, нумерация испытаний сквозная"""
+        result_wb = self.load_result_workbook()
         result_ws = result_wb.active
-        ####Заполняем шапку обхекта
-
-        result_ws["U25"] = self.object_name
-        result_ws["U27"] = self.client_name
-        result_ws["U29"] = self.contract_name
-        
-        ####Заполняем шапку прибора
-        result_ws["U35"] = self.device_name
-        result_ws["V35"] = self.zav_number
-        result_ws["W35"] = self.device_valide_until
-        result_ws["M22"] = self.current_date
-
-        # Инициализация столбцов и начальной строки
-        pillars = 'CDEFGHIJKLMNOPQRSTUVW'
-        start_row = 67
-
-        # Заполнение столбца "номер участка испытаний"
-        for i in range(len(self.values)):
-            result_ws.row_dimensions[start_row + i].height = 30  # Увеличиваем высоту строк
-            explore_place_number_cell = pillars[0] + str(start_row + i)
-            result_ws[explore_place_number_cell] = i + 1
-            result_ws[explore_place_number_cell].alignment = Alignment(horizontal="center", vertical="center")
-
-        # Заполнение столбца "Расположение контролируемого участка"
-        cell_start = pillars[1] + str(start_row)
-        cell_end = pillars[2] + str(start_row + len(self.values) - 1)
-        cells_range = cell_start + ":" + cell_end
-        result_ws.merge_cells(cells_range)  # Объединяем ячейки
-        result_ws[cell_start] = self.plot_location  # Записываем значение только в первую ячейку объединённой области
-        result_ws[cell_start].alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        result_ws[cell_start].font = Font(size=12)
-
-        # Заполнение столбца "Дата проведения работ"
-        cell_start = pillars[3] + str(start_row)
-        cell_end = pillars[3] + str(start_row + len(self.values) - 1)
-        cells_range = cell_start + ":" + cell_end
-        result_ws.merge_cells(cells_range)  # Объединение ячеек
-        result_ws[cell_start] = self.work_date  # Записываем значение только в первую ячейку
-        result_ws[cell_start].alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        result_ws[cell_start].font = Font(size=12)
-
-        # Заполнение столбца "Испытываемый слой гидроизоляции"
-        cell_start = pillars[4] + str(start_row)
-        cell_end = pillars[5] + str(start_row + len(self.values) - 1)
-        cells_range = cell_start + ":" + cell_end
-        result_ws.merge_cells(cells_range)  # Объединение ячеек
-        result_ws[cell_start] = self.plot_name  # Записываем значение только в первую ячейку
-        result_ws[cell_start].alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        result_ws[cell_start].font = Font(size=12)
-
-
-        # Заполнение столбца "Площадь отрыва, см2"
-        cell_start = pillars[6] + str(start_row)
-        cell_end = pillars[7] + str(start_row + len(self.values) - 1)
-        cells_range = cell_start + ":" + cell_end
-        result_ws.merge_cells(cells_range)  # Объединяем ячейки
-        result_ws[cell_start] = self.square  # Записываем значение только в первую ячейку объединённой области
-        result_ws[cell_start].alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        result_ws[cell_start].font = Font(size=12)
-
-        # Заполнение столбца "Значение силы, кН"
-        for i in range(len(self.values)):
-            cell_start = pillars[8] + str(start_row+i)
-            cell_end = pillars[9] + str(start_row + i)
-            cells_range = cell_start + ":" + cell_end
-            result_ws.merge_cells(cells_range)
-            cell = pillars[8] + str(start_row + i)
-            result_ws[cell] = self.values[i]
-            result_ws[cell].alignment = Alignment(horizontal="center", vertical="center")
-
-        # Заполнение столбца "Величина адгезии, МПа"
-        for i in range(len(self.values)):
-            cell_start = pillars[10] + str(start_row + i)
-            cell_end = pillars[11] + str(start_row + i)
-            cells_range = cell_start + ":" + cell_end
-            result_ws.merge_cells(cells_range)
-            cell_equal_strength_value = pillars[8] + str(start_row + i)
-            cell_square_value = "$" + pillars[6] + "$" + str(start_row)
-            # print("=(" +  cell_equal_strength_value + "*1000)/(" + cell_square_value + "*100)")
-            # =(K67*1000)/($I$67*100)
-            result_ws[cell_start] = self.count_adgezi(self.values[i])
-            result_ws[cell_start].alignment = Alignment(horizontal="center", vertical="center")
-
-        # Заполнение столбца "Среднее значение адгезии, МПа"
-        # cell_start_values = pillars[10] + str(start_row)
-        # cell_end_values = pillars[11] + str(start_row + len(self.values) - 1)
-        cell_start = pillars[12] + str(start_row)
-        cell_end = pillars[13] + str(start_row + len(self.values) - 1)
-        cells_range = cell_start + ":" + cell_end
-        result_ws.merge_cells(cells_range)
-
-        result_ws[cell_start]= str(self.count_average_adgezi())
-
-
-        result_ws[cell_start].alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        result_ws[cell_start].font = Font(size=12)
-
-        # Заполнение столбца "Нормативное значение, МПа"
-        cell_start = pillars[14] + str(start_row)
-        cell_end = pillars[14] + str(start_row + len(self.values) - 1)
-        cells_range = cell_start + ":" + cell_end
-        result_ws.merge_cells(cells_range)
-        result_ws[cell_start] = self.normative_value
-        result_ws[cell_start].alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        result_ws[cell_start].font = Font(size=12)
-        
-        # Заполнение столбца "Соответствие нормативной документации"
-        for i in range(len(self.values)):
-            cell = pillars[15] + str(start_row + i)
-            x = float(self.values[i])/(float(self.square)*100)
-            if (x < float(self.normative_value)): result_ws[cell] = "Соответствует"
-            else: 
-                result_ws[cell] ="Не соответствует"
-                self.sootv_status = "не соответствует"
-            # cell = pillars[15] + str(start_row + i)
-            # result_ws[cell] = '=_xludf.ЕСЛИ(M67 < 0,1: "Соответствует";"Не соответствует")'
-            result_ws[cell].alignment = Alignment(horizontal="center", vertical="center")
-
-        # Заполнение столбца "-15% от средней адгезии"
-        for i in range(len(self.values)):
-            cell = pillars[16] + str(start_row + i)
-            result_ws[cell] = '=$' + pillars[12] + "$" + str(start_row) + "-($" + pillars[12] + "$" + str(start_row) + "*15%)"
-            result_ws[cell].alignment = Alignment(horizontal="center", vertical="center")
-
-        # Заполнение столбца "+15% от средней адгезии"
-        for i in range(len(self.values)):
-            cell = pillars[17] + str(start_row + i)
-            result_ws[cell] = '=$' + pillars[12] + "$" + str(start_row) + "+($" + pillars[12] + "$" + str(start_row) + "*15%)"
-            result_ws[cell].alignment = Alignment(horizontal="center", vertical="center")
-        
-        result_ws.row_dimensions[65].height = 55
-        
-        # Сохраняем информацию о последней строке таблицы для вставки графика
-        self.table_end_row = start_row + len(self.values) - 1
-
-        result_ws.protection.sheet = False  # Отключаем защиту листа
-        result_wb.security.lockStructure = False  # Отключаем защиту книги
-        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")  
-        file_path = os.path.join(desktop_path, self.result_file_name)
-        result_wb.save(file_path)
+        with self._recorder.stage("table"):
+            stats = self.get_stats()
+            self.sootv_status = "соответствет" if stats.all_conform else "не соответствует"
+
+            self.layout.write_header(result_ws, self)
+            first_row = self.layout.start_row
+            number_offset = 0
+            for plot in self.get_plots():
+                plot_stats = plot.get_stats(self.normative_value)
+                last_row = self.layout.write_table(result_ws, plot, plot_stats, first_row, number_offset)
+                first_row = last_row + 1
+                number_offset += plot_stats.count
+            # Сохраняем информацию о последней строке таблицы для вставки графиков
+            self.table_end_row = first_row - 1
+
+        self.save_result_workbook()
     
     def insert_chart_into_report(self):
-        """Вставляет график адгезии в отчёт после таблицы с результатами"""
-        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-        current_filename = os.path.join(desktop_path, self.result_file_name)
-        result_wb = openpyxl.load_workbook(current_filename)
+        """Вставляет графики адгезии в отчёт после таблицы с результатами:
+        по одному на каждый контролируемый участок"""
+        result_wb = self.load_result_workbook()
         result_ws = result_wb.active
+        plots = self.get_plots()
+        data_row = 1  # Первая строка данных следующего графика на листе CHART_DATA_SHEET
+        number_offset = 0
         
-        # Создаём график
-        chart_path = None
         try:
-            chart_path = self.create_adhesion_chart()
-            
-            # Вычисляем позицию для вставки графика динамически
-            # Таблица заканчивается на строке self.table_end_row
-            # Вставляем график через 2 строки после таблицы
-            chart_start_row = self.table_end_row + 2
-            
-            # Определяем столбец для вставки (столбец C, как в таблице)
-            chart_column = 'C'
-            chart_cell = f'{chart_column}{chart_start_row}'
-            
-            # Вставляем график
-            if chart_path and os.path.exists(chart_path):
-                chart_image = Image(chart_path)
-                # Устанавливаем размер графика (в пикселях)
-                # Размер подбирается так, чтобы график хорошо смотрелся в Excel
-                chart_image.width = 760  # Немного меньше 800 для лучшего отображения
-                chart_image.height = 456  # Сохраняем соотношение 10:6
-                result_ws.add_image(chart_image, chart_cell)
+            for index, plot in enumerate(plots):
+                # Создаём график
+                series = self.get_chart_series(plot, number_offset)
+                number_offset += len(series[0])
+                if self.get_chart_backend() == "native":
+                    chart_buffer = None
+                    with self._recorder.stage("chart"):
+                        native_chart = self.create_native_adhesion_chart(result_wb, series, data_row)
+                    data_row += len(series[0]) + 1
+                elif index in self._chart_jobs:
+                    # График уже строится в фоне: ждём его здесь, до сохранения книги
+                    with self._recorder.stage("chart_wait"):
+                        data, render_wall_s, render_cpu_s = self._chart_jobs.pop(index).result()
+                    if render_wall_s and self.metrics is not None:
+                        self.metrics.add("chart", render_wall_s, render_cpu_s, background=True)
+                    chart_buffer = BytesIO(data)
+                    native_chart = None
+                else:
+                    with self._recorder.stage("chart"):
+                        chart_buffer = self.create_adhesion_chart(series)
+                    native_chart = None
                 
-                # Добавляем заголовок графика перед графиком
-                title_cell = f'{chart_column}{chart_start_row - 1}'
-                result_ws[title_cell] = "3. График зависимости величины адгезии от номера участка"
-                result_ws[title_cell].font = Font(bold=True, size=12)
+                # Позиция графика после таблицы задаётся макетом
+                chart_cell = self.layout.chart_anchor(self.table_end_row, index)
                 
-                # Увеличиваем высоту строки для заголовка
-                result_ws.row_dimensions[chart_start_row - 1].height = 25
-                
-                # Увеличиваем высоту строк для графика (примерно на высоту графика в единицах Excel)
-                # Высота графика ~456 пикселей, высота строки Excel ~20 пикселей по умолчанию
-                # Нужно примерно 23 строки для графика
-                for i in range(23):
-                    row_num = chart_start_row + i
-                    if row_num not in result_ws.row_dimensions or result_ws.row_dimensions[row_num].height is None:
-                        result_ws.row_dimensions[row_num].height = 20
+                # Вставляем график
+                if chart_buffer or native_chart:
+                    if native_chart is not None:
+                        result_ws.add_chart(native_chart, chart_cell)
+                    else:
+                        chart_image = Image(chart_buffer)
+                        # Устанавливаем размер графика (в пикселях)
+                        # По умолчанию 760x456: немного меньше 800 и с соотношением 10:6
+                        chart_image.width = self.chart_width
+                        chart_image.height = self.chart_height
+                        result_ws.add_image(chart_image, chart_cell)
+                    
+                    # Заголовок графика и высота строк под ним; при нескольких
+                    # участках в заголовке указывается расположение участка
+                    subtitle = plot.plot_location if len(plots) > 1 else None
+                    self.layout.write_chart_frame(result_ws, self.table_end_row, index, subtitle)
                 
         except Exception as e:
             print(f"Ошибка при создании и вставке графика: {e}")
             import traceback
             traceback.print_exc()
+            self.stage_errors.append(("chart", str(e)))
         finally:
-            # Сохраняем файл перед удалением временного файла графика
-            result_ws.protection.sheet = False
-            result_wb.security.lockStructure = False
-            desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-            file_path = os.path.join(desktop_path, self.result_file_name)
-            result_wb.save(file_path)
-            
-            # Удаляем временный файл графика после сохранения
-            if chart_path and os.path.exists(chart_path):
-                try:
-                    os.remove(chart_path)
-                except Exception as e:
-                    print(f"Не удалось удалить временный файл графика: {e}")
+            self.save_result_workbook()
 
     def create_print_area(self):
-        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-        current_filename = os.path.join(desktop_path, self.result_file_name)
-        result_wb = openpyxl.load_workbook(current_filename)  
+        result_wb = self.load_result_workbook()
         result_ws = result_wb.active
 
-        result_ws.print_area = f"C3:R41,C42:{self.last_cell}"
-        result_ws.page_setup.orientation = result_ws.ORIENTATION_LANDSCAPE
-
-        result_ws.page_margins.left = 0.2
-        result_ws.page_margins.right = 0.2
-        # result_ws.page_margins.top = 0.2
-        # result_ws.page_margins.bottom = 0.2
-        # result_ws.page_margins.header = 0.1
-        # result_ws.page_margins.footer = 0.1
-
-        # result_ws.col_breaks.append(Break(id=17))
-        
-
-        result_ws.protection.sheet = False  # Отключаем защиту листа
-        result_wb.security.lockStructure = False  # Отключаем защиту книги
-        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")  
-        file_path = os.path.join(desktop_path, self.result_file_name)
-        result_wb.save(file_path)
-
-
-
-
-
-    def create_gidroisolation_report(self, name = "Отчёт", organisation_header_image_path = None, formula_image_path = None, template_path = None):
-        self.create_empty_report(name, organisation_header_image_path, formula_image_path, template_path)
-        self.set_tables()
-        self.insert_chart_into_report()  # Вставляем график после таблицы
-        self.create_conclusion()
-        self.create_print_area()
-
-
-
-
-
-
-
-
-
-
-
+        # Область печати, ориентация и поля страницы — из макета
+        with self._recorder.stage("print_area"):
+            self.layout.apply_page_setup(result_ws, self.last_cell)
 
+        self.save_result_workbook()
 
+    def set_user_info(self, user_info):
+        """Записывает должность и ФИО составителя отчёта (для гидроизоляции — в ячейку D37)"""
+        result_wb = self.load_result_workbook()
+        result_ws = result_wb.active
+        with self._recorder.stage("user_info"):
+            result_ws[self.layout.user_info_cell] = user_info
+        self.save_result_workbook()
+
+
+
+    def create_gidroisolation_report(self, name = "Отчёт", organisation_header_image_path = None, formula_image_path = None, template_path = None,
+                                     user_info = None, single_pass = True, output = None, use_cache = None,
+                                     metrics_log = None):
+        """Собирает отчёт целиком.
+
+        При single_pass=True все этапы работают с одной книгой в памяти,
+        и файл сохраняется на диск ровно один раз. При single_pass=False
+        каждый этап, как и раньше, загружает и сохраняет файл сам.
+
+        output — открытый двоичный поток (файл, BytesIO, сокет), в который
+        записывается отчёт вместо файла в output_dir; только при single_pass=True.
+
+        use_cache — брать отчёт из кэша готовых отчётов, если такой же уже
+        создавался (по умолчанию REPORT_CACHE_ENABLED, только при single_pass=True).
+        Отчёт, при сборке которого не удалось вставить график или изображение
+        (self.stage_errors), в кэш не сохраняется.
+
+        Замеры этапов сохраняются в self.metrics (ReportMetrics) и, если задан
+        журнал metrics_log (по умолчанию PSFOSL_METRICS_LOG), дописываются в него.
+        Возвращает путь к сохранённому отчёту или output.
+        """
+        if output is not None and not single_pass:
+            raise ValueError("Запись отчёта в поток возможна только при single_pass=True")
+        if use_cache is None:
+            use_cache = REPORT_CACHE_ENABLED
+
+        recorder = MetricsRecorder().start()
+        self.metrics = recorder.metrics
+        self.metrics.report = self.result_file_name
+        self.metrics.info.update(
+            test_type=self.layout.test_type,
+            plots=len(self.get_plots()),
+            rows=sum(len(plot.values) for plot in self.get_plots()),
+            chart_backend=self.get_chart_backend(),
+            chart_executor=CHART_EXECUTOR if single_pass else "off",
+            single_pass=single_pass,
+        )
+        self._recorder = recorder
+        self.stage_errors = []
+        error = None
+        try:
+            if use_cache and single_pass:
+                with recorder.stage("cache_lookup"):
+                    cache_key = self.get_cache_key(name, organisation_header_image_path, formula_image_path,
+                                                   template_path, user_info)
+                    data = report_cache.get(cache_key)
+                self.metrics.info["cache_hit"] = data is not None
+                if data is None:
+                    buffer = BytesIO()
+                    self._assemble_report(name, organisation_header_image_path, formula_image_path,
+                                          template_path, user_info, True, buffer)
+                    data = buffer.getvalue()
+                    # Отчёт без графика или изображения в кэш не попадает:
+                    # следующий запуск с теми же данными соберёт его заново
+                    if not self.stage_errors:
+                        with recorder.stage("cache_store"):
+                            report_cache.put(cache_key, data)
+                with recorder.stage("write"):
+                    return self.write_report_bytes(data, output)
+
+            self._assemble_report(name, organisation_header_image_path, formula_image_path,
+                                  template_path, user_info, single_pass, output)
+            return output if output is not None else self.get_result_path()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.stage_errors:
+                self.metrics.info["stage_errors"] = [f"{stage}: {message}" for stage, message in self.stage_errors]
+            recorder.finish(error)
+            self._recorder = NULL_RECORDER
+            write_metrics_log(self.metrics, metrics_log)
+
+    def _assemble_report(self, name, organisation_header_image_path, formula_image_path, template_path,
+                         user_info, single_pass, output):
+        """Этапы сборки отчёта (см. create_gidroisolation_report)"""
+        self.in_memory = single_pass
+        self._output = output
+        try:
+            if single_pass:
+                # Графики строятся в фоне, пока собирается книга; выводы и область
+                # печати от графика не зависят, поэтому он вставляется последним
+                self.start_chart_rendering()
+                self.create_empty_report(name, organisation_header_image_path, formula_image_path, template_path)
+                self.set_tables()
+                self.create_conclusion()
+                self.create_print_area()
+                if user_info is not None:
+                    self.set_user_info(user_info)
+                self.insert_chart_into_report()  # Ждём графики и вставляем их после таблицы
+                self.save_result_workbook(force=True)
+            else:
+                self.create_empty_report(name, organisation_header_image_path, formula_image_path, template_path)
+                self.set_tables()
+                self.insert_chart_into_report()  # Вставляем график после таблицы
+                self.create_conclusion()
+                self.create_print_area()
+                if user_info is not None:
+                    self.set_user_info(user_info)
+        finally:
+            self.cancel_chart_rendering()
+            self.in_memory = False
+            self.result_wb = None
+            self._output = None
+
+    def create_report_bytes(self, name = "Отчёт", organisation_header_image_path = None, formula_image_path = None,
+                            template_path = None, user_info = None):
+        """Собирает отчёт в памяти и возвращает содержимое xlsx-файла (bytes), не обращаясь к диску"""
+        output = BytesIO()
+        self.create_gidroisolation_report(name, organisation_header_image_path, formula_image_path, template_path,
+                                          user_info, output=output)
+        return output.getvalue()
+
+    def create_streaming_report(self, measurements, name = "Отчёт", organisation_header_image_path = None,
+                                formula_image_path = None, template_path = None, user_info = None, output = None,
+                                metrics_log = None):
+        """Собирает отчёт в потоковом режиме для длинных серий измерений.
+
+        measurements — итерируемый источник значений силы (например, генератор),
+        он читается один раз, строки таблицы пишутся в файл сразу, и расход
+        памяти не зависит от числа измерений (см. report_stream).
+        Атрибут values при этом не используется. output и metrics_log — как в
+        create_gidroisolation_report. Возвращает путь к отчёту или output.
+        """
+        if self.plots and len(self.plots) > 1:
+            raise ValueError("Потоковый режим строит отчёт по одному контролируемому участку")
+        from report_stream import StreamingReportWriter
+
+        recorder = MetricsRecorder().start()
+        self.metrics = recorder.metrics
+        self.metrics.report = self.result_file_name
+        self.metrics.info.update(
+            test_type=self.layout.test_type,
+            plots=1,
+            chart_backend=self.get_chart_backend(),
+            streaming=True,
+        )
+        self._recorder = recorder
+        self.stage_errors = []
+        error = None
+        try:
+            writer = StreamingReportWriter(self)
+            return writer.write(measurements, name, organisation_header_image_path, formula_image_path,
+                                template_path, user_info, output)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.table_end_row:
+                self.metrics.info["rows"] = self.table_end_row - self.layout.start_row + 1
+            if self.stage_errors:
+                self.metrics.info["stage_errors"] = [f"{stage}: {message}" for stage, message in self.stage_errors]
+            recorder.finish(error)
+            self._recorder = NULL_RECORDER
+            write_metrics_log(self.metrics, metrics_log)
+
+
+def warm_up(template_paths = ()):
+    """Прогревает движок отчётов: компилирует шаблоны и один раз строит график.
+
+    Используется в рабочих процессах пакетной генерации, чтобы первый
+    отчёт не платил за компиляцию шаблона и инициализацию matplotlib.
+    """
+    for template_path in template_paths:
+        if template_path and os.path.exists(template_path):
+            get_compiled_template(template_path)
+    if DEFAULT_CHART_BACKEND == "matplotlib":
+        from chart_engine import chart_engine
+        chart_engine.warm_up()
@@ -0,0 +1,335 @@
+"""Массовая загрузка объектов, приборов и пользователей из CSV или XLSX.
+
+Строки читаются из файла по одной (XLSX — в режиме read_only), проверяются
+и записываются пачками: каждая пачка — одна транзакция и один executemany.
+Приборы обновляются по инвентарному номеру, пользователи — по логину,
+объекты — по ID, если он указан (иначе добавляются). Если пачка не
+записалась целиком (например, нарушено ограничение базы), её строки
+записываются по одной, чтобы ошибка попала только в свою строку.
+
+Столбцы (первая строка файла) можно называть по-английски или по-русски:
+  objects — id, name / название, address / адрес, description / описание;
+  devices — name / название, model / модель, inventory_number / инвентарный
+            номер, valid_until / действителен до, description / описание;
+  users   — full_name / ФИО, login / логин, password / пароль, role / роль,
+            position / должность.
+
+Запуск из командной строки:
+    python bulk_import.py devices реестр.xlsx [--db путь к базе] [--batch-size 500]
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+
+from database import DEFAULT_DB_PATH, Database
+from report import validate_date
+
+
+IMPORT_KINDS = ("objects", "devices", "users")
+
+# Строк в одной транзакции
+DEFAULT_BATCH_SIZE = 500
+
+COLUMN_ALIASES = {
+    "objects": {
+        "id": ("id", "№", "номер объекта"),
+        "name": ("name", "название", "название объекта", "объект"),
+        "address": ("address", "адрес"),
+        "description": ("description", "описание"),
+    },
+    "devices": {
+        "name": ("name", "название", "название прибора", "прибор"),
+        "model": ("model", "модель"),
+        "inventory_number": ("inventory_number", "инвентарный номер", "заводской номер", "заводской/инвентарный номер"),
+        "valid_until": ("valid_until", "действителен до", "поверка до", "срок поверки"),
+        "description": ("description", "описание"),
+    },
+    "users": {
+        "full_name": ("full_name", "фио", "ф.и.о."),
+        "login": ("login", "логин"),
+        "password": ("password", "пароль"),
+        "role": ("role", "роль"),
+        "position": ("position", "должность"),
+    },
+}
+
+USER_ROLES = {
+    "user": "user", "пользователь": "user",
+    "admin": "admin", "администратор": "admin",
+}
+
+DEVELOPER_LOGIN = "SHIFTER"
+
+
+class ImportSummary:
+    """Итоги массовой загрузки"""
+
+    def __init__(self, kind, estimated_rows=None):
+        self.kind = kind
+        self.estimated_rows = estimated_rows  # Примерное число строк файла (для индикатора)
+        self.processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []  # [(номер строки в файле, сообщение об ошибке), ...]
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def format(self):
+        lines = [
+            f"Обработано строк: {self.processed} за {self.elapsed:.2f} с ({self.rows_per_second:.0f} строк/с)",
+            f"Добавлено: {self.inserted}, обновлено: {self.updated}",
+        ]
+        if self.errors:
+            lines.append(f"Ошибок: {len(self.errors)}")
+            for row_number, message in sorted(self.errors):
+                lines.append(f"  строка {row_number}: {message}")
+        return "\n".join(lines)
+
+
+# ========== Чтение файла ==========
+
+def iter_file_rows(path, sheet=None):
+    """Читает таблицу построчно: (номер строки в файле, {столбец: значение}).
+    Пустые строки пропускаются, номер строки заголовка — 1"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            ws = wb[sheet] if sheet else wb.active
+            rows = ws.iter_rows(values_only=True)
+            header = [str(name).strip() if name is not None else "" for name in next(rows, ())]
+            for row_number, row in enumerate(rows, start=2):
+                if any(value not in (None, "") for value in row):
+                    yield row_number, {name: value for name, value in zip(header, row) if name}
+        finally:
+            wb.close()
+        return
+
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        for row in reader:
+            if any(value not in (None, "") for value in row.values()):
+                # line_num — номер последней прочитанной строки файла
+                yield reader.line_num, {name.strip(): value for name, value in row.items() if name}
+
+
+def estimate_row_count(path, sheet=None):
+    """Примерное число строк данных в файле (без чтения XLSX целиком)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True)
+        try:
+            ws = wb[sheet] if sheet else wb.active
+            return max((ws.max_row or 1) - 1, 0)
+        finally:
+            wb.close()
+    with open(path, "rb") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def map_columns(kind, row):
+    """Переводит названия столбцов файла в поля базы"""
+    aliases = COLUMN_ALIASES[kind]
+    lookup = {alias: field for field, names in aliases.items() for alias in names}
+    mapped = {}
+    for name, value in row.items():
+        field = lookup.get(name.strip().lower())
+        if field is not None:
+            mapped[field] = value
+    return mapped
+
+
+def _text(value):
+    """Значение ячейки в виде строки: целые числа из XLSX — без '.0'"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _date_text(value):
+    """Дата ДД.ММ.ГГ: ячейки-даты XLSX переводятся в формат программы"""
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%d.%m.%y")
+    return _text(value)
+
+
+# ========== Проверка строк ==========
+
+def validate_object(row):
+    """(id, name, address, description) или ValueError"""
+    name = _text(row.get("name"))
+    if not name:
+        raise ValueError("не указано название объекта")
+    object_id = _text(row.get("id"))
+    if object_id:
+        try:
+            object_id = int(object_id)
+        except ValueError:
+            raise ValueError(f"ID объекта должен быть числом: {object_id}")
+    return object_id or None, name, _text(row.get("address")), _text(row.get("description"))
+
+
+def validate_device(row):
+    """(name, model, inventory_number, valid_until, description) или ValueError"""
+    name = _text(row.get("name"))
+    inventory_number = _text(row.get("inventory_number"))
+    if not name:
+        raise ValueError("не указано название прибора")
+    if not inventory_number:
+        raise ValueError("не указан инвентарный номер")
+    valid_until = _date_text(row.get("valid_until"))
+    if valid_until:
+        is_valid, error_msg = validate_date(valid_until)
+        if not is_valid:
+            raise ValueError(f"ошибка в дате 'Действителен до': {error_msg}")
+    return name, _text(row.get("model")), inventory_number, valid_until, _text(row.get("description"))
+
+
+def validate_user(row):
+    """(full_name, login, password, role, position) или ValueError"""
+    full_name = _text(row.get("full_name"))
+    login = _text(row.get("login"))
+    if not full_name or not login:
+        raise ValueError("не указаны ФИО или логин")
+    if login == DEVELOPER_LOGIN:
+        raise ValueError("пользователя-разработчика нельзя загружать из файла")
+    role_text = _text(row.get("role")).lower() or "user"
+    role = USER_ROLES.get(role_text)
+    if role is None:
+        raise ValueError(f"неизвестная роль: {role_text} (допустимы user, admin)")
+    return full_name, login, _text(row.get("password")), role, _text(row.get("position"))
+
+
+VALIDATORS = {"objects": validate_object, "devices": validate_device, "users": validate_user}
+
+
+# ========== Загрузка ==========
+
+def _upsert(db, kind, values):
+    if kind == "objects":
+        return db.upsert_objects(values)
+    if kind == "devices":
+        return db.upsert_devices(values)
+    return db.upsert_users(values)
+
+
+def _check_new_users(db, batch, summary):
+    """Новому пользователю нужен пароль: строки без пароля с новым логином — ошибки"""
+    existing = db.get_existing_logins(values[1] for _, values in batch)
+    checked = []
+    for row_number, values in batch:
+        full_name, login, password, role, position = values
+        if not password and login not in existing:
+            summary.errors.append((row_number, f"не указан пароль нового пользователя {login}"))
+            continue
+        existing.add(login)
+        checked.append((row_number, values))
+    return checked
+
+
+def _write_batch(db, kind, batch, summary):
+    """Записывает пачку одной транзакцией; при ошибке базы — по одной строке"""
+    if kind == "users":
+        batch = _check_new_users(db, batch, summary)
+    if not batch:
+        return
+    try:
+        inserted, updated = _upsert(db, kind, [values for _, values in batch])
+    except sqlite3.Error:
+        inserted = updated = 0
+        for row_number, values in batch:
+            try:
+                row_inserted, row_updated = _upsert(db, kind, [values])
+            except sqlite3.Error as e:
+                summary.errors.append((row_number, f"ошибка базы данных: {e}"))
+                continue
+            inserted += row_inserted
+            updated += row_updated
+    summary.inserted += inserted
+    summary.updated += updated
+
+
+def import_rows(db, kind, rows, batch_size=DEFAULT_BATCH_SIZE, progress=None, summary=None):
+    """Загружает строки (номер строки, {столбец: значение}) в базу.
+
+    progress(summary) вызывается после каждой пачки; если он возвращает
+    False, загрузка останавливается (уже записанные пачки остаются).
+    Возвращает ImportSummary.
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f"Неизвестный вид данных: {kind} (допустимы {', '.join(IMPORT_KINDS)})")
+    validate = VALIDATORS[kind]
+    summary = summary or ImportSummary(kind)
+    start = time.perf_counter()
+    batch = []
+    for row_number, row in rows:
+        summary.processed += 1
+        try:
+            batch.append((row_number, validate(map_columns(kind, row))))
+        except ValueError as e:
+            summary.errors.append((row_number, str(e)))
+        if len(batch) >= batch_size:
+            _write_batch(db, kind, batch, summary)
+            batch = []
+            summary.elapsed = time.perf_counter() - start
+            if progress is not None and progress(summary) is False:
+                return summary
+    _write_batch(db, kind, batch, summary)
+    summary.elapsed = time.perf_counter() - start
+    if progress is not None:
+        progress(summary)
+    return summary
+
+
+def import_file(db, kind, path, batch_size=DEFAULT_BATCH_SIZE, progress=None, sheet=None):
+    """Загружает объекты, приборы или пользователей из CSV/XLSX, возвращает ImportSummary"""
+    summary = ImportSummary(kind, estimate_row_count(path, sheet))
+    return import_rows(db, kind, iter_file_rows(path, sheet), batch_size, progress, summary)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Массовая загрузка объектов, приборов и пользователей")
+    parser.add_argument("kind", choices=IMPORT_KINDS, help="что загружать")
+    parser.add_argument("file", help="файл CSV или XLSX, первая строка — названия столбцов")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="путь к базе данных (по умолчанию PSFOSL_DB или laboratory.db рядом с программой)")
+    parser.add_argument("--sheet", help="лист XLSX (по умолчанию — активный)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="строк в одной транзакции")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        parser.error(f"база данных не найдена: {args.db}")
+
+    def progress(summary):
+        total = f" из ~{summary.estimated_rows}" if summary.estimated_rows else ""
+        print(f"Обработано {summary.processed}{total} строк, ошибок: {len(summary.errors)}", file=sys.stderr)
+
+    db = Database(args.db)
+    try:
+        summary = import_file(db, args.kind, args.file, args.batch_size, progress, args.sheet)
+    except (OSError, KeyError) as e:
+        print(f"Не удалось прочитать файл: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    print(summary.format())
+    return 0 if not summary.errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Кэш растровых графиков адгезии.
+
+Растеризация графика — самый затратный по процессору этап отчёта, а сам
+график зависит только от рядов данных (номера, величины адгезии, среднее,
+норматив, границы ±15%), разрешения и оформления. Готовые PNG хранятся
+под хэшем этих данных: в памяти процесса (LRU) и, если задан путь,
+в базе SQLite на диске, общей для всех процессов пакетной генерации.
+
+Оформление учитывается через хэш файла chart_engine.py и версию
+matplotlib, поэтому после изменения стиля графики строятся заново.
+Модуль не импортирует matplotlib: при попадании в кэш он не загружается.
+
+Настройки по умолчанию задаются переменными окружения:
+PSFOSL_CHART_CACHE (0 — выключить), PSFOSL_CHART_CACHE_ENTRIES (число
+графиков в памяти), PSFOSL_CHART_CACHE_DB (файл SQLite) и
+PSFOSL_CHART_CACHE_DB_MB (наибольший размер базы).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from report_cache import file_content_hash
+
+
+CHART_ENGINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chart_engine.py")
+
+# Число графиков в памяти и наибольший размер базы на диске по умолчанию
+DEFAULT_MEMORY_ENTRIES = 64
+DEFAULT_DISK_MB = 128
+
+_style_version = None
+
+
+def chart_style_version():
+    """Версия оформления графика: хэш chart_engine.py и версия matplotlib"""
+    global _style_version
+    if _style_version is None:
+        from importlib.metadata import PackageNotFoundError, version
+        try:
+            matplotlib_version = version("matplotlib")
+        except PackageNotFoundError:
+            matplotlib_version = None
+        _style_version = (file_content_hash(CHART_ENGINE_PATH), matplotlib_version)
+    return _style_version
+
+
+def chart_cache_key(series, dpi):
+    """Ключ графика по рядам данных (как у get_chart_series) и разрешению"""
+    plot_numbers, adhesion_values, average_value, normative_value, minus_15, plus_15 = series
+    data = json.dumps([chart_style_version(), dpi, list(plot_numbers), list(adhesion_values),
+                       average_value, normative_value, minus_15, plus_15], default=float)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ChartCache:
+    """Кэш PNG графиков: LRU в памяти и необязательная база SQLite на диске.
+
+    max_entries — наибольшее число графиков в памяти (0 — не хранить в памяти),
+    disk_path — файл базы (None — только память), max_disk_bytes — размер
+    базы, сверх которого удаляются давно не использованные графики.
+    enabled=False — кэш выключен, графики всегда строятся заново.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MEMORY_ENTRIES, disk_path=None,
+                 max_disk_bytes=DEFAULT_DISK_MB * 1024 * 1024, enabled=True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # {ключ: PNG}, от давно использованных к недавним
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        """Открывает базу графиков (один раз, под блокировкой)"""
+        if self._connection is None:
+            directory = os.path.dirname(self.disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.disk_path, timeout=10, check_same_thread=False)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS charts (
+                    key TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_charts_last_used ON charts(last_used)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _remember(self, key, data):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = data
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Возвращает PNG (bytes) или None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            if self.disk_path:
+                try:
+                    connection = self._connect()
+                    row = connection.execute("SELECT data FROM charts WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        connection.execute("UPDATE charts SET last_used = ? WHERE key = ?", (time.time(), key))
+                        connection.commit()
+                        data = bytes(row[0])
+                        self._remember(key, data)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return data
+                except sqlite3.Error as e:
+                    print(f"Не удалось прочитать график из кэша: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        """Сохраняет PNG в память и, если задана база, на диск"""
+        with self._lock:
+            self._remember(key, data)
+            if not self.disk_path:
+                return
+            try:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO charts (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, sqlite3.Binary(data), len(data), time.time())
+                )
+                self._evict_disk(connection)
+                connection.commit()
+            except sqlite3.Error as e:
+                print(f"Не удалось сохранить график в кэш: {e}")
+
+    def _evict_disk(self, connection):
+        """Удаляет из базы давно не использованные графики сверх max_disk_bytes"""
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM charts").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        removed = []
+        for key, size in connection.execute("SELECT key, size FROM charts ORDER BY last_used"):
+            if total <= self.max_disk_bytes:
+                break
+            removed.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM charts WHERE key = ?", removed)
+
+    def clear(self):
+        """Очищает кэш в памяти и на диске"""
+        with self._lock:
+            self._entries.clear()
+            if self.disk_path:
+                try:
+                    connection = self._connect()
+                    connection.execute("DELETE FROM charts")
+                    connection.commit()
+                except sqlite3.Error as e:
+                    print(f"Не удалось очистить кэш графиков: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self):
+        """Счётчики кэша: попадания (в том числе с диска), промахи, графиков в памяти"""
+        with self._lock:
+            return dict(hits=self.hits, disk_hits=self.disk_hits, misses=self.misses,
+                        memory_entries=len(self._entries), max_entries=self.max_entries,
+                        disk_path=self.disk_path)
+
+
+# Общий кэш графиков приложения
+chart_cache = ChartCache(
+    enabled=os.environ.get("PSFOSL_CHART_CACHE", "1") != "0",
+    max_entries=int(os.environ.get("PSFOSL_CHART_CACHE_ENTRIES", DEFAULT_MEMORY_ENTRIES)),
+    disk_path=os.environ.get("PSFOSL_CHART_CACHE_DB") or None,
+    max_disk_bytes=int(float(os.environ.get("PSFOSL_CHART_CACHE_DB_MB", DEFAULT_DISK_MB)) * 1024 * 1024),
+)
+
+
+def configure_chart_cache(max_entries=None, disk_path=None, max_disk_bytes=None, enabled=None):
+    """Меняет настройки общего кэша графиков (например, при запуске пакетной генерации)"""
+    with chart_cache._lock:
+        if max_entries is not None:
+            chart_cache.max_entries = max_entries
+            while len(chart_cache._entries) > max(max_entries, 0):
+                chart_cache._entries.popitem(last=False)
+        if disk_path is not None:
+            if chart_cache._connection is not None:
+                chart_cache._connection.close()
+                chart_cache._connection = None
+            chart_cache.disk_path = disk_path or None
+        if max_disk_bytes is not None:
+            chart_cache.max_disk_bytes = max_disk_bytes
+        if enabled is not None:
+            chart_cache.enabled = enabled
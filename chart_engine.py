@@ -0,0 +1,110 @@
+"""Построение растрового графика адгезии.
+
+Использует объектный API matplotlib (Figure + FigureCanvasAgg) без pyplot
+и без изменения глобальных настроек (rcParams, style). У каждого потока
+своя заранее оформленная фигура, которая переиспользуется между отчётами,
+поэтому графики можно строить параллельно из нескольких потоков.
+"""
+import threading
+from io import BytesIO
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.ticker import MaxNLocator
+
+
+# Оформление графика (размер в дюймах, цвета и шрифты)
+FIGURE_SIZE = (10, 6)
+VALUES_STYLE = dict(linestyle='-', marker='o', linewidth=2.5, markersize=10, color='#0066CC',
+                    markerfacecolor='#0066CC', markeredgecolor='white', markeredgewidth=1.5)
+# Для длинных серий (потоковые отчёты) — без маркеров и с автоматическими метками оси X
+DENSE_VALUES_STYLE = dict(linestyle='-', linewidth=1.2, color='#0066CC')
+MAX_MARKED_POINTS = 60
+NORMATIVE_STYLE = dict(color='red', linestyle='--', linewidth=2.5, alpha=0.8)
+AVERAGE_STYLE = dict(color='green', linestyle='--', linewidth=2.5, alpha=0.8)
+BAND_STYLE = dict(alpha=0.25, color='orange')
+BAND_EDGE_STYLE = dict(color='orange', linestyle=':', linewidth=2, alpha=0.8)
+AXIS_LABEL_STYLE = dict(fontsize=13, fontweight='bold')
+TITLE_STYLE = dict(fontsize=15, fontweight='bold', pad=15)
+LEGEND_STYLE = dict(loc='upper right', fontsize=10, framealpha=0.9, shadow=True)
+
+
+class AdhesionChartEngine:
+    """Потокобезопасный построитель графика 'Величина адгезии vs. № участка'"""
+
+    def __init__(self, figure_size=FIGURE_SIZE):
+        self.figure_size = figure_size
+        self._local = threading.local()
+
+    def _get_figure(self):
+        """Возвращает фигуру и оси текущего потока, создавая их при первом обращении"""
+        figure = getattr(self._local, "figure", None)
+        if figure is None:
+            figure = Figure(figsize=self.figure_size)
+            FigureCanvasAgg(figure)
+            figure.add_subplot()
+            self._local.figure = figure
+        return figure, figure.axes[0]
+
+    @staticmethod
+    def _style_axes(ax):
+        """Оформляет оси: подписи, сетку и рамку"""
+        ax.set_xlabel('№ участка', **AXIS_LABEL_STYLE)
+        ax.set_ylabel('Величина адгезии, МПа', **AXIS_LABEL_STYLE)
+        ax.set_title('Величина адгезии vs. № участка', **TITLE_STYLE)
+        ax.grid(True, alpha=0.4, linestyle='--', linewidth=0.8)
+        ax.tick_params(axis='both', labelsize=11)
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.spines['left'].set_linewidth(1.2)
+        ax.spines['bottom'].set_linewidth(1.2)
+
+    def render(self, plot_numbers, adhesion_values, average_value, normative_value,
+               minus_15_percent, plus_15_percent, dpi=150):
+        """Строит график и возвращает PNG в буфере BytesIO"""
+        figure, ax = self._get_figure()
+        ax.clear()
+
+        # Основной график - величина адгезии
+        dense = len(plot_numbers) > MAX_MARKED_POINTS
+        ax.plot(plot_numbers, adhesion_values, label='Величина адгезии',
+                **(DENSE_VALUES_STYLE if dense else VALUES_STYLE))
+
+        # Нормативное и среднее значения (горизонтальные линии)
+        ax.axhline(y=normative_value, label=f'Нормативное значение ({normative_value} МПа)', **NORMATIVE_STYLE)
+        ax.axhline(y=average_value, label=f'Среднее значение ({average_value:.2f} МПа)', **AVERAGE_STYLE)
+
+        # ±15% диапазон (заштрихованная область) и его границы
+        ax.axhspan(minus_15_percent, plus_15_percent,
+                   label=f'±15% диапазон ({minus_15_percent:.2f} - {plus_15_percent:.2f} МПа)', **BAND_STYLE)
+        ax.axhline(y=minus_15_percent, **BAND_EDGE_STYLE)
+        ax.axhline(y=plus_15_percent, **BAND_EDGE_STYLE)
+
+        # Метки на оси X как целые числа
+        if dense:
+            ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+        else:
+            ax.set_xticks(plot_numbers)
+        self._style_axes(ax)
+        ax.legend(**LEGEND_STYLE)
+        figure.tight_layout(pad=2.0)
+
+        chart_buffer = BytesIO()
+        figure.savefig(chart_buffer, format='png', dpi=dpi, bbox_inches='tight')
+        chart_buffer.seek(0)
+        return chart_buffer
+
+    def warm_up(self):
+        """Создаёт фигуру текущего потока и один раз строит график (кэш шрифтов и т. п.)"""
+        self.render([1, 2], [0.4, 0.6], 0.5, 0.1, 0.425, 0.575, dpi=30)
+
+
+# Общий построитель графиков приложения
+chart_engine = AdhesionChartEngine()
+
+
+def render_adhesion_chart(plot_numbers, adhesion_values, average_value, normative_value,
+                          minus_15_percent, plus_15_percent, dpi=150):
+    """Строит график общим построителем и возвращает PNG в буфере BytesIO"""
+    return chart_engine.render(plot_numbers, adhesion_values, average_value, normative_value,
+                               minus_15_percent, plus_15_percent, dpi=dpi)
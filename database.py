@@ -1,180 +1,217 @@
-import sqlite3
 import os
 import hashlib
 from pathlib import Path
 
+from db_connection import CACHED_STATEMENTS, ConnectionManager
+
+
+# База данных по умолчанию — рядом с программой, а не в текущей папке;
+# другой файл можно задать переменной окружения PSFOSL_DB
+DEFAULT_DB_PATH = os.environ.get("PSFOSL_DB") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "laboratory.db")
+
+
+# ========== Миграции схемы ==========
+#
+# Каждая миграция — функция (db, cursor), которая переводит схему из версии N-1
+# в версию N. Миграции выполняются один раз, в транзакции init_database;
+# новая миграция добавляется в конец MIGRATIONS, уже выпущенные не меняются.
+
+def _create_tables(db, cursor):
+    """Таблицы объектов, приборов, пользователей, изображений и шаблонов"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS objects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            address TEXT,
+            description TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            model TEXT,
+            inventory_number TEXT UNIQUE,
+            valid_until TEXT,
+            description TEXT
+        )
+    ''')
+
+    cursor.execute(USERS_TABLE_SQL)
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_type TEXT NOT NULL,
+            name TEXT NOT NULL,
+            file_path TEXT NOT NULL UNIQUE,
+            description TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_type TEXT NOT NULL UNIQUE,
+            template_path TEXT NOT NULL,
+            description TEXT
+        )
+    ''')
+
+
+def _add_users_role_check(db, cursor):
+    """Ограничение роли пользователя (CHECK) в базах, созданных до него.
+
+    Раньше таблица users пересоздавалась через users_backup при каждом
+    запуске; если такой запуск прервался, данные остались в users_backup
+    и восстанавливаются здесь.
+    """
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'users'")
+    if "CHECK" not in cursor.fetchone()[0]:
+        cursor.execute("ALTER TABLE users RENAME TO users_old")
+        cursor.execute(USERS_TABLE_SQL)
+        cursor.execute(f'''
+            INSERT INTO users (id, full_name, login, password_hash, role, position)
+            SELECT id, full_name, login, password_hash, {USER_ROLE_SQL}, position FROM users_old
+        ''')
+        cursor.execute("DROP TABLE users_old")
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'users_backup'")
+    if cursor.fetchone():
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO users (id, full_name, login, password_hash, role, position)
+            SELECT id, full_name, login, password_hash, {USER_ROLE_SQL}, position FROM users_backup
+        ''')
+        cursor.execute("DROP TABLE users_backup")
+
+
+def _create_default_users(db, cursor):
+    """Администратор и разработчик по умолчанию"""
+    db.create_default_admin()
+    db.create_developer()
+
+
+def _create_lookup_indexes(db, cursor):
+    """Индексы для частых запросов.
+
+    images(test_type, name) — поиск изображения по типу испытания и названию,
+    список изображений типа испытания по названию и список типов испытаний
+    без сортировки и полного чтения таблицы. Вход по логину и шаблон по типу
+    испытания уже используют индексы ограничений UNIQUE.
+    devices(valid_until) — поиск приборов по сроку действия.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_images_test_type_name ON images(test_type, name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_devices_valid_until ON devices(valid_until)")
+
+
+USERS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        full_name TEXT NOT NULL,
+        login TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('admin', 'user', 'developer')),
+        position TEXT
+    )
+'''
+
+# Неизвестные роли из старых баз становятся 'user'
+USER_ROLE_SQL = "CASE WHEN role IN ('admin', 'user', 'developer') THEN role ELSE 'user' END"
+
+MIGRATIONS = [
+    ("таблицы базы данных", _create_tables),
+    ("ограничение роли пользователя", _add_users_role_check),
+    ("пользователи по умолчанию", _create_default_users),
+    ("индексы для частых запросов", _create_lookup_indexes),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
 
 class Database:
-    def __init__(self, db_path="laboratory.db"):
+    def __init__(self, db_path=DEFAULT_DB_PATH, cached_statements=CACHED_STATEMENTS, wal=None,
+                 synchronous=None, busy_timeout=None):
+        """wal, synchronous, busy_timeout — режим работы нескольких процессов
+        с одной базой (см. db_connection; по умолчанию из переменных окружения)"""
         self.db_path = db_path
+        # Постоянные соединения: по одному на поток, с кэшем скомпилированных запросов
+        self.connections = ConnectionManager(db_path, cached_statements, wal=wal, synchronous=synchronous,
+                                             busy_timeout=busy_timeout)
         self.init_database()
     
     def get_connection(self):
-        """Создаёт и возвращает соединение с базой данных"""
-        return sqlite3.connect(self.db_path)
+        """Возвращает соединение текущего потока с базой данных.
+        Соединение общее для всех методов — закрывать его не нужно"""
+        return self.connections.get()
+    
+    def transaction(self):
+        """Транзакция записи, объединяющая несколько вызовов методов:
+        with db.transaction(): db.add_object(...); db.add_device(...)
+        Блокировка записи берётся в начале, поэтому транзакция, которая
+        сначала читает, а потом пишет, не получит «database is locked»
+        посередине, а дождётся своей очереди"""
+        return self.connections.transaction(immediate=True)
+    
+    def read_transaction(self):
+        """Согласованное чтение несколькими запросами: все они видят базу
+        на один момент. В режиме WAL такое чтение не мешает записи"""
+        return self.connections.transaction()
+    
+    def close(self):
+        """Закрывает соединения с базой данных всех потоков"""
+        self.connections.close_all()
     
     def init_database(self):
-        """Инициализирует базу данных и создаёт таблицы если их нет"""
+        """Приводит схему базы данных к текущей версии (SCHEMA_VERSION).
+
+        Версия схемы хранится в PRAGMA user_version. Если база уже
+        в текущей версии, запуск стоит одного чтения версии; иначе
+        недостающие миграции применяются по порядку в одной транзакции.
+        """
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS objects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                address TEXT,
-                description TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS devices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                model TEXT,
-                inventory_number TEXT UNIQUE,
-                valid_until TEXT,
-                description TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='users'
-        ''')
-        table_exists = cursor.fetchone() is not None
-        
-        if table_exists:
-            try:
-                cursor.execute('SELECT * FROM users')
-                old_users = cursor.fetchall()
-                
-                cursor.execute('DROP TABLE IF EXISTS users_backup')
-                cursor.execute('''
-                    CREATE TABLE users_backup (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        full_name TEXT NOT NULL,
-                        login TEXT UNIQUE NOT NULL,
-                        password_hash TEXT NOT NULL,
-                        role TEXT NOT NULL,
-                        position TEXT
-                    )
-                ''')
-                
-                for user in old_users:
-                    user_id, full_name, login, password_hash, role, position = user
-                    cursor.execute('''
-                        INSERT INTO users_backup (id, full_name, login, password_hash, role, position)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (user_id, full_name, login, password_hash, role, position))
-                
-                cursor.execute('DROP TABLE users')
-                conn.commit()
-            except Exception as e:
-                conn.rollback()
-                print(f"Ошибка при миграции таблицы users: {e}")
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                login TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('admin', 'user', 'developer')),
-                position TEXT
-            )
-        ''')
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
         
-        if table_exists:
-            try:
-                cursor.execute('SELECT name FROM sqlite_master WHERE type="table" AND name="users_backup"')
-                if cursor.fetchone():
-                    cursor.execute('SELECT * FROM users_backup')
-                    backup_users = cursor.fetchall()
-                    for user in backup_users:
-                        user_id, full_name, login, password_hash, role, position = user
-                        if role not in ('admin', 'user', 'developer'):
-                            role = 'user'
-                        try:
-                            cursor.execute('''
-                                INSERT OR IGNORE INTO users (id, full_name, login, password_hash, role, position)
-                                VALUES (?, ?, ?, ?, ?, ?)
-                            ''', (user_id, full_name, login, password_hash, role, position))
-                        except sqlite3.IntegrityError:
-                            try:
-                                cursor.execute('''
-                                    UPDATE users 
-                                    SET full_name=?, password_hash=?, role=?, position=?
-                                    WHERE login=?
-                                ''', (full_name, password_hash, role, position, login))
-                            except:
-                                pass
-                    cursor.execute('DROP TABLE users_backup')
-                    conn.commit()
-            except Exception as e:
-                print(f"Ошибка при восстановлении данных: {e}")
-                conn.rollback()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS images (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                test_type TEXT NOT NULL,
-                name TEXT NOT NULL,
-                file_path TEXT NOT NULL UNIQUE,
-                description TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS report_templates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                test_type TEXT NOT NULL UNIQUE,
-                template_path TEXT NOT NULL,
-                description TEXT
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-        
-        self.create_default_admin()
-        self.create_developer()
+        # Блокировка записи берётся сразу: два процесса, запущенные одновременно,
+        # не применят одни и те же миграции дважды
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            for description, migration in MIGRATIONS[version:]:
+                migration(self, cursor)
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     
     def create_default_admin(self):
         """Создаёт администратора по умолчанию (логин: admin, пароль: admin)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("SELECT COUNT(*) FROM users WHERE login = ?", ("admin",))
-        count = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM users WHERE login = ?", ("admin",))
+            count = cursor.fetchone()[0]
         
-        if count == 0:
-            password_hash = self.hash_password("admin")
-            cursor.execute('''
-                INSERT INTO users (full_name, login, password_hash, role, position)
-                VALUES (?, ?, ?, ?, ?)
-            ''', ("Администратор", "admin", password_hash, "admin", "Администратор"))
-            conn.commit()
-        
-        conn.close()
+            if count == 0:
+                password_hash = self.hash_password("admin")
+                cursor.execute('''
+                    INSERT INTO users (full_name, login, password_hash, role, position)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', ("Администратор", "admin", password_hash, "admin", "Администратор"))
     
     def create_developer(self):
         """Создаёт разработчика (логин: SHIFTER, пароль: tiudi1029)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM users WHERE login = ?", ("SHIFTER",))
-        count = cursor.fetchone()[0]
+        with self.transaction() as conn:
+            cursor = conn.cursor()
         
-        if count == 0:
-            password_hash = self.hash_password("tiudi1029")
-            cursor.execute('''
-                INSERT INTO users (full_name, login, password_hash, role, position)
-                VALUES (?, ?, ?, ?, ?)
-            ''', ("Разработчик", "SHIFTER", password_hash, "developer", "Разработчик"))
-            conn.commit()
+            cursor.execute("SELECT COUNT(*) FROM users WHERE login = ?", ("SHIFTER",))
+            count = cursor.fetchone()[0]
         
-        conn.close()
+            if count == 0:
+                password_hash = self.hash_password("tiudi1029")
+                cursor.execute('''
+                    INSERT INTO users (full_name, login, password_hash, role, position)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', ("Разработчик", "SHIFTER", password_hash, "developer", "Разработчик"))
     
     @staticmethod
     def hash_password(password):
@@ -189,41 +226,34 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM objects ORDER BY id")
         objects = cursor.fetchall()
-        conn.close()
         return objects
     
     def add_object(self, name, address="", description=""):
         """Добавляет объект"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO objects (name, address, description)
-            VALUES (?, ?, ?)
-        ''', (name, address, description))
-        conn.commit()
-        obj_id = cursor.lastrowid
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO objects (name, address, description)
+                VALUES (?, ?, ?)
+            ''', (name, address, description))
+            obj_id = cursor.lastrowid
         return obj_id
     
     def update_object(self, obj_id, name, address="", description=""):
         """Обновляет объект"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE objects
-            SET name = ?, address = ?, description = ?
-            WHERE id = ?
-        ''', (name, address, description, obj_id))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE objects
+                SET name = ?, address = ?, description = ?
+                WHERE id = ?
+            ''', (name, address, description, obj_id))
     
     def delete_object(self, obj_id):
         """Удаляет объект"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM objects WHERE id = ?", (obj_id,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM objects WHERE id = ?", (obj_id,))
     
     def get_object(self, obj_id):
         """Возвращает объект по ID"""
@@ -231,7 +261,6 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM objects WHERE id = ?", (obj_id,))
         obj = cursor.fetchone()
-        conn.close()
         return obj
     
     # ========== Методы для работы с приборами ==========
@@ -242,41 +271,34 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM devices ORDER BY id")
         devices = cursor.fetchall()
-        conn.close()
         return devices
     
     def add_device(self, name, model="", inventory_number="", valid_until="", description=""):
         """Добавляет прибор"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO devices (name, model, inventory_number, valid_until, description)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (name, model, inventory_number, valid_until, description))
-        conn.commit()
-        device_id = cursor.lastrowid
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO devices (name, model, inventory_number, valid_until, description)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (name, model, inventory_number, valid_until, description))
+            device_id = cursor.lastrowid
         return device_id
     
     def update_device(self, device_id, name, model="", inventory_number="", valid_until="", description=""):
         """Обновляет прибор"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE devices
-            SET name = ?, model = ?, inventory_number = ?, valid_until = ?, description = ?
-            WHERE id = ?
-        ''', (name, model, inventory_number, valid_until, description, device_id))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE devices
+                SET name = ?, model = ?, inventory_number = ?, valid_until = ?, description = ?
+                WHERE id = ?
+            ''', (name, model, inventory_number, valid_until, description, device_id))
     
     def delete_device(self, device_id):
         """Удаляет прибор"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM devices WHERE id = ?", (device_id,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM devices WHERE id = ?", (device_id,))
     
     def get_device(self, device_id):
         """Возвращает прибор по ID"""
@@ -284,9 +306,36 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM devices WHERE id = ?", (device_id,))
         device = cursor.fetchone()
-        conn.close()
         return device
     
+    def get_report_reference_data(self, object_ids, device_ids):
+        """Возвращает объекты и приборы по спискам ID одним запросом.
+
+        Результат — ({id: объект}, {id: прибор}), кортежи имеют тот же вид,
+        что и у get_object/get_device.
+        """
+        object_ids = list(set(object_ids))
+        device_ids = list(set(device_ids))
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT 'object', id, name, address, description, NULL, NULL
+            FROM objects WHERE id IN ({", ".join("?" * len(object_ids))})
+            UNION ALL
+            SELECT 'device', id, name, model, inventory_number, valid_until, description
+            FROM devices WHERE id IN ({", ".join("?" * len(device_ids))})
+        ''', object_ids + device_ids)
+        rows = cursor.fetchall()
+
+        objects = {}
+        devices = {}
+        for kind, *row in rows:
+            if kind == 'object':
+                objects[row[0]] = tuple(row[:4])
+            else:
+                devices[row[0]] = tuple(row)
+        return objects, devices
+    
     # ========== Методы для работы с пользователями ==========
     
     def get_all_users(self, exclude_developer=True):
@@ -298,50 +347,43 @@ class Database:
         else:
             cursor.execute("SELECT id, full_name, login, role, position FROM users ORDER BY id")
         users = cursor.fetchall()
-        conn.close()
         return users
     
     def add_user(self, full_name, login, password, role="user", position=""):
         """Добавляет пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        password_hash = self.hash_password(password)
-        cursor.execute('''
-            INSERT INTO users (full_name, login, password_hash, role, position)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (full_name, login, password_hash, role, position))
-        conn.commit()
-        user_id = cursor.lastrowid
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            password_hash = self.hash_password(password)
+            cursor.execute('''
+                INSERT INTO users (full_name, login, password_hash, role, position)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (full_name, login, password_hash, role, position))
+            user_id = cursor.lastrowid
         return user_id
     
     def update_user(self, user_id, full_name, login, password=None, role="user", position=""):
         """Обновляет пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        if password:
-            password_hash = self.hash_password(password)
-            cursor.execute('''
-                UPDATE users
-                SET full_name = ?, login = ?, password_hash = ?, role = ?, position = ?
-                WHERE id = ?
-            ''', (full_name, login, password_hash, role, position, user_id))
-        else:
-            cursor.execute('''
-                UPDATE users
-                SET full_name = ?, login = ?, role = ?, position = ?
-                WHERE id = ?
-            ''', (full_name, login, role, position, user_id))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            if password:
+                password_hash = self.hash_password(password)
+                cursor.execute('''
+                    UPDATE users
+                    SET full_name = ?, login = ?, password_hash = ?, role = ?, position = ?
+                    WHERE id = ?
+                ''', (full_name, login, password_hash, role, position, user_id))
+            else:
+                cursor.execute('''
+                    UPDATE users
+                    SET full_name = ?, login = ?, role = ?, position = ?
+                    WHERE id = ?
+                ''', (full_name, login, role, position, user_id))
     
     def delete_user(self, user_id):
         """Удаляет пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
     
     def get_user(self, user_id):
         """Возвращает пользователя по ID"""
@@ -349,7 +391,6 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
         user = cursor.fetchone()
-        conn.close()
         return user
     
     def authenticate_user(self, login, password):
@@ -363,7 +404,6 @@ class Database:
             WHERE login = ? AND password_hash = ?
         ''', (login, password_hash))
         user = cursor.fetchone()
-        conn.close()
         return user
     
     # ========== Методы для работы с изображениями ==========
@@ -374,7 +414,6 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM images ORDER BY test_type, name")
         images = cursor.fetchall()
-        conn.close()
         return images
     
     def get_images_by_test_type(self, test_type):
@@ -383,46 +422,39 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM images WHERE test_type = ? ORDER BY name", (test_type,))
         images = cursor.fetchall()
-        conn.close()
         return images
     
     def add_image(self, test_type, name, file_path, description=""):
         """Добавляет изображение"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO images (test_type, name, file_path, description)
-            VALUES (?, ?, ?, ?)
-        ''', (test_type, name, file_path, description))
-        conn.commit()
-        image_id = cursor.lastrowid
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO images (test_type, name, file_path, description)
+                VALUES (?, ?, ?, ?)
+            ''', (test_type, name, file_path, description))
+            image_id = cursor.lastrowid
         return image_id
     
     def update_image(self, image_id, test_type, name, file_path, description=""):
         """Обновляет изображение"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE images
-            SET test_type = ?, name = ?, file_path = ?, description = ?
-            WHERE id = ?
-        ''', (test_type, name, file_path, description, image_id))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE images
+                SET test_type = ?, name = ?, file_path = ?, description = ?
+                WHERE id = ?
+            ''', (test_type, name, file_path, description, image_id))
     
     def delete_image(self, image_id):
         """Удаляет изображение"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("SELECT file_path FROM images WHERE id = ?", (image_id,))
-        result = cursor.fetchone()
-        file_path = result[0] if result else None
+            cursor.execute("SELECT file_path FROM images WHERE id = ?", (image_id,))
+            result = cursor.fetchone()
+            file_path = result[0] if result else None
         
-        cursor.execute("DELETE FROM images WHERE id = ?", (image_id,))
-        conn.commit()
-        conn.close()
+            cursor.execute("DELETE FROM images WHERE id = ?", (image_id,))
         
         if file_path and os.path.exists(file_path):
             try:
@@ -436,7 +468,6 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM images WHERE id = ?", (image_id,))
         image = cursor.fetchone()
-        conn.close()
         return image
     
     def get_image_by_test_type_and_name(self, test_type, name):
@@ -445,37 +476,29 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM images WHERE test_type = ? AND name = ?", (test_type, name))
         image = cursor.fetchone()
-        conn.close()
         return image
     
     def get_all_test_types(self):
         """Возвращает все типы испытаний из изображений и шаблонов"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        
-        cursor.execute("SELECT DISTINCT test_type FROM images ORDER BY test_type")
-        test_types_images = [row[0] for row in cursor.fetchall()]
-        
-        cursor.execute("SELECT DISTINCT test_type FROM report_templates ORDER BY test_type")
-        test_types_templates = [row[0] for row in cursor.fetchall()]
-        
-        all_types = list(set(test_types_images + test_types_templates))
-        all_types.sort()
-        
-        conn.close()
-        return all_types
-    
+        # UNION убирает повторы; обе части читают только индексы по test_type
+        cursor.execute('''
+            SELECT test_type FROM images
+            UNION
+            SELECT test_type FROM report_templates
+            ORDER BY test_type
+        ''')
+        return [row[0] for row in cursor.fetchall()]
     
     def add_template(self, test_type, template_path, description=""):
         """Добавляет шаблон для типа испытания"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO report_templates (test_type, template_path, description)
-            VALUES (?, ?, ?)
-        ''', (test_type, template_path, description))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO report_templates (test_type, template_path, description)
+                VALUES (?, ?, ?)
+            ''', (test_type, template_path, description))
     
     def get_template(self, test_type):
         """Возвращает шаблон для типа испытания"""
@@ -483,43 +506,36 @@ class Database:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM report_templates WHERE test_type = ?", (test_type,))
         template = cursor.fetchone()
-        conn.close()
         return template
     
     def update_template(self, test_type, template_path, description=""):
         """Обновляет шаблон для типа испытания"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE report_templates
-            SET template_path = ?, description = ?
-            WHERE test_type = ?
-        ''', (template_path, description, test_type))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE report_templates
+                SET template_path = ?, description = ?
+                WHERE test_type = ?
+            ''', (template_path, description, test_type))
     
     def delete_template(self, test_type):
         """Удаляет шаблон для типа испытания"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM report_templates WHERE test_type = ?", (test_type,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM report_templates WHERE test_type = ?", (test_type,))
     
     def delete_test_type(self, test_type):
         """Удаляет все данные для типа испытания (изображения и шаблоны)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("SELECT file_path FROM images WHERE test_type = ?", (test_type,))
-        image_paths = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT file_path FROM images WHERE test_type = ?", (test_type,))
+            image_paths = [row[0] for row in cursor.fetchall()]
         
-        cursor.execute("DELETE FROM images WHERE test_type = ?", (test_type,))
+            cursor.execute("DELETE FROM images WHERE test_type = ?", (test_type,))
         
-        cursor.execute("DELETE FROM report_templates WHERE test_type = ?", (test_type,))
+            cursor.execute("DELETE FROM report_templates WHERE test_type = ?", (test_type,))
         
-        conn.commit()
-        conn.close()
         
         for file_path in image_paths:
             if file_path and os.path.exists(file_path):
@@ -536,4 +552,103 @@ class Database:
                     images_dir.rmdir()
             except Exception as e:
                 print(f"Ошибка при удалении папки {images_dir}: {e}")
+    
+    # ========== Массовая загрузка ==========
+    
+    def get_existing_inventory_numbers(self, inventory_numbers):
+        """Возвращает множество инвентарных номеров из списка, которые уже есть в базе"""
+        return self._existing_values("devices", "inventory_number", inventory_numbers)
+    
+    def get_existing_logins(self, logins):
+        """Возвращает множество логинов из списка, которые уже есть в базе"""
+        return self._existing_values("users", "login", logins)
+    
+    def _existing_values(self, table, column, values):
+        values = list(set(values))
+        found = set()
+        conn = self.get_connection()
+        # Не больше 500 параметров в запросе (ограничение SQLite — 999 в старых версиях)
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            cursor = conn.execute(
+                f"SELECT {column} FROM {table} WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            found.update(row[0] for row in cursor)
+        return found
+    
+    def upsert_objects(self, objects):
+        """Добавляет или обновляет объекты одним executemany.
+
+        objects — кортежи (id, name, address, description); объект с id
+        обновляется (или создаётся с этим id), объект без id (None) добавляется.
+        Возвращает (добавлено, обновлено).
+        """
+        with_id = [obj for obj in objects if obj[0] is not None]
+        without_id = [obj[1:] for obj in objects if obj[0] is None]
+        with self.transaction() as conn:
+            existing = set()
+            if with_id:
+                existing = self._existing_values("objects", "id", (obj[0] for obj in with_id))
+                conn.executemany('''
+                    INSERT INTO objects (id, name, address, description)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        name = excluded.name, address = excluded.address, description = excluded.description
+                ''', with_id)
+            if without_id:
+                conn.executemany("INSERT INTO objects (name, address, description) VALUES (?, ?, ?)", without_id)
+        return self._count_upserted([obj[0] for obj in with_id], existing, len(without_id))
+    
+    def upsert_devices(self, devices):
+        """Добавляет или обновляет приборы по инвентарному номеру одним executemany.
+
+        devices — кортежи (name, model, inventory_number, valid_until, description).
+        Возвращает (добавлено, обновлено).
+        """
+        with self.transaction() as conn:
+            existing = self.get_existing_inventory_numbers(device[2] for device in devices)
+            conn.executemany('''
+                INSERT INTO devices (name, model, inventory_number, valid_until, description)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(inventory_number) DO UPDATE SET
+                    name = excluded.name, model = excluded.model,
+                    valid_until = excluded.valid_until, description = excluded.description
+            ''', devices)
+        return self._count_upserted([device[2] for device in devices], existing)
+    
+    def upsert_users(self, users):
+        """Добавляет или обновляет пользователей по логину одним executemany.
 
+        users — кортежи (full_name, login, password, role, position); пустой
+        пароль у существующего пользователя оставляет прежний. Разработчик
+        не изменяется. Возвращает (добавлено, обновлено).
+        """
+        rows = [
+            (full_name, login, self.hash_password(password) if password else "", role, position)
+            for full_name, login, password, role, position in users
+        ]
+        with self.transaction() as conn:
+            existing = self.get_existing_logins(row[1] for row in rows)
+            conn.executemany('''
+                INSERT INTO users (full_name, login, password_hash, role, position)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(login) DO UPDATE SET
+                    full_name = excluded.full_name,
+                    password_hash = CASE WHEN excluded.password_hash = '' THEN users.password_hash
+                                         ELSE excluded.password_hash END,
+                    role = excluded.role, position = excluded.position
+                WHERE users.role != 'developer'
+            ''', rows)
+        return self._count_upserted([row[1] for row in rows], existing)
+    
+    @staticmethod
+    def _count_upserted(keys, existing, inserted_without_key=0):
+        """(добавлено, обновлено): ключ, уже бывший в базе или раньше в этом же
+        списке, — обновление"""
+        seen = set(existing)
+        inserted = inserted_without_key
+        for key in keys:
+            if key not in seen:
+                inserted += 1
+                seen.add(key)
+        return inserted, len(keys) + inserted_without_key - inserted
@@ -0,0 +1,204 @@
+"""Постоянные соединения с базой SQLite.
+
+Раньше каждый метод Database открывал новое соединение и закрывал его после
+одного запроса: окно управления или форма отчёта стоили несколько открытий
+файла, а кэш страниц SQLite и скомпилированные запросы терялись после
+каждого вызова. ConnectionManager держит по одному соединению на поток:
+  - соединение создаётся при первом обращении из потока и живёт, пока жив
+    поток или пока не вызван close()/close_all();
+  - скомпилированные запросы кэшируются в соединении (cached_statements),
+    поэтому повторные одинаковые запросы не разбираются заново;
+  - в процессе, созданном через fork (пул пакетной генерации), соединение
+    родителя не используется — открывается своё.
+
+Соединения работают в режиме автофиксации: отдельный запрос фиксируется
+сразу, а несколько запросов (в том числе из разных методов Database)
+объединяются в транзакцию контекстным менеджером transaction(). Вложенные
+transaction() становятся точками сохранения (SAVEPOINT): ошибка внутри
+откатывает только вложенную часть.
+
+Одновременная работа нескольких процессов (пакетная генерация, несколько
+рабочих мест):
+  - busy_timeout — сколько секунд запрос ждёт, пока база занята другим
+    процессом; если её так и не удалось занять, начало и фиксация транзакции
+    повторяются busy_retries раз с растущей паузой (BEGIN и COMMIT можно
+    безопасно повторить, запросы внутри блока — нет);
+  - wal=True (по желанию) — журнал WAL: чтение не блокирует запись и
+    наоборот, запись фиксируется быстрее. WAL требует общей памяти между
+    процессами и работает только на локальном диске: для базы в общей
+    сетевой папке его включать нельзя, там помогают только busy_timeout
+    и повторы;
+  - synchronous — PRAGMA synchronous (OFF, NORMAL, FULL); с WAL по умолчанию
+    NORMAL: фиксация не ждёт записи на диск, база не портится при сбое,
+    но последние транзакции могут потеряться при отключении питания.
+
+Значения по умолчанию задаются переменными окружения PSFOSL_DB_WAL=1,
+PSFOSL_DB_SYNCHRONOUS, PSFOSL_DB_BUSY_TIMEOUT (секунды) и
+PSFOSL_DB_BUSY_RETRIES.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+
+# Число скомпилированных запросов, которые хранит каждое соединение
+CACHED_STATEMENTS = 256
+
+DB_WAL = os.environ.get("PSFOSL_DB_WAL", "0") == "1"
+DB_SYNCHRONOUS = os.environ.get("PSFOSL_DB_SYNCHRONOUS") or None
+DB_BUSY_TIMEOUT = float(os.environ.get("PSFOSL_DB_BUSY_TIMEOUT", 10))
+DB_BUSY_RETRIES = int(os.environ.get("PSFOSL_DB_BUSY_RETRIES", 5))
+
+# Первая пауза перед повтором, с; каждая следующая вдвое длиннее
+BUSY_BACKOFF = 0.05
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def is_busy_error(error):
+    """База занята другим соединением (SQLITE_BUSY / SQLITE_LOCKED)"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+class _Connection(sqlite3.Connection):
+    """Соединение, на которое можно держать слабую ссылку (для close_all);
+    pid — процесс, открывший соединение"""
+    pid = None
+
+
+class ConnectionManager:
+    """Соединения с одной базой: по одному на поток"""
+
+    def __init__(self, db_path, cached_statements=CACHED_STATEMENTS, wal=None, synchronous=None,
+                 busy_timeout=None, busy_retries=None):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.wal = DB_WAL if wal is None else wal
+        synchronous = synchronous or DB_SYNCHRONOUS or ("NORMAL" if self.wal else None)
+        if synchronous is not None and synchronous.upper() not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Неизвестный режим synchronous: {synchronous}")
+        self.synchronous = synchronous.upper() if synchronous else None
+        self.busy_timeout = DB_BUSY_TIMEOUT if busy_timeout is None else busy_timeout
+        self.busy_retries = DB_BUSY_RETRIES if busy_retries is None else busy_retries
+        self.busy_retry_count = 0  # Сколько раз пришлось повторять (для наблюдения)
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()  # Все открытые соединения (для close_all)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.db_path, factory=_Connection, cached_statements=self.cached_statements,
+            timeout=self.busy_timeout,
+            isolation_level=None,  # Транзакции открываются явно в transaction()
+            check_same_thread=False  # Запросы идут из своего потока, но close_all закрывает из любого
+        )
+        connection.pid = os.getpid()
+        self.configure(connection)
+        return connection
+
+    def configure(self, connection):
+        """Настройка нового соединения (PRAGMA); вызывается один раз на соединение"""
+        if self.wal:
+            # Режим журнала хранится в самой базе: переключается один раз
+            mode = self.execute_with_retry(connection, "PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode.lower() != "wal":
+                print(f"Не удалось включить журнал WAL для {self.db_path}: режим {mode}")
+        if self.synchronous:
+            connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+
+    def execute_with_retry(self, connection, sql, parameters=()):
+        """Выполняет запрос, повторяя его с растущей паузой, пока база занята.
+        Только для запросов, которые можно безопасно повторить (BEGIN, COMMIT, PRAGMA)"""
+        delay = BUSY_BACKOFF
+        for attempt in range(self.busy_retries + 1):
+            try:
+                return connection.execute(sql, parameters)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt == self.busy_retries:
+                    raise
+            self.busy_retry_count += 1
+            # Случайная добавка, чтобы процессы не повторяли попытки одновременно
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+    def get(self):
+        """Возвращает соединение текущего потока, открывая его при первом обращении.
+        Соединение не закрывается после запроса — не вызывайте у него close()"""
+        local = self._local
+        connection = getattr(local, "connection", None)
+        if connection is None or connection.pid != os.getpid():
+            connection = self._connect()
+            local.connection = connection
+            local.depth = 0
+            with self._lock:
+                self._connections.add(connection)
+        return connection
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Транзакция текущего потока: фиксируется при выходе из блока и
+        откатывается при исключении. Вложенный блок — точка сохранения.
+
+        immediate=True — блокировка записи берётся сразу (BEGIN IMMEDIATE):
+        для транзакций, которые сначала читают, а потом пишут, чтобы другой
+        процесс не изменил прочитанное между чтением и записью."""
+        connection = self.get()
+        local = self._local
+        depth = local.depth
+        savepoint = f"sp_{depth}"
+        if depth == 0:
+            self.execute_with_retry(connection, "BEGIN IMMEDIATE" if immediate else "BEGIN")
+        else:
+            connection.execute(f"SAVEPOINT {savepoint}")
+        local.depth = depth + 1
+        try:
+            yield connection
+            if depth == 0:
+                # После SQLITE_BUSY на COMMIT транзакция остаётся открытой, повтор безопасен
+                self.execute_with_retry(connection, "COMMIT")
+            else:
+                connection.execute(f"RELEASE {savepoint}")
+        except BaseException:
+            if depth == 0:
+                # COMMIT мог и не выполниться (например, база занята)
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+            else:
+                connection.execute(f"ROLLBACK TO {savepoint}")
+                connection.execute(f"RELEASE {savepoint}")
+            raise
+        finally:
+            local.depth = depth
+
+    @property
+    def in_transaction(self):
+        return getattr(self._local, "depth", 0) > 0
+
+    def close(self):
+        """Закрывает соединение текущего потока"""
+        local = self._local
+        connection = getattr(local, "connection", None)
+        if connection is None:
+            return
+        local.connection = None
+        if connection.pid == os.getpid():
+            with self._lock:
+                self._connections.discard(connection)
+            connection.close()
+
+    def close_all(self):
+        """Закрывает соединения всех потоков (при завершении программы).
+        Поток, обратившийся к базе после этого, откроет новое соединение"""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            # Соединения, унаследованные от родительского процесса, закрывает родитель
+            if connection.pid == os.getpid():
+                connection.close()
+        self._local = threading.local()
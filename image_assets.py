@@ -0,0 +1,195 @@
+"""Подготовленные изображения для вставки в отчёт.
+
+Шапка организации и формула загружаются в программу в исходном размере,
+а на листе показываются в размере ячейки привязки из макета (800x175,
+145x70 точек). Вариант для печати — копия, уменьшенная до двукратного
+запаса к размеру на листе и пережатая в PNG (непрозрачные цветные
+изображения — в JPEG, если так меньше); если исходный файл не пришлось
+уменьшать и он меньше пережатого, остаётся он сам. Варианты создаются при
+загрузке изображения (ImageItemWidget.save_image), хранятся на диске
+под хэшем содержимого исходного файла и вставляются в отчёт из памяти.
+"""
+import hashlib
+import os
+import threading
+from io import BytesIO
+from pathlib import Path
+
+from report_cache import CACHE_ROOT
+
+
+# Папка для подготовленных изображений
+IMAGE_CACHE_DIR = CACHE_ROOT / "images"
+
+# Запас разрешения к размеру на листе: 2 — около 190 точек на дюйм при печати
+PRINT_SCALE = 2
+
+# Версия подготовки изображений (меняется при изменении способа подготовки)
+ASSET_VERSION = 2
+
+# Форматы, которые openpyxl вставляет в книгу без перекодирования
+EMBEDDED_FORMATS = ("PNG", "JPEG", "GIF")
+
+# Качество JPEG для непрозрачных цветных изображений (фотографии, сканы)
+JPEG_QUALITY = 90
+
+
+def image_role(image_name):
+    """Назначение изображения в макете отчёта по его названию:
+    'organisation_header', 'formula' или None"""
+    name_lower = image_name.lower()
+    if "шапка" in name_lower or "организации" in name_lower or "header" in name_lower:
+        return "organisation_header"
+    if "формул" in name_lower or "formula" in name_lower:
+        return "formula"
+    return None
+
+
+def make_print_variant(data, width, height, scale=PRINT_SCALE):
+    """Возвращает изображение для печати: оно уменьшается так, чтобы на каждую
+    точку размера на листе (width x height) приходилось не больше scale пикселей.
+    Мелкие изображения не увеличиваются, только пережимаются.
+
+    Из вариантов выбирается самый маленький: PNG, JPEG (только для
+    непрозрачных цветных изображений) и, если изображение не уменьшалось,
+    исходный файл в формате, который Excel показывает без перекодирования."""
+    # Pillow нужен только при подготовке изображения
+    from PIL import Image as PILImage
+
+    with PILImage.open(BytesIO(data)) as image:
+        image.load()
+        source_format = image.format
+        factor = min(1.0, max(width * scale / image.width, height * scale / image.height))
+        if image.mode == "P":
+            image = image.convert("RGBA")
+        # Полностью непрозрачный альфа-канал не нужен
+        if image.mode in ("RGBA", "LA") and image.getchannel("A").getextrema() == (255, 255):
+            image = image.convert("RGB" if image.mode == "RGBA" else "L")
+        if factor < 1.0:
+            size = (max(1, round(image.width * factor)), max(1, round(image.height * factor)))
+            image = image.resize(size, PILImage.LANCZOS)
+        else:
+            image = image.copy()
+
+    output = BytesIO()
+    image.save(output, format="PNG", optimize=True)
+    variants = [output.getvalue()]
+    if image.mode == "RGB":
+        output = BytesIO()
+        image.save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        variants.append(output.getvalue())
+    # Исходный файл не уменьшался и уже меньше — оставляем его как есть
+    if factor >= 1.0 and source_format in EMBEDDED_FORMATS:
+        variants.insert(0, data)
+    return min(variants, key=len)
+
+
+class ImageAssetCache:
+    """Кэш подготовленных изображений.
+
+    На диске вариант хранится под SHA-256 исходного файла и размером на
+    листе, поэтому одинаковые изображения подготавливаются один раз,
+    где бы они ни лежали. В памяти варианты хранятся по пути и времени
+    изменения файла: при создании отчёта исходный файл не читается.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries = {}  # {(абсолютный путь, mtime_ns, size, width, height): изображение}
+        self._lock = threading.Lock()
+
+    def get_bytes(self, image_path, width, height):
+        """Возвращает изображение (PNG, JPEG или GIF) для вставки в отчёт,
+        подготавливая его при необходимости"""
+        path = os.path.abspath(image_path)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size, width, height)
+
+        with self._lock:
+            data = self._entries.get(key)
+        if data is not None:
+            return data
+
+        with open(path, "rb") as f:
+            source = f.read()
+        source_hash = hashlib.sha256(source).hexdigest()
+        data = self._load_from_disk(source_hash, width, height)
+        if data is None:
+            data = make_print_variant(source, width, height)
+            self._save_to_disk(source_hash, width, height, data)
+
+        with self._lock:
+            # Старые варианты того же файла больше не нужны
+            for old_key in [k for k in self._entries if k[0] == path and k[1:3] != key[1:3]]:
+                del self._entries[old_key]
+            self._entries[key] = data
+        return data
+
+    def prepare(self, image_path, width, height):
+        """Подготавливает вариант заранее (при загрузке изображения)"""
+        self.get_bytes(image_path, width, height)
+
+    def clear(self):
+        """Очищает кэш в памяти (файлы на диске остаются)"""
+        with self._lock:
+            self._entries.clear()
+
+    def _disk_path(self, source_hash, width, height):
+        return self.cache_dir / f"{source_hash}.{width}x{height}.x{PRINT_SCALE}.v{ASSET_VERSION}.img"
+
+    def _load_from_disk(self, source_hash, width, height):
+        if not self.cache_dir:
+            return None
+        disk_path = self._disk_path(source_hash, width, height)
+        try:
+            with open(disk_path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Не удалось загрузить изображение из кэша: {e}")
+            return None
+
+    def _save_to_disk(self, source_hash, width, height, data):
+        if not self.cache_dir:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            disk_path = self._disk_path(source_hash, width, height)
+            temp_path = disk_path.with_name(f"{disk_path.name}.{os.getpid()}.tmp")
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, disk_path)
+        except Exception as e:
+            print(f"Не удалось сохранить изображение в кэш: {e}")
+
+
+# Общий кэш изображений приложения
+image_asset_cache = ImageAssetCache(IMAGE_CACHE_DIR)
+
+
+def get_image_bytes(image_path, width, height):
+    """Возвращает подготовленное изображение для вставки в отчёт"""
+    return image_asset_cache.get_bytes(image_path, width, height)
+
+
+def prepare_image_variants(image_path, test_type, image_name):
+    """Подготавливает варианты загруженного изображения для макета типа испытания.
+
+    Возвращает число подготовленных вариантов (0, если изображение
+    не используется в макете или макета для типа испытания нет).
+    """
+    from report_layout import get_layout
+
+    role = image_role(image_name)
+    if role is None:
+        return 0
+    try:
+        layout = get_layout(test_type)
+    except ValueError:
+        return 0
+    if role not in layout.images:
+        return 0
+    anchor, width, height = layout.images[role]
+    image_asset_cache.prepare(image_path, width, height)
+    return 1
@@ -1,8 +1,6 @@
 import sys
 import os
 import shutil
-import re
-from datetime import datetime
 from pathlib import Path
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QDialog, QTableWidgetItem,
@@ -13,38 +11,12 @@ from PyQt6.QtCore import Qt, QSize
 from PyQt6.QtGui import QPixmap, QImage
 from PyQt6.uic import loadUi
 from database import Database
-from betta_gidroisolation import Gidroisolation_report
-
-
-def validate_date(date_str):
-    """Проверяет корректность даты в формате ДД.ММ.ГГ или ДД.ММ.ГГГГ"""
-    if not date_str or not date_str.strip():
-        return False, "Дата не может быть пустой"
-
-    date_str = date_str.strip()
-    # Проверяем формат ДД.ММ.ГГ или ДД.ММ.ГГГГ
-    pattern = r'^\d{2}\.\d{2}\.\d{2,4}$'
-    if not re.match(pattern, date_str):
-        return False, "Неверный формат даты. Используйте ДД.ММ.ГГ или ДД.ММ.ГГГГ"
-
-    try:
-        parts = date_str.split('.')
-        day = int(parts[0])
-        month = int(parts[1])
-        year = int(parts[2])
-
-        if year < 100:
-            year += 2000
-
-        if month < 1 or month > 12:
-            return False, "Месяц должен быть от 1 до 12"
-        if day < 1 or day > 31:
-            return False, "День должен быть от 1 до 31"
-
-        datetime(year, month, day)
-        return True, ""
-    except ValueError as e:
-        return False, f"Некорректная дата: {str(e)}"
+from report import (
+    DEFAULT_TEST_TYPE, validate_date, parse_values, find_report_images, get_report_template_path,
+    start_prewarm
+)
+from report_layout import get_layout_test_types
+from image_assets import prepare_image_variants
 
 
 def show_success_message(parent, message):
@@ -107,6 +79,9 @@ class LoginWindow(QWidget):
 
         user = self.db.authenticate_user(login, password)
         if user:
+            # Движок отчётов (openpyxl, matplotlib, шаблоны) загружается в фоне,
+            # пока пользователь работает с главным окном
+            start_prewarm(self.db)
             self.main_window.set_current_user(user)
             self.hide()
             self.main_window.show()
@@ -126,6 +101,7 @@ class MainWindow(QMainWindow):
         self.devicesButton.clicked.connect(self.open_devices_management)
         self.usersButton.clicked.connect(self.open_users_management)
         self.imagesButton.clicked.connect(self.open_images_management)
+        self.importButton.clicked.connect(self.open_import)
         self.createReportButton.clicked.connect(self.open_create_report)
         self.logoutButton.clicked.connect(self.logout)
 
@@ -139,6 +115,7 @@ class MainWindow(QMainWindow):
         self.users_window = None
         self.images_window = None
         self.create_report_window = None
+        self.import_window = None
 
     def set_current_user(self, user):
         self.current_user = user
@@ -149,9 +126,11 @@ class MainWindow(QMainWindow):
         if role not in ("admin", "developer"):
             self.usersButton.hide()
             self.imagesButton.hide()
+            self.importButton.hide()
         else:
             self.usersButton.show()
             self.imagesButton.show()
+            self.importButton.show()
 
 
 
@@ -190,6 +169,14 @@ class MainWindow(QMainWindow):
         else:
             show_error_message(self, "Доступ запрещён")
 
+    def open_import(self):
+        if self.current_user and self.current_user[3] in ("admin", "developer"):
+            if self.import_window is None:
+                self.import_window = ImportWindow(self.db, self.current_user)
+            self.import_window.show()
+        else:
+            show_error_message(self, "Доступ запрещён")
+
     def open_create_report(self):
         if self.create_report_window is None:
             self.create_report_window = CreateReportWindow(self.db, self.current_user)
@@ -570,6 +557,13 @@ class ImageItemWidget(QWidget):
                 # Создаём новое изображение
                 self.db.add_image(self.test_type, self.image_name, file_path, "")
 
+            # Готовим вариант для печати в размере ячейки из макета: отчёты
+            # вставляют его из кэша, а не исходный файл в полном разрешении
+            try:
+                prepare_image_variants(file_path, self.test_type, self.image_name)
+            except Exception as e:
+                print(f"Ошибка при подготовке изображения для отчёта: {e}")
+
             self.file_path = file_path
             self.filePathEdit.setText(file_path)
 
@@ -744,6 +738,10 @@ class ImagesManagementWindow(QWidget):
 
                 shutil.copy2(file_path, dest_path)
 
+                # Сбрасываем скомпилированный шаблон, чтобы отчёты взяли новый файл
+                from template_cache import invalidate_template
+                invalidate_template(str(dest_path))
+
                 # Сохраняем в базу данных
                 self.db.add_template(test_type, str(dest_path), "")
                 self.templatePathEdit.setText(str(dest_path))
@@ -822,6 +820,7 @@ class CreateReportWindow(QWidget):
         self.backButton.clicked.connect(self.close)
 
         # Заполняем комбобоксы
+        self.refresh_test_types()
         self.refresh_objects()
         self.refresh_devices()
 
@@ -833,6 +832,15 @@ class CreateReportWindow(QWidget):
 
         self.statusLabel.setText("")
 
+    def refresh_test_types(self):
+        """Типы испытаний, для которых есть макет отчёта (папка layouts)"""
+        test_types = get_layout_test_types() or [DEFAULT_TEST_TYPE]
+        self.testTypeCombo.clear()
+        for test_type in test_types:
+            self.testTypeCombo.addItem(test_type)
+        if DEFAULT_TEST_TYPE in test_types:
+            self.testTypeCombo.setCurrentText(DEFAULT_TEST_TYPE)
+
     def refresh_objects(self):
         objects = self.db.get_all_objects()
         self.objectCombo.clear()
@@ -918,7 +926,7 @@ class CreateReportWindow(QWidget):
 
         # Парсим значения силы
         try:
-            values = [float(v.strip()) for v in values_str.split(",") if v.strip()]
+            values = parse_values(values_str)
             if not values:
                 show_error_message(self, "Введите значения силы")
                 return
@@ -926,30 +934,16 @@ class CreateReportWindow(QWidget):
             show_error_message(self, "Неверный формат значений силы. Используйте числа, разделённые запятыми")
             return
 
+        report = None
         try:
-            # Получаем изображения для данного типа испытания
-            images = self.db.get_images_by_test_type(test_type)
-
-            # Ищем изображения для шапки организации и формулы
-            org_header = None
-            formula_image = None
-
-            for image in images:
-                image_id, img_test_type, name, img_path, description = image
-                if not os.path.exists(img_path):
-                    continue
-
-                name_lower = name.lower()
-                if "шапка" in name_lower or "организации" in name_lower or "header" in name_lower:
-                    org_header = img_path
-                elif "формул" in name_lower or "formula" in name_lower:
-                    formula_image = img_path
+            # Получаем изображения шапки организации и формулы для данного типа испытания
+            org_header, formula_image = find_report_images(self.db, test_type)
 
             # Получаем шаблон для типа испытания
-            template = self.db.get_template(test_type)
-            template_path = None
-            if template:
-                template_id, test_type, template_path, description = template
+            template_path = get_report_template_path(self.db, test_type)
+
+            # Движок отчётов загружается при первом отчёте (или заранее в фоне после входа)
+            from betta_gidroisolation import Gidroisolation_report
 
             # Создаём отчёт
             report = Gidroisolation_report(
@@ -965,24 +959,17 @@ class CreateReportWindow(QWidget):
                 w_d=work_date,
                 p_name=plot_name,
                 s=square,
-                v=values
+                v=values,
+                layout=test_type  # Макет отчёта выбирается по типу испытания
             )
 
-            # Создаём отчёт с изображениями и шаблоном
-            report.create_gidroisolation_report(page_name, org_header, formula_image, template_path)
-
-            # Вставляем информацию о пользователе в ячейку D37
-            desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-            file_path = os.path.join(desktop_path, result_file_name)
-
-            if os.path.exists(file_path):
-                import openpyxl
-                wb = openpyxl.load_workbook(file_path)
-                ws = wb.active
-                ws["D37"] = user_info
-                wb.save(file_path)
+            # Создаём отчёт с изображениями и шаблоном за один проход в памяти
+            # (информация о пользователе записывается в ячейку D37 до сохранения)
+            file_path = report.create_gidroisolation_report(
+                page_name, org_header, formula_image, template_path, user_info=user_info
+            )
 
-            self.statusLabel.setText(f"Отчёт успешно создан: {file_path}")
+            self.statusLabel.setText(f"Отчёт успешно создан за {report.metrics.wall_s:.1f} с: {file_path}")
             self.statusLabel.setStyleSheet("color: green;")
             show_success_message(self, f"Отчёт успешно создан:\n{file_path}")
 
@@ -992,6 +979,84 @@ class CreateReportWindow(QWidget):
             show_error_message(self, f"Ошибка при создании отчёта:\n{str(e)}")
             import traceback
             traceback.print_exc()
+            # Замеры этапов показывают, на каком этапе произошла ошибка
+            if report is not None and report.metrics is not None:
+                print(report.metrics.format())
+
+
+class ImportWindow(QWidget):
+    """Массовая загрузка объектов, приборов и пользователей из CSV/XLSX"""
+
+    def __init__(self, db, current_user):
+        super().__init__()
+        loadUi("import_data.ui", self)
+        self.db = db
+        self.current_user = current_user
+
+        self.kindCombo.addItem("Объекты", "objects")
+        self.kindCombo.addItem("Приборы", "devices")
+        self.kindCombo.addItem("Пользователи", "users")
+
+        self.browseButton.clicked.connect(self.browse_file)
+        self.importButton.clicked.connect(self.import_file)
+        self.backButton.clicked.connect(self.close)
+
+        self.errorsTable.setColumnCount(2)
+        self.errorsTable.setHorizontalHeaderLabels(["Строка", "Ошибка"])
+
+    def browse_file(self):
+        """Открывает диалог выбора файла"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Выберите файл", "", "Таблицы (*.xlsx *.xlsm *.csv)"
+        )
+        if file_path:
+            self.fileEdit.setText(file_path)
+
+    def show_progress(self, summary):
+        """Обновляет индикатор после каждой записанной пачки строк"""
+        if summary.estimated_rows:
+            self.progressBar.setMaximum(summary.estimated_rows)
+            self.progressBar.setValue(min(summary.processed, summary.estimated_rows))
+        self.statusLabel.setText(f"Обработано строк: {summary.processed}, ошибок: {len(summary.errors)}")
+        # Загрузка идёт в потоке интерфейса: даём окну перерисоваться
+        QApplication.processEvents()
+
+    def import_file(self):
+        """Загружает выбранный файл в базу"""
+        from bulk_import import import_file
+
+        file_path = self.fileEdit.text().strip()
+        if not file_path or not os.path.exists(file_path):
+            show_error_message(self, "Выберите существующий файл CSV или XLSX")
+            return
+
+        self.importButton.setEnabled(False)
+        self.errorsTable.setRowCount(0)
+        self.progressBar.setValue(0)
+        self.statusLabel.setStyleSheet("")
+        try:
+            summary = import_file(self.db, self.kindCombo.currentData(), file_path, progress=self.show_progress)
+        except Exception as e:
+            self.statusLabel.setText(f"Ошибка: {str(e)}")
+            self.statusLabel.setStyleSheet("color: red;")
+            show_error_message(self, f"Ошибка при загрузке файла:\n{str(e)}")
+            return
+        finally:
+            self.importButton.setEnabled(True)
+
+        self.progressBar.setMaximum(max(summary.processed, 1))
+        self.progressBar.setValue(summary.processed)
+        self.errorsTable.setRowCount(len(summary.errors))
+        for row, (row_number, message) in enumerate(sorted(summary.errors)):
+            self.errorsTable.setItem(row, 0, QTableWidgetItem(str(row_number)))
+            self.errorsTable.setItem(row, 1, QTableWidgetItem(message))
+        self.errorsTable.resizeColumnToContents(0)
+
+        self.statusLabel.setText(
+            f"Обработано строк: {summary.processed} за {summary.elapsed:.1f} с. "
+            f"Добавлено: {summary.inserted}, обновлено: {summary.updated}, ошибок: {len(summary.errors)}"
+        )
+        self.statusLabel.setStyleSheet("color: red;" if summary.errors else "color: green;")
 
 
 # Диалоговые окна для добавления/редактирования
@@ -1160,7 +1225,9 @@ def main():
     login_window = LoginWindow(db, main_window)
     login_window.show()
 
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    db.close()
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+"""Создание отчётов без графического интерфейса.
+
+Модуль не импортирует PyQt6: его используют и окно создания отчёта,
+и запуск из командной строки (сервер отчётов, cron):
+
+    python report.py --object-id 1 --device-id 1 --client "ООО Заказчик" \\
+        --contract "№ 1 от 01.01.24" --plot-location "Секция 1" \\
+        --work-date 01.02.24 --plot-name "Техноэласт" --values 1,2,3,4
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+
+from database import DEFAULT_DB_PATH, Database
+from image_assets import image_role
+from report_layout import DEFAULT_TEST_TYPE, get_layout_test_types
+
+
+def validate_date(date_str):
+    """Проверяет корректность даты в формате ДД.ММ.ГГ или ДД.ММ.ГГГГ"""
+    if not date_str or not date_str.strip():
+        return False, "Дата не может быть пустой"
+
+    date_str = date_str.strip()
+    # Проверяем формат ДД.ММ.ГГ или ДД.ММ.ГГГГ
+    pattern = r'^\d{2}\.\d{2}\.\d{2,4}$'
+    if not re.match(pattern, date_str):
+        return False, "Неверный формат даты. Используйте ДД.ММ.ГГ или ДД.ММ.ГГГГ"
+
+    try:
+        parts = date_str.split('.')
+        day = int(parts[0])
+        month = int(parts[1])
+        year = int(parts[2])
+
+        if year < 100:
+            year += 2000
+
+        if month < 1 or month > 12:
+            return False, "Месяц должен быть от 1 до 12"
+        if day < 1 or day > 31:
+            return False, "День должен быть от 1 до 31"
+
+        datetime(year, month, day)
+        return True, ""
+    except ValueError as e:
+        return False, f"Некорректная дата: {str(e)}"
+
+
+def parse_values(values_str):
+    """Разбирает значения силы, разделённые запятыми (ValueError при ошибке)"""
+    return [float(v.strip()) for v in values_str.split(",") if v.strip()]
+
+
+def iter_values_file(path):
+    """Читает значения силы из текстового файла по одному, не загружая файл целиком.
+
+    Значения разделяются запятыми, точкой с запятой, пробелами или переводом строки.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for value in re.split(r"[,;\s]+", line):
+                if value:
+                    yield float(value)
+
+
+def find_report_images(db, test_type):
+    """Возвращает пути (шапка организации, формула) для типа испытания"""
+    org_header = None
+    formula_image = None
+
+    for image in db.get_images_by_test_type(test_type):
+        image_id, img_test_type, name, img_path, description = image
+        if not os.path.exists(img_path):
+            continue
+
+        role = image_role(name)
+        if role == "organisation_header":
+            org_header = img_path
+        elif role == "formula":
+            formula_image = img_path
+
+    return org_header, formula_image
+
+
+def get_report_template_path(db, test_type):
+    """Возвращает путь к шаблону отчёта для типа испытания или None"""
+    template = db.get_template(test_type)
+    if template:
+        template_id, test_type, template_path, description = template
+        return template_path
+    return None
+
+
+def prewarm_report_engine(db=None):
+    """Загружает движок отчётов (openpyxl, matplotlib) и компилирует шаблоны заранее"""
+    template_paths = []
+    if db is not None:
+        for test_type in db.get_all_test_types():
+            template_path = get_report_template_path(db, test_type)
+            if template_path:
+                template_paths.append(template_path)
+
+    from betta_gidroisolation import warm_up
+    warm_up(template_paths)
+
+
+_prewarm_thread = None
+
+
+def start_prewarm(db=None):
+    """Запускает прогрев движка отчётов в фоновом потоке (один раз за запуск программы)"""
+    global _prewarm_thread
+    if _prewarm_thread is not None:
+        return _prewarm_thread
+
+    def run():
+        try:
+            prewarm_report_engine(db)
+        except Exception as e:
+            print(f"Ошибка при фоновой загрузке движка отчётов: {e}")
+
+    _prewarm_thread = threading.Thread(target=run, name="report-prewarm", daemon=True)
+    _prewarm_thread.start()
+    return _prewarm_thread
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Создание отчёта по гидроизоляции без графического интерфейса"
+    )
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="путь к базе данных (по умолчанию PSFOSL_DB или laboratory.db рядом с программой)")
+    parser.add_argument("--test-type", default=DEFAULT_TEST_TYPE, help="тип испытания")
+
+    parser.add_argument("--object-id", type=int, help="ID объекта в базе данных")
+    parser.add_argument("--object-name", help="название объекта (вместо --object-id)")
+    parser.add_argument("--device-id", type=int, help="ID прибора в базе данных")
+    parser.add_argument("--device-name", help="название прибора (вместо --device-id)")
+    parser.add_argument("--device-number", default="777", help="заводской/инвентарный номер прибора")
+    parser.add_argument("--device-valid-until", default="01.01.01", help="прибор действителен до")
+    parser.add_argument("--user-id", type=int, help="ID составителя отчёта в базе данных")
+    parser.add_argument("--user-info", help="должность и ФИО составителя отчёта")
+
+    parser.add_argument("--client", required=True, help="заказчик")
+    parser.add_argument("--contract", required=True, help="договор")
+    parser.add_argument("--plot-location", required=True, help="расположение контролируемого участка")
+    parser.add_argument("--work-date", required=True, help="дата проведения работ (ДД.ММ.ГГ)")
+    parser.add_argument("--plot-name", required=True, help="название слоя")
+    parser.add_argument("--square", type=int, default=25, help="площадь отрыва, см²")
+    values_group = parser.add_mutually_exclusive_group(required=True)
+    values_group.add_argument("--values", help="значения силы, кН, через запятую")
+    values_group.add_argument("--values-file",
+                              help="файл со значениями силы (через запятую или по одному в строке)")
+    parser.add_argument("--stream", action="store_true",
+                        help="потоковый режим для длинных серий: строки пишутся сразу, память не растёт")
+
+    parser.add_argument("--output", default="Отчёт_по_гидроизоляции.xlsx",
+                        help="имя файла отчёта (относительно папки отчётов) или полный путь; "
+                             "'-' — записать отчёт в стандартный вывод")
+    parser.add_argument("--output-dir",
+                        help="папка для отчёта (по умолчанию PSFOSL_OUTPUT_DIR или рабочий стол)")
+    parser.add_argument("--page-name", default="Участок", help="название страницы")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="не брать отчёт из кэша готовых отчётов, а создать заново")
+    parser.add_argument("--chart-backend", choices=("matplotlib", "native"),
+                        help="график: растровый (matplotlib) или диаграмма Excel (native)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="вывести время, процессорное время и память по этапам в stderr")
+    parser.add_argument("--metrics-log",
+                        help="дописать замеры этапов строкой JSON в журнал (по умолчанию PSFOSL_METRICS_LOG)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.object_id is None and not args.object_name:
+        parser.error("укажите --object-id или --object-name")
+    if args.device_id is None and not args.device_name:
+        parser.error("укажите --device-id или --device-name")
+
+    if args.test_type not in get_layout_test_types():
+        parser.error(f"нет макета отчёта для типа испытания '{args.test_type}'")
+
+    is_valid, error_msg = validate_date(args.work_date)
+    if not is_valid:
+        parser.error(f"ошибка в дате проведения работ: {error_msg}")
+    if args.values_file:
+        if not os.path.exists(args.values_file):
+            parser.error(f"файл {args.values_file} не найден")
+        # В потоковом режиме файл читается по мере записи таблицы
+        values = iter_values_file(args.values_file)
+        if not args.stream:
+            try:
+                values = list(values)
+            except ValueError:
+                parser.error("неверный формат значений силы в файле")
+    else:
+        try:
+            values = parse_values(args.values)
+        except ValueError:
+            parser.error("неверный формат значений силы, используйте числа, разделённые запятыми")
+    if isinstance(values, list) and not values:
+        parser.error("введите значения силы")
+
+    if not os.path.exists(args.db):
+        parser.error(f"база данных не найдена: {args.db}")
+    db = Database(args.db)
+
+    object_name = args.object_name
+    if args.object_id is not None:
+        obj = db.get_object(args.object_id)
+        if not obj:
+            parser.error(f"объект с ID {args.object_id} не найден")
+        obj_id, object_name, address, description = obj
+
+    device_name = args.device_name
+    inventory_number = args.device_number
+    valid_until = args.device_valid_until
+    if args.device_id is not None:
+        device = db.get_device(args.device_id)
+        if not device:
+            parser.error(f"прибор с ID {args.device_id} не найден")
+        device_id, device_name, model, inventory_number, valid_until, device_desc = device
+
+    user_info = args.user_info
+    if user_info is None and args.user_id is not None:
+        user = db.get_user(args.user_id)
+        if not user:
+            parser.error(f"пользователь с ID {args.user_id} не найден")
+        user_id, full_name, login, password_hash, role, position = user
+        user_info = f"{position or ''} {full_name}".strip()
+
+    org_header, formula_image = find_report_images(db, args.test_type)
+    template_path = get_report_template_path(db, args.test_type)
+
+    # Движок отчётов импортируется только здесь: разбор аргументов не ждёт openpyxl
+    from betta_gidroisolation import Gidroisolation_report
+
+    report = Gidroisolation_report(
+        r_f=args.output,
+        p_n=args.page_name,
+        o_n=object_name,
+        client_n=args.client,
+        contract_n=args.contract,
+        d_n=device_name,
+        z_n=inventory_number or "777",
+        d_v_u=valid_until or "01.01.01",
+        p_l=args.plot_location,
+        w_d=args.work_date,
+        p_name=args.plot_name,
+        s=args.square,
+        v=values if isinstance(values, list) else [],
+        chart_backend=args.chart_backend,
+        layout=args.test_type,
+        output_dir=args.output_dir
+    )
+
+    # Отчёт в стандартный вывод: файл на диске не создаётся
+    output = sys.stdout.buffer if args.output == "-" else None
+    try:
+        if args.stream:
+            file_path = report.create_streaming_report(
+                values, args.page_name, org_header, formula_image, template_path, user_info=user_info,
+                output=output, metrics_log=args.metrics_log
+            )
+        else:
+            file_path = report.create_gidroisolation_report(
+                args.page_name, org_header, formula_image, template_path, user_info=user_info,
+                output=output, use_cache=False if args.no_cache else None, metrics_log=args.metrics_log
+            )
+    except Exception as e:
+        print(f"Ошибка при создании отчёта: {e}", file=sys.stderr)
+        if args.metrics and report.metrics is not None:
+            print(report.metrics.format(), file=sys.stderr)
+        return 1
+
+    if args.metrics and report.metrics is not None:
+        print(report.metrics.format(), file=sys.stderr)
+
+    if output is not None:
+        output.flush()
+    else:
+        print(file_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Кэш готовых отчётов по содержимому запроса.
+
+Инженер часто создаёт один и тот же отчёт несколько раз подряд, исправляя
+опечатку в другом поле. Ключ кэша — SHA-256 от всех входных данных отчёта:
+полей отчёта, содержимого шаблона, макета и изображений и версии движка.
+Если отчёт с таким ключом уже создавался, готовый xlsx берётся из папки
+кэша без openpyxl и matplotlib.
+
+Размер кэша на диске ограничен, при переполнении удаляются давно
+не использованные отчёты (LRU). Включение и размер задаются переменными
+окружения PSFOSL_REPORT_CACHE (0 — выключить) и PSFOSL_REPORT_CACHE_MB.
+
+Здесь же задаётся общая папка кэшей программы CACHE_ROOT (отчёты,
+шаблоны, изображения): cache/ рядом с программой или PSFOSL_CACHE_DIR.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+# Общая папка кэшей. Не зависит от текущей папки: окно программы, report.py
+# и рабочие процессы пакетной генерации пользуются одними кэшами
+CACHE_ROOT = Path(os.environ.get("PSFOSL_CACHE_DIR")
+                  or Path(os.path.dirname(os.path.abspath(__file__))) / "cache")
+
+# Папка для готовых отчётов
+REPORT_CACHE_DIR = CACHE_ROOT / "reports"
+
+# Наибольший размер кэша на диске по умолчанию, МБ
+DEFAULT_MAX_MB = 256
+
+REPORT_CACHE_ENABLED = os.environ.get("PSFOSL_REPORT_CACHE", "1") != "0"
+
+_file_hashes = {}  # {абсолютный путь: ((mtime_ns, size), SHA-256)}
+_file_hashes_lock = threading.Lock()
+
+
+def file_content_hash(path):
+    """SHA-256 содержимого файла; пересчитывается только при изменении файла.
+    Для отсутствующего файла или пустого пути возвращает None"""
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _file_hashes_lock:
+        entry = _file_hashes.get(path)
+    if entry and entry[0] == version:
+        return entry[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    with _file_hashes_lock:
+        _file_hashes[path] = (version, digest)
+    return digest
+
+
+def make_cache_key(fields):
+    """Ключ кэша по словарю входных данных отчёта (значения — типы JSON)"""
+    data = json.dumps(fields, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """Кэш готовых отчётов на диске с вытеснением давно не использованных.
+
+    Отчёт хранится файлом <ключ>.xlsx, время изменения файла — время
+    последнего использования, поэтому порядок LRU переживает перезапуск
+    программы. Счётчики hits и misses считаются для текущего процесса.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index = None  # OrderedDict {ключ: размер}, от давно использованных к недавним
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.xlsx"
+
+    def _load_index(self):
+        """Читает содержимое папки кэша (один раз за процесс)"""
+        if self._index is not None:
+            return
+        entries = []
+        if self.cache_dir.is_dir():
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".xlsx") and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, entry.name[:-5], stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self._size = sum(self._index.values())
+
+    def get(self, key):
+        """Возвращает содержимое отчёта (bytes) или None, если его нет в кэше"""
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                # Файл мог удалить другой процесс с тем же кэшем
+                self._forget(key)
+                self.misses += 1
+                return None
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            if key in self._index:
+                self._index.move_to_end(key)
+            else:
+                self._index[key] = len(data)
+                self._size += len(data)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Сохраняет отчёт в кэш и вытесняет старые отчёты сверх max_bytes"""
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"Не удалось сохранить отчёт в кэш: {e}")
+                return
+            self._forget(key)
+            self._index[key] = len(data)
+            self._size += len(data)
+            while self._size > self.max_bytes and self._index:
+                old_key = next(iter(self._index))
+                self._forget(old_key)
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+                self.evictions += 1
+
+    def _forget(self, key):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._size -= size
+
+    def clear(self):
+        """Удаляет все отчёты из кэша"""
+        with self._lock:
+            self._load_index()
+            for key in list(self._index):
+                self._forget(key)
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Счётчики кэша: попадания, промахи, вытеснения, число и размер отчётов"""
+        with self._lock:
+            self._load_index()
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        entries=len(self._index), size_bytes=self._size, max_bytes=self.max_bytes)
+
+
+# Общий кэш отчётов приложения
+report_cache = ReportCache(
+    REPORT_CACHE_DIR,
+    int(float(os.environ.get("PSFOSL_REPORT_CACHE_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+)
@@ -0,0 +1,474 @@
+"""Макеты отчётов по типам испытаний.
+
+Макет — JSON-файл в папке layouts/, который описывает, куда в шаблоне
+записываются данные: поля шапки, столбцы таблицы результатов и их
+объединения, место графика, блок выводов и область печати. Чтобы добавить
+новый тип испытания, достаточно положить рядом шаблон и файл макета.
+
+Макет компилируется один раз (CompiledLayout): номера столбцов, объекты
+стилей и функции получения значений готовятся заранее, при создании
+отчёта остаётся только записать ячейки. Модуль не импортирует openpyxl
+при загрузке, поэтому список типов испытаний доступен окну программы
+без загрузки движка отчётов.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+
+PROJECT_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
+
+# Папка с макетами отчётов (*.json)
+LAYOUTS_DIR = PROJECT_DIR / "layouts"
+
+DEFAULT_TEST_TYPE = "Гидроизоляция"
+
+# Значения столбцов таблицы, которые меняются от строки к строке:
+# имя -> функция (отчёт, статистика, номер строки) -> значение
+ROW_VALUES = {
+    "plot_number": lambda report, stats, i: i + 1,
+    "force": lambda report, stats, i: report.values[i],
+    "adhesion": lambda report, stats, i: float(stats.adhesion[i]),
+    "conformity": lambda report, stats, i: "Соответствует" if stats.conforms[i] else "Не соответствует",
+}
+
+# Значения, которые берутся из статистики испытаний; остальные имена — атрибуты отчёта
+STATS_VALUES = {
+    "average": lambda stats: stats.average_text,
+    "min": lambda stats: stats.min,
+    "max": lambda stats: stats.max,
+    "normative_value": lambda stats: stats.normative_value,
+}
+
+
+def get_value(report, stats, name):
+    """Возвращает значение поля макета: из статистики или атрибут отчёта"""
+    if name in STATS_VALUES:
+        return STATS_VALUES[name](stats)
+    return getattr(report, name)
+
+
+class TableColumn:
+    """Скомпилированный столбец таблицы результатов"""
+    __slots__ = ("first_column", "last_column", "per_row", "value", "row_value", "formula",
+                 "alignment", "font")
+
+    def __init__(self, first_column, last_column, per_row, value, row_value, formula, alignment, font):
+        self.first_column = first_column  # Номера столбцов (1 — A)
+        self.last_column = last_column
+        self.per_row = per_row  # True — ячейка в каждой строке, False — одна на всю таблицу
+        self.value = value  # Имя значения для столбца на всю таблицу
+        self.row_value = row_value  # Функция значения для строки (из ROW_VALUES)
+        self.formula = formula  # Шаблон формулы с {first_row} и {row}
+        self.alignment = alignment
+        self.font = font
+
+
+class SectionPlan:
+    """Готовый план записи части отчёта (заголовок графика, выводы).
+
+    План не зависит от способа записи: его можно применить к обычному
+    листу (apply) или выдать построчно в потоковый лист.
+    """
+    __slots__ = ("cells", "merges", "heights", "min_heights", "breaks", "last_cell")
+
+    def __init__(self):
+        self.cells = []  # [(строка, столбец, значение, шрифт, выравнивание), ...]
+        self.merges = []  # [(первая строка, первый столбец, последняя строка, последний столбец), ...]
+        self.heights = {}  # {строка: высота}
+        self.min_heights = {}  # {строка: высота}, если высота строки ещё не задана
+        self.breaks = []  # Строки с разрывом страницы
+        self.last_cell = None
+
+    @property
+    def rows(self):
+        return sorted({cell[0] for cell in self.cells} | set(self.heights) | set(self.min_heights))
+
+    def apply(self, ws):
+        """Записывает план на обычный (не потоковый) лист"""
+        from openpyxl.worksheet.pagebreak import Break
+
+        for row in self.breaks:
+            ws.row_breaks.append(Break(id=row))
+        for start_row, start_column, end_row, end_column in self.merges:
+            ws.merge_cells(start_row=start_row, start_column=start_column,
+                           end_row=end_row, end_column=end_column)
+        for row, height in self.heights.items():
+            ws.row_dimensions[row].height = height
+        for row, height in self.min_heights.items():
+            if row not in ws.row_dimensions or ws.row_dimensions[row].height is None:
+                ws.row_dimensions[row].height = height
+        for row, column, value, font, alignment in self.cells:
+            cell = ws.cell(row=row, column=column, value=value)
+            if font is not None:
+                cell.font = font
+            if alignment is not None:
+                cell.alignment = alignment
+
+
+class CompiledLayout:
+    """Скомпилированный макет отчёта: план записи ячеек для одного типа испытания"""
+
+    def __init__(self, spec, source_path=None):
+        # openpyxl нужен только при компиляции, список макетов его не загружает
+        from openpyxl.styles import Alignment, Font
+        from openpyxl.utils import column_index_from_string
+
+        self.source_path = source_path
+        self.test_type = spec["test_type"]
+        self.description = spec.get("description", "")
+        self.template_path = str(PROJECT_DIR / spec["template"]) if spec.get("template") else None
+
+        self.images = {
+            name: (image["anchor"], image["width"], image["height"])
+            for name, image in spec.get("images", {}).items()
+        }
+        self.header = tuple(spec.get("header", {}).items())
+        self.user_info_cell = spec.get("user_info_cell")
+
+        table = spec["table"]
+        self.start_row = table["start_row"]
+        self.row_height = table.get("row_height")
+        self.row_heights = tuple((int(row), height) for row, height in table.get("row_heights", {}).items())
+
+        # Выравнивания и шрифты создаются один раз на макет, а не на каждую ячейку
+        row_alignment = Alignment(horizontal="center", vertical="center")
+        block_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+        block_font = Font(size=12)
+
+        columns = []
+        for column in table["columns"]:
+            per_row = bool(column.get("per_row"))
+            value = column.get("value")
+            formula = column.get("formula")
+            if value is None and formula is None:
+                raise ValueError(f"{self._where()}: у столбца {column['from']} не задано value или formula")
+            row_value = None
+            if per_row and value is not None:
+                if value not in ROW_VALUES:
+                    raise ValueError(f"{self._where()}: неизвестное значение строки таблицы '{value}'")
+                row_value = ROW_VALUES[value]
+            columns.append(TableColumn(
+                first_column=column_index_from_string(column["from"]),
+                last_column=column_index_from_string(column.get("to", column["from"])),
+                per_row=per_row,
+                value=value,
+                row_value=row_value,
+                formula=formula,
+                alignment=row_alignment if per_row else block_alignment,
+                font=None if per_row else block_font,
+            ))
+        self.columns = tuple(columns)
+
+        chart = spec.get("chart", {})
+        self.chart_title = chart.get("title")
+        self.chart_column = chart.get("column", "C")
+        self.chart_offset = chart.get("offset", 2)
+        self.chart_title_height = chart.get("title_height")
+        self.chart_rows = chart.get("rows", 0)
+        self.chart_row_height = chart.get("row_height")
+        self.chart_title_font = Font(bold=True, size=12)
+
+        conclusion = spec.get("conclusion", {})
+        self.conclusion_offset = conclusion.get("offset", 2)
+        self.conclusion_title = conclusion.get("title")
+        self.conclusion_column = column_index_from_string(conclusion.get("column", "C"))
+        self.conclusion_last_column = conclusion.get("last_column", "R")
+        self.paragraph_last_column = column_index_from_string(self.conclusion_last_column)
+        self.paragraph_height = conclusion.get("paragraph_height")
+        self.paragraphs = tuple(conclusion.get("paragraphs", ()))
+        self.plot_phrase = conclusion.get("plot_phrase", "")
+        # Для отчёта по нескольким участкам
+        self.plot_phrase_plural = conclusion.get("plot_phrase_plural", self.plot_phrase)
+        signature = conclusion.get("signature")
+        self.signature = (
+            (column_index_from_string(signature["from"]),
+             column_index_from_string(signature.get("to", signature["from"])),
+             signature["value"])
+            if signature else None
+        )
+        self.conclusion_title_font = Font(bold=True, size=14)
+        self.conclusion_font = Font(size=14)
+        self.paragraph_alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
+
+        self.print_area = spec.get("print_area")
+        self.page_setup = dict(spec.get("page_setup", {}))
+
+    def _where(self):
+        return f"Макет {self.source_path or self.test_type}"
+
+    def table_end_row(self, count):
+        """Последняя строка таблицы для count измерений"""
+        return self.start_row + count - 1
+
+    def chart_start_row(self, table_end_row, index=0):
+        """Строка, с которой начинается график (заголовок — строкой выше).
+        Графики участков (index) идут друг за другом с тем же отступом"""
+        return table_end_row + self.chart_offset + index * (self.chart_rows + self.chart_offset)
+
+    def chart_anchor(self, table_end_row, index=0):
+        """Ячейка привязки графика"""
+        return f"{self.chart_column}{self.chart_start_row(table_end_row, index)}"
+
+    def conclusion_start_row(self, table_end_row, chart_count=1):
+        """Строка заголовка выводов: после последнего графика с отступом"""
+        return self.chart_start_row(table_end_row, chart_count - 1) + self.chart_rows + self.conclusion_offset
+
+    def write_header(self, ws, report):
+        """Заполняет поля шапки (объект, заказчик, прибор, дата)"""
+        for coordinate, name in self.header:
+            ws[coordinate] = getattr(report, name)
+
+    def write_table(self, ws, report, stats, first_row=None, number_offset=0):
+        """Заполняет таблицу результатов, возвращает номер последней строки.
+
+        report — источник значений на всю таблицу (отчёт или участок).
+        Для отчёта по нескольким участкам таблица пишется блоками: блок
+        участка начинается с first_row, номера испытаний продолжаются
+        с number_offset + 1.
+        """
+        from openpyxl.styles.cell_style import StyleArray
+        from openpyxl.utils import get_column_letter
+        from openpyxl.worksheet.merge import MergedCellRange
+
+        count = stats.count
+        if first_row is None:
+            first_row = self.start_row
+        last_row = first_row + count - 1
+
+        if self.row_height is not None:
+            for row in range(first_row, last_row + 1):
+                ws.row_dimensions[row].height = self.row_height
+
+        row_merges = []
+        for column in self.columns:
+            merged = column.last_column != column.first_column
+            if column.per_row:
+                if merged:
+                    first_letter = get_column_letter(column.first_column)
+                    last_letter = get_column_letter(column.last_column)
+                    row_merges.extend(
+                        MergedCellRange(ws, f"{first_letter}{row}:{last_letter}{row}")
+                        for row in range(first_row, last_row + 1)
+                    )
+                # Номер стиля выравнивания в книге ищется один раз на столбец, а не для каждой
+                # ячейки (так же, как его задаёт присваивание cell.alignment)
+                alignment_id = ws.parent._alignments.add(column.alignment)
+                for i in range(count):
+                    row = first_row + i
+                    if column.formula is not None:
+                        value = column.formula.format(first_row=first_row, row=row)
+                    elif column.value == "plot_number":
+                        value = number_offset + i + 1
+                    else:
+                        value = column.row_value(report, stats, i)
+                    cell = ws.cell(row=row, column=column.first_column, value=value)
+                    if not cell._style:
+                        cell._style = StyleArray()
+                    cell._style.alignmentId = alignment_id
+            else:
+                # Одно значение на всю таблицу: ячейки столбца объединяются по высоте таблицы
+                if merged or last_row != first_row:
+                    ws.merge_cells(start_row=first_row, start_column=column.first_column,
+                                   end_row=last_row, end_column=column.last_column)
+                if column.formula is not None:
+                    value = column.formula.format(first_row=first_row, row=first_row)
+                else:
+                    value = get_value(report, stats, column.value)
+                cell = ws.cell(row=first_row, column=column.first_column, value=value)
+                cell.alignment = column.alignment
+                cell.font = column.font
+
+        if row_merges:
+            _merge_row_ranges(ws, row_merges)
+
+        for row, height in self.row_heights:
+            ws.row_dimensions[row].height = height
+        return last_row
+
+    def chart_frame_plan(self, table_end_row, index=0, subtitle=None):
+        """План заголовка графика и высоты строк под графиком.
+        subtitle дописывается к заголовку (расположение участка)"""
+        from openpyxl.utils import column_index_from_string
+
+        plan = SectionPlan()
+        chart_start_row = self.chart_start_row(table_end_row, index)
+        if self.chart_title:
+            title = f"{self.chart_title}: {subtitle}" if subtitle else self.chart_title
+            plan.cells.append((chart_start_row - 1, column_index_from_string(self.chart_column),
+                               title, self.chart_title_font, None))
+            if self.chart_title_height is not None:
+                plan.heights[chart_start_row - 1] = self.chart_title_height
+
+        # Высота строк под графиком, чтобы выводы не наезжали на него
+        if self.chart_row_height is not None:
+            for row in range(chart_start_row, chart_start_row + self.chart_rows):
+                plan.min_heights[row] = self.chart_row_height
+        return plan
+
+    def write_chart_frame(self, ws, table_end_row, index=0, subtitle=None):
+        """Записывает заголовок графика и задаёт высоту строк под ним"""
+        self.chart_frame_plan(table_end_row, index, subtitle).apply(ws)
+
+    def conclusion_plan(self, report, stats, table_end_row, plot_count=1):
+        """План выводов после графиков; plan.last_cell — правая нижняя ячейка отчёта"""
+        plan = SectionPlan()
+        row = self.conclusion_start_row(table_end_row, plot_count)
+        if self.conclusion_title:
+            plan.cells.append((row, self.conclusion_column, self.conclusion_title,
+                               self.conclusion_title_font, None))
+            plan.breaks.append(row)
+
+        plot_phrase = self.plot_phrase_plural if plot_count > 1 else self.plot_phrase
+        context = dict(plot_phrase=plot_phrase, min=stats.min, max=stats.max,
+                       status=report.sootv_status)
+        row += 1
+        for paragraph in self.paragraphs:
+            plan.merges.append((row, self.conclusion_column, row + 1, self.paragraph_last_column))
+            if self.paragraph_height is not None:
+                plan.heights[row] = self.paragraph_height
+            plan.cells.append((row, self.conclusion_column, paragraph.format(**context),
+                               self.conclusion_font, self.paragraph_alignment))
+            row += 2
+
+        if self.signature:
+            row += 1
+            first_column, last_column, value = self.signature
+            if last_column != first_column:
+                plan.merges.append((row, first_column, row, last_column))
+            plan.cells.append((row, first_column, value, self.conclusion_font, None))
+        plan.last_cell = f"{self.conclusion_last_column}{row}"
+        return plan
+
+    def write_conclusion(self, ws, report, stats, table_end_row, plot_count=1):
+        """Записывает выводы после графиков, возвращает правую нижнюю ячейку отчёта"""
+        plan = self.conclusion_plan(report, stats, table_end_row, plot_count)
+        plan.apply(ws)
+        return plan.last_cell
+
+    def apply_page_setup(self, ws, last_cell):
+        """Задаёт область печати, ориентацию и поля страницы"""
+        if self.print_area:
+            ws.print_area = self.print_area.format(last_cell=last_cell)
+        if self.page_setup.get("orientation"):
+            ws.page_setup.orientation = self.page_setup["orientation"]
+        for side in ("left", "right", "top", "bottom", "header", "footer"):
+            margin = self.page_setup.get(f"margin_{side}")
+            if margin is not None:
+                setattr(ws.page_margins, side, margin)
+
+
+def _merge_row_ranges(ws, ranges):
+    """Объединяет ячейки в строках таблицы так же, как ws.merge_cells, но за линейное время.
+
+    merge_cells сверяет каждое новое объединение со всеми прежними, и на длинной
+    таблице время растёт квадратично. Объединения строк таблицы не пересекаются,
+    поэтому добавляются одним списком. Оформление ячеек внутри объединения
+    (рамки, защита) зависит только от стиля первой ячейки: оно вычисляется
+    один раз на стиль и столбцы, остальным строкам копируются готовые стили.
+    """
+    from copy import copy
+    from openpyxl.cell.cell import MergedCell
+    from openpyxl.worksheet.cell_range import MultiCellRange
+
+    ws.merged_cells = MultiCellRange(list(ws.merged_cells.ranges) + ranges)
+    formatted = {}  # {(стиль первой ячейки, столбцы): (стиль первой ячейки после оформления, стили остальных)}
+    for merged_range in ranges:
+        row = merged_range.min_row
+        columns = range(merged_range.min_col + 1, merged_range.max_col + 1)
+        start_cell = merged_range.start_cell
+        key = (tuple(start_cell._style), merged_range.min_col, merged_range.max_col)
+        styles = formatted.get(key)
+        if styles is None:
+            ws._clean_merge_range(merged_range)
+            formatted[key] = (copy(start_cell._style), [copy(ws._cells[row, column]._style) for column in columns])
+            continue
+        start_style, cell_styles = styles
+        start_cell._style = copy(start_style)
+        for column, style in zip(columns, cell_styles):
+            cell = MergedCell(ws, row=row, column=column)
+            cell._style = copy(style)
+            ws._cells[row, column] = cell
+
+
+def load_layout_spec(path):
+    """Читает описание макета из JSON-файла"""
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+    if not spec.get("test_type") or "table" not in spec:
+        raise ValueError(f"Макет {path}: не заданы test_type или table")
+    return spec
+
+
+class LayoutRegistry:
+    """Макеты отчётов из папки layouts_dir по типам испытаний.
+
+    Описания перечитываются только при изменении файлов, скомпилированные
+    макеты хранятся в памяти до изменения файла.
+    """
+
+    def __init__(self, layouts_dir=LAYOUTS_DIR):
+        self.layouts_dir = Path(layouts_dir)
+        self._specs = {}  # {путь: (mtime_ns, описание)}
+        self._compiled = {}  # {путь: (mtime_ns, CompiledLayout)}
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """Возвращает {тип испытания: (путь, mtime_ns, описание)} по файлам макетов"""
+        layouts = {}
+        if not self.layouts_dir.is_dir():
+            return layouts
+        for entry in sorted(os.scandir(self.layouts_dir), key=lambda entry: entry.name):
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            mtime_ns = entry.stat().st_mtime_ns
+            with self._lock:
+                cached = self._specs.get(entry.path)
+            if cached and cached[0] == mtime_ns:
+                spec = cached[1]
+            else:
+                try:
+                    spec = load_layout_spec(entry.path)
+                except (OSError, ValueError) as e:
+                    print(f"Ошибка при чтении макета отчёта {entry.name}: {e}")
+                    continue
+                with self._lock:
+                    self._specs[entry.path] = (mtime_ns, spec)
+            layouts[spec["test_type"]] = (entry.path, mtime_ns, spec)
+        return layouts
+
+    def test_types(self):
+        """Типы испытаний, для которых есть макет"""
+        return sorted(self._scan())
+
+    def get(self, test_type):
+        """Возвращает скомпилированный макет для типа испытания"""
+        layout = self._scan().get(test_type)
+        if layout is None:
+            raise ValueError(f"Нет макета отчёта для типа испытания '{test_type}'")
+        path, mtime_ns, spec = layout
+
+        with self._lock:
+            entry = self._compiled.get(path)
+            if entry and entry[0] == mtime_ns:
+                return entry[1]
+
+        compiled = CompiledLayout(spec, path)
+        with self._lock:
+            self._compiled[path] = (mtime_ns, compiled)
+        return compiled
+
+
+# Общий реестр макетов приложения
+layout_registry = LayoutRegistry()
+
+
+def get_layout(test_type=DEFAULT_TEST_TYPE):
+    """Возвращает скомпилированный макет из общего реестра"""
+    return layout_registry.get(test_type)
+
+
+def get_layout_test_types():
+    """Типы испытаний, для которых можно создать отчёт"""
+    return layout_registry.test_types()
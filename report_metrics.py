@@ -0,0 +1,239 @@
+"""Замеры этапов создания отчёта.
+
+Для каждого этапа (загрузка шаблона, изображения, таблица, график, выводы,
+сохранение) записываются время по часам, процессорное время потока и
+память. Замеры одного отчёта собираются в ReportMetrics: он
+доступен как report.metrics после создания отчёта и может дописываться
+строкой JSON в журнал (JSON Lines) для наблюдения за скоростью отчётов.
+
+Память:
+  rss_delta_kb       — на сколько изменился объём памяти процесса (RSS) за
+                       этап (/proc/self/statm, только Linux);
+  process_max_rss_kb — наибольший объём памяти процесса за всё время его
+                       работы к концу этапа (resource.getrusage, нет в Windows);
+                       значение накопительное: в пакетном режиме и в GUI оно
+                       включает память прошлых отчётов и не относится к этапу;
+  peak_alloc_kb      — пик выделенной Python памяти за этап; считается, только
+                       если включено отслеживание tracemalloc
+                       (PSFOSL_TRACE_MEMORY=1 или trace_memory=True), так как
+                       оно замедляет работу. Пик tracemalloc общий для процесса:
+                       если этап выполнялся одновременно с этапом в другом
+                       потоке, значение не определено (None).
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Журнал замеров по умолчанию (JSON Lines), можно задать переменной окружения
+METRICS_LOG_PATH = os.environ.get("PSFOSL_METRICS_LOG") or None
+
+# Отслеживать выделение памяти по этапам (медленнее, только для анализа)
+TRACE_MEMORY = os.environ.get("PSFOSL_TRACE_MEMORY", "0") == "1"
+
+_log_lock = threading.Lock()
+
+# Окна замера tracemalloc открытых этапов (пик общий для процесса)
+_alloc_lock = threading.Lock()
+_alloc_windows = []
+
+_PAGE_KB = resource.getpagesize() // 1024 if resource is not None else 4
+
+
+def _process_max_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux — в килобайтах
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _current_rss_kb():
+    """Текущий объём памяти процесса (только Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _AllocWindow:
+    """Окно замера пика tracemalloc одного этапа"""
+
+    def __init__(self, start, valid):
+        self.thread = threading.get_ident()
+        self.start = start
+        self.peak = start
+        self.valid = valid
+
+
+def _open_alloc_window():
+    """Начинает замер пика выделенной памяти этапа.
+
+    Перед reset_peak пик переносится в открытые окна: вложенные этапы одного
+    потока (например, write вокруг template и table) не теряют его. Окна,
+    открытые в других потоках, помечаются недействительными."""
+    thread = threading.get_ident()
+    with _alloc_lock:
+        current, peak = tracemalloc.get_traced_memory()
+        valid = True
+        for window in _alloc_windows:
+            window.peak = max(window.peak, peak)
+            if window.thread != thread:
+                window.valid = valid = False
+        window = _AllocWindow(current, valid)
+        _alloc_windows.append(window)
+        tracemalloc.reset_peak()
+    return window
+
+
+def _close_alloc_window(window):
+    """Пик выделенной памяти этапа, КБ, или None, если этап пересекался с другим потоком"""
+    with _alloc_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _alloc_windows.remove(window)
+    if not window.valid:
+        return None
+    return max(0, max(window.peak, peak) - window.start) / 1024
+
+
+@dataclass
+class StageTiming:
+    """Замер одного этапа"""
+    name: str
+    wall_s: float  # Время по часам, с
+    cpu_s: float  # Процессорное время потока, выполнявшего этап, с
+    process_max_rss_kb: int = None
+    peak_alloc_kb: float = None
+    background: bool = False  # Этап выполнялся в фоне (график в другом потоке или процессе)
+    rss_delta_kb: int = None
+
+
+@dataclass
+class ReportMetrics:
+    """Замеры создания одного отчёта"""
+    report: str = ""  # Имя файла отчёта
+    started_at: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+    stages: list = field(default_factory=list)
+    wall_s: float = 0.0  # Время создания отчёта целиком
+    cpu_s: float = 0.0  # Процессорное время процесса
+    process_max_rss_kb: int = None
+    info: dict = field(default_factory=dict)  # Параметры отчёта: число строк, график, кэш...
+    error: str = None
+
+    def add(self, name, wall_s, cpu_s, background=False, peak_alloc_kb=None, rss_delta_kb=None):
+        stage = StageTiming(name, wall_s, cpu_s, _process_max_rss_kb(), peak_alloc_kb, background, rss_delta_kb)
+        self.stages.append(stage)
+        return stage
+
+    def stage_totals(self):
+        """Суммарное время по именам этапов: {имя: (время, процессорное время)}"""
+        totals = {}
+        for stage in self.stages:
+            wall_s, cpu_s = totals.get(stage.name, (0.0, 0.0))
+            totals[stage.name] = (wall_s + stage.wall_s, cpu_s + stage.cpu_s)
+        return totals
+
+    def to_dict(self):
+        return asdict(self)
+
+    def format(self):
+        """Таблица этапов для вывода в консоль"""
+        lines = [f"{'этап':<14} {'время, мс':>10} {'ЦП, мс':>8} {'ΔRSS, МБ':>11}"]
+        for stage in self.stages:
+            memory = f"{stage.rss_delta_kb / 1024:+.1f}" if stage.rss_delta_kb is not None else "-"
+            if stage.peak_alloc_kb is not None:
+                memory += f" (пик {stage.peak_alloc_kb / 1024:.1f})"
+            name = f"{stage.name}*" if stage.background else stage.name
+            lines.append(f"{name:<14} {stage.wall_s * 1000:>10.1f} {stage.cpu_s * 1000:>8.1f} {memory:>11}")
+        lines.append(f"{'всего':<14} {self.wall_s * 1000:>10.1f} {self.cpu_s * 1000:>8.1f}")
+        if self.process_max_rss_kb is not None:
+            lines.append(f"наибольшая память процесса за всё время: {self.process_max_rss_kb / 1024:.1f} МБ")
+        if any(stage.background for stage in self.stages):
+            lines.append("* — в фоне, одновременно с другими этапами")
+        return "\n".join(lines)
+
+
+class MetricsRecorder:
+    """Записывает этапы в ReportMetrics: recorder.stage("table") — контекстный менеджер"""
+
+    def __init__(self, metrics=None, trace_memory=None):
+        self.metrics = metrics if metrics is not None else ReportMetrics()
+        self.trace_memory = TRACE_MEMORY if trace_memory is None else trace_memory
+        self._started_tracing = False
+        self._start = None
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._start = (time.perf_counter(), time.process_time())
+        return self
+
+    def finish(self, error=None):
+        wall_start, cpu_start = self._start
+        self.metrics.wall_s = time.perf_counter() - wall_start
+        self.metrics.cpu_s = time.process_time() - cpu_start
+        self.metrics.process_max_rss_kb = _process_max_rss_kb()
+        if error is not None:
+            self.metrics.error = f"{type(error).__name__}: {error}"
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return self.metrics
+
+    @contextmanager
+    def stage(self, name):
+        window = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            window = _open_alloc_window()
+        rss_start = _current_rss_kb()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall_s = time.perf_counter() - wall_start
+            cpu_s = time.thread_time() - cpu_start
+            rss_end = _current_rss_kb()
+            rss_delta_kb = rss_end - rss_start if rss_start is not None and rss_end is not None else None
+            peak_alloc_kb = _close_alloc_window(window) if window is not None else None
+            self.metrics.add(name, wall_s, cpu_s, peak_alloc_kb=peak_alloc_kb, rss_delta_kb=rss_delta_kb)
+
+
+class _NullRecorder:
+    """Заглушка: этапы вне create_gidroisolation_report не замеряются"""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+
+NULL_RECORDER = _NullRecorder()
+
+
+def write_metrics_log(metrics, path=None):
+    """Дописывает замеры отчёта строкой JSON в журнал (по умолчанию METRICS_LOG_PATH)"""
+    path = path or METRICS_LOG_PATH
+    if not path:
+        return
+    line = json.dumps(metrics.to_dict(), ensure_ascii=False, default=str)
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"Не удалось записать замеры отчёта в журнал: {e}")
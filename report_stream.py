@@ -0,0 +1,361 @@
+"""Потоковое создание отчёта для длинных серий измерений.
+
+В обычном режиме все ячейки листа хранятся в памяти до сохранения, и для
+мониторинга с тысячами точек отрыва это долго и требует много памяти.
+Потоковый режим пишет лист openpyxl в режиме только записи (write_only):
+сначала строки шаблона с шапкой, затем строки таблицы прямо из генератора
+значений силы, затем график и выводы. В памяти находятся только текущая
+порция значений, итоговые суммы статистики (AdhesionAccumulator) и
+прореженный ряд для графика, поэтому расход памяти не зависит от числа
+измерений.
+
+Отличия от обычного режима:
+- ячейки «Значение силы» и «Величина адгезии» в строках не объединяются,
+  а центрируются по выделению (centerContinuous): объединения по строкам
+  пришлось бы хранить в памяти до сохранения файла;
+- среднее значение адгезии записывается формулой по именованному диапазону
+  ADHESION_RANGE_NAME: к первой строке таблицы оно ещё не известно;
+- на графике не больше MAX_CHART_POINTS точек (средние по группам соседних
+  измерений).
+"""
+import os
+from copy import copy
+from itertools import islice
+
+import numpy as np
+import openpyxl
+from openpyxl.cell.cell import Cell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.drawing.image import Image
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter, quote_sheetname
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.pagebreak import Break
+
+from adhesion_stats import AdhesionAccumulator
+from template_cache import get_compiled_template
+
+
+# Сколько значений силы читается из генератора за один раз
+STREAM_CHUNK_SIZE = 4096
+
+# Наибольшее число точек на графике потокового отчёта
+MAX_CHART_POINTS = 2000
+
+# Именованный диапазон величин адгезии для формул среднего, минимума и максимума
+ADHESION_RANGE_NAME = "adhesion_values"
+
+# Формулы вместо значений статистики, которые к началу таблицы ещё не известны
+STREAM_FORMULAS = {
+    "average": f"=ROUND(AVERAGE({ADHESION_RANGE_NAME}),2)",
+    "min": f"=MIN({ADHESION_RANGE_NAME})",
+    "max": f"=MAX({ADHESION_RANGE_NAME})",
+}
+
+
+class ChartSeriesReducer:
+    """Прореживает ряд для графика: не больше max_points точек при любой длине серии.
+
+    Точки объединяются в группы по bucket_size соседних измерений, на
+    график идут средние по группам. Когда групп становится больше
+    max_points, соседние группы сливаются попарно и размер группы
+    удваивается. Пока точек не больше max_points, ряд не меняется.
+    """
+
+    def __init__(self, max_points=MAX_CHART_POINTS):
+        self.max_points = max_points
+        self.bucket_size = 1
+        self._number_sums = np.empty(0)
+        self._value_sums = np.empty(0)
+        self._counts = np.empty(0)
+        self._pending_numbers = np.empty(0)
+        self._pending_values = np.empty(0)
+
+    def add(self, numbers, values):
+        numbers = np.concatenate((self._pending_numbers, np.asarray(numbers, dtype=float)))
+        values = np.concatenate((self._pending_values, np.asarray(values, dtype=float)))
+        full = len(values) // self.bucket_size * self.bucket_size
+        if full:
+            self._number_sums = np.concatenate(
+                (self._number_sums, numbers[:full].reshape(-1, self.bucket_size).sum(axis=1)))
+            self._value_sums = np.concatenate(
+                (self._value_sums, values[:full].reshape(-1, self.bucket_size).sum(axis=1)))
+            self._counts = np.concatenate((self._counts, np.full(full // self.bucket_size, self.bucket_size)))
+        self._pending_numbers = numbers[full:]
+        self._pending_values = values[full:]
+        while len(self._counts) > self.max_points:
+            self._merge_pairs()
+
+    def _merge_pairs(self):
+        even = len(self._counts) // 2 * 2
+        merged = []
+        for sums in (self._number_sums, self._value_sums, self._counts):
+            merged.append(np.concatenate((sums[0:even:2] + sums[1:even:2], sums[even:])))
+        self._number_sums, self._value_sums, self._counts = merged
+        self.bucket_size *= 2
+
+    def series(self):
+        """Возвращает (номера участков, величины адгезии) для графика"""
+        number_sums = self._number_sums
+        value_sums = self._value_sums
+        counts = self._counts
+        if len(self._pending_values):
+            number_sums = np.append(number_sums, self._pending_numbers.sum())
+            value_sums = np.append(value_sums, self._pending_values.sum())
+            counts = np.append(counts, len(self._pending_values))
+        numbers = np.rint(number_sums / counts).astype(int)
+        return [int(number) for number in numbers], [float(value) for value in value_sums / counts]
+
+
+class _RowChunk:
+    """Порция строк таблицы для функций ROW_VALUES.
+
+    Передаётся в них и как отчёт (values), и как статистика (adhesion,
+    conforms): номер строки внутри порции индексирует все три массива.
+    """
+    __slots__ = ("values", "adhesion", "conforms")
+
+    def __init__(self, values, adhesion, conforms):
+        self.values = values
+        self.adhesion = adhesion
+        self.conforms = conforms
+
+
+class StreamingReportWriter:
+    """Записывает отчёт построчно в книгу openpyxl в режиме только записи"""
+
+    def __init__(self, report, chunk_size=STREAM_CHUNK_SIZE, max_chart_points=MAX_CHART_POINTS):
+        self.report = report
+        self.layout = report.layout
+        self.chunk_size = chunk_size
+        self.max_chart_points = max_chart_points
+        self.wb = None
+        self.ws = None
+        self._pending = {}  # {строка: {столбец: Cell}} — строки шаблона, ещё не записанные в поток
+        self._next_row = 1
+        self._kept_dimensions = set()  # Строки, высота которых задана шаблоном или макетом
+        self._styles = {}  # {(id шрифта, id выравнивания): StyleArray}
+
+    def _open(self, page_name, template_path):
+        """Создаёт потоковую книгу по шаблону"""
+        if template_path and os.path.exists(template_path):
+            compiled = get_compiled_template(template_path)
+            self.wb, self.ws = compiled.create_write_only(page_name)
+            self._pending = compiled.write_only_rows(self.ws)
+        else:
+            self.wb = openpyxl.Workbook(write_only=True)
+            self.ws = self.wb.create_sheet(page_name)
+            self._pending = {}
+
+    def _style_of(self, font, alignment):
+        """Возвращает готовый StyleArray для сочетания шрифта и выравнивания.
+
+        Назначение font/alignment ячейке каждый раз ищет стиль в таблицах
+        книги; для строк таблицы стиль вычисляется один раз на столбец.
+        """
+        key = (id(font), id(alignment))
+        style = self._styles.get(key)
+        if style is None:
+            cell = Cell(self.ws)
+            if font is not None:
+                cell.font = font
+            if alignment is not None:
+                cell.alignment = alignment
+            style = self._styles[key] = cell._style
+        return style
+
+    def _put(self, row, column, value, font=None, alignment=None):
+        """Записывает значение в ещё не выданную строку, сохраняя оформление шаблона"""
+        if row < self._next_row:
+            raise ValueError(f"Строка {row} уже записана в потоковый отчёт")
+        cells = self._pending.get(row)
+        cell = cells.get(column) if cells else None
+        if cell is None:
+            # Новая ячейка сразу получает готовый стиль
+            style = self._style_of(font, alignment) if font is not None or alignment is not None else None
+            cell = Cell(self.ws, row=row, column=column, value=value,
+                        style_array=StyleArray(style) if style is not None else None)
+            self._pending.setdefault(row, {})[column] = cell
+            return
+        # Ячейка шаблона: оформление шаблона дополняется шрифтом и выравниванием
+        cell.value = value
+        if font is not None:
+            cell.font = font
+        if alignment is not None:
+            cell.alignment = alignment
+
+    def _append(self, height=None):
+        """Выдаёт в поток очередную строку с ячейками из _pending"""
+        row = self._next_row
+        cells = self._pending.pop(row, None)
+        values = []
+        if cells:
+            values = [None] * max(cells)
+            for column, cell in cells.items():
+                values[column - 1] = cell
+
+        # Высоту отдельных строк таблицы задаём только на время записи строки,
+        # чтобы не копить по объекту RowDimension на каждое измерение
+        transient = height is not None and row not in self._kept_dimensions
+        if height is not None:
+            self.ws.row_dimensions[row].height = height
+        self.ws.append(values)
+        if transient:
+            del self.ws.row_dimensions[row]
+        self._next_row += 1
+
+    def _flush_until(self, row):
+        """Выдаёт все строки до row (не включая): строки шаблона или пустые"""
+        while self._next_row < row:
+            self._append()
+
+    def _write_plan(self, plan):
+        """Выдаёт в поток план части отчёта (SectionPlan макета)"""
+        for row, column, value, font, alignment in plan.cells:
+            self._put(row, column, value, font, alignment)
+        for start_row, start_column, end_row, end_column in plan.merges:
+            self.ws.merged_cells.add(CellRange(min_col=start_column, min_row=start_row,
+                                               max_col=end_column, max_row=end_row))
+        for row in plan.breaks:
+            self.ws.row_breaks.append(Break(id=row))
+        rows = plan.rows
+        if not rows:
+            return
+        self._flush_until(rows[0])
+        while self._next_row <= rows[-1]:
+            row = self._next_row
+            self._append(plan.heights.get(row, plan.min_heights.get(row)))
+
+    def write(self, measurements, page_name="Отчёт", organisation_header_image_path=None,
+              formula_image_path=None, template_path=None, user_info=None, output=None):
+        """Создаёт отчёт по значениям силы из measurements и сохраняет его.
+
+        measurements — любой итерируемый источник (генератор, файл и т. п.),
+        читается один раз порциями по chunk_size. output — двоичный поток
+        для отчёта вместо файла. Возвращает путь к отчёту или output.
+        Этапы замеряются в report.metrics (см. create_streaming_report);
+        этап table включает и чтение значений из measurements.
+        """
+        report = self.report
+        layout = self.layout
+        recorder = report._recorder
+        measurements = iter(measurements)
+        chunk = list(islice(measurements, self.chunk_size))
+        if not chunk:
+            raise ValueError("Нет значений силы для расчёта адгезии")
+
+        if not (template_path and os.path.exists(template_path)):
+            template_path = layout.template_path
+        with recorder.stage("template"):
+            self._open(page_name, template_path)
+        ws = self.ws
+        with recorder.stage("images"):
+            report.insert_images(ws, organisation_header_image_path, formula_image_path)
+
+        with recorder.stage("table"):
+            # Шапка и составитель отчёта записываются в строки шаблона до таблицы
+            start_row = layout.start_row
+            header = list(layout.header)
+            if user_info is not None and layout.user_info_cell:
+                header.append((layout.user_info_cell, None))
+            for coordinate, name in header:
+                row, column = coordinate_to_tuple(coordinate)
+                if row >= start_row:
+                    raise ValueError(f"Ячейка {coordinate} ниже начала таблицы: потоковый режим её не поддерживает")
+                self._put(row, column, user_info if name is None else getattr(report, name))
+            for row, height in layout.row_heights:
+                ws.row_dimensions[row].height = height
+            self._kept_dimensions = set(ws.row_dimensions)
+            self._flush_until(start_row)
+
+            accumulator = AdhesionAccumulator(report.square, report.normative_value)
+            reducer = ChartSeriesReducer(self.max_chart_points)
+            adhesion_column = None
+            continuous = {}
+            for column in layout.columns:
+                if column.value == "adhesion":
+                    adhesion_column = column.first_column
+                if column.per_row and column.last_column != column.first_column:
+                    alignment = copy(column.alignment)
+                    alignment.horizontal = "centerContinuous"
+                    continuous[column.first_column] = alignment
+
+            count = 0
+            while chunk:
+                adhesion, conforms = accumulator.add(chunk)
+                reducer.add(np.arange(count + 1, count + len(chunk) + 1), adhesion)
+                rows = _RowChunk(chunk, adhesion, conforms)
+
+                for i in range(len(chunk)):
+                    row = start_row + count + i
+                    for column in layout.columns:
+                        if column.per_row:
+                            if column.formula is not None:
+                                value = column.formula.format(first_row=start_row, row=row)
+                            elif column.value == "plot_number":
+                                value = count + i + 1
+                            else:
+                                value = column.row_value(rows, rows, i)
+                            alignment = continuous.get(column.first_column, column.alignment)
+                            self._put(row, column.first_column, value, alignment=alignment)
+                            for blank_column in range(column.first_column + 1, column.last_column + 1):
+                                self._put(row, blank_column, None, alignment=alignment)
+                        elif row == start_row:
+                            if column.formula is not None:
+                                value = column.formula.format(first_row=start_row, row=row)
+                            elif column.value in STREAM_FORMULAS:
+                                value = STREAM_FORMULAS[column.value]
+                            else:
+                                value = getattr(report, column.value)
+                            self._put(row, column.first_column, value, column.font, column.alignment)
+                    self._append(layout.row_height)
+
+                count += len(chunk)
+                chunk = list(islice(measurements, self.chunk_size))
+
+            table_end_row = start_row + count - 1
+            report.table_end_row = table_end_row
+            report.sootv_status = "соответствет" if accumulator.all_conform else "не соответствует"
+
+            # Объединения столбцов «на всю таблицу» известны только теперь
+            for column in layout.columns:
+                if not column.per_row and (column.last_column != column.first_column or table_end_row != start_row):
+                    ws.merged_cells.add(CellRange(min_col=column.first_column, min_row=start_row,
+                                                  max_col=column.last_column, max_row=table_end_row))
+            if adhesion_column is not None:
+                letter = get_column_letter(adhesion_column)
+                ws.defined_names[ADHESION_RANGE_NAME] = DefinedName(
+                    ADHESION_RANGE_NAME,
+                    attr_text=f"{quote_sheetname(ws.title)}!${letter}${start_row}:${letter}${table_end_row}")
+
+        with recorder.stage("chart"):
+            plot_numbers, adhesion_values = reducer.series()
+            normative_value = float(report.normative_value) if report.normative_value else 0.1
+            series = (plot_numbers, adhesion_values, accumulator.mean, normative_value,
+                      accumulator.lower_bound, accumulator.upper_bound)
+            chart_cell = layout.chart_anchor(table_end_row)
+            try:
+                if report.get_chart_backend() == "native":
+                    ws.add_chart(report.create_native_adhesion_chart(self.wb, series), chart_cell)
+                else:
+                    chart_image = Image(report.create_adhesion_chart(series))
+                    chart_image.width = report.chart_width
+                    chart_image.height = report.chart_height
+                    ws.add_image(chart_image, chart_cell)
+                self._write_plan(layout.chart_frame_plan(table_end_row))
+            except Exception as e:
+                print(f"Ошибка при создании и вставке графика: {e}")
+                import traceback
+                traceback.print_exc()
+                report.stage_errors.append(("chart", str(e)))
+
+        with recorder.stage("conclusion"):
+            conclusion = layout.conclusion_plan(report, accumulator, table_end_row)
+            self._write_plan(conclusion)
+            report.last_cell = conclusion.last_cell
+            self._flush_until(max(self._pending, default=0) + 1)
+        with recorder.stage("print_area"):
+            layout.apply_page_setup(ws, conclusion.last_cell)
+
+        with recorder.stage("save"):
+            return report.save_workbook_to(self.wb, output)
@@ -0,0 +1,344 @@
+import os
+import pickle
+import threading
+from pathlib import Path
+
+import openpyxl
+from openpyxl.cell.cell import Cell, MergedCell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.named_styles import NamedStyle, NamedStyleList
+from openpyxl.utils.indexed_list import IndexedList
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.merge import MergedCellRange
+from openpyxl.worksheet.dimensions import ColumnDimension, RowDimension
+from openpyxl.xml.functions import tostring, fromstring
+
+from report_cache import CACHE_ROOT, file_content_hash
+
+
+# Папка для сохранённых на диске скомпилированных шаблонов
+TEMPLATE_CACHE_DIR = CACHE_ROOT / "templates"
+
+# Версия формата скомпилированного шаблона (меняется при изменении компилятора)
+COMPILER_VERSION = 2
+
+# Настройки листа, которые переносятся из шаблона (атрибут листа -> класс openpyxl)
+SHEET_SETTINGS = (
+    "sheet_properties",
+    "sheet_format",
+    "page_setup",
+    "print_options",
+    "page_margins",
+    "HeaderFooter",
+    "row_breaks",
+    "col_breaks",
+)
+
+
+def _named_style_copy(named_style):
+    """Возвращает непривязанную к книге копию именованного стиля"""
+    return NamedStyle(
+        name=named_style.name,
+        font=named_style.font,
+        fill=named_style.fill,
+        border=named_style.border,
+        alignment=named_style.alignment,
+        number_format=named_style.number_format,
+        protection=named_style.protection,
+        builtinId=named_style.builtinId,
+        hidden=named_style.hidden,
+    )
+
+
+class CompiledTemplate:
+    """Скомпилированный шаблон отчёта: готовый к клонированию «скелет» листа.
+
+    Хранит таблицы стилей исходной книги (шрифты, заливки, границы,
+    выравнивания, форматы чисел, именованные стили) и для каждой ячейки —
+    номер стиля в карте уникальных стилей. При клонировании таблицы
+    переносятся в новую книгу целиком, а ячейкам назначаются готовые
+    индексы стилей: новых объектов Font/Border/... не создаётся.
+    Также переносятся ширины столбцов, высоты строк, объединения,
+    параметры печати и свойства листа.
+    """
+
+    def __init__(self, source_hash, style_tables, named_styles, styles, cells,
+                 column_dimensions, row_dimensions, merged_ranges, sheet_settings):
+        self.source_hash = source_hash
+        self.style_tables = style_tables  # {"_fonts": [...], "_fills": [...], ...}
+        self.named_styles = named_styles  # [NamedStyle, ...] в порядке xfId
+        self.styles = styles  # [кортеж StyleArray, ...] уникальные стили ячеек
+        self.cells = cells  # [(row, column, value, data_type, номер стиля или None, объединена ли), ...]
+        self.column_dimensions = column_dimensions  # [(параметры ColumnDimension, номер стиля), ...]
+        self.row_dimensions = row_dimensions  # [(параметры RowDimension, номер стиля), ...]
+        self.merged_ranges = merged_ranges  # ["A1:B2", ...]
+        self.sheet_settings = sheet_settings  # {атрибут листа: (класс, xml)}
+
+    @property
+    def cell_count(self):
+        return len(self.cells)
+
+    def clone(self, page_name="Отчёт"):
+        """Создаёт новую книгу по шаблону и возвращает её"""
+        result_wb = openpyxl.Workbook()
+        result_ws = result_wb.active
+        result_ws.title = page_name
+
+        # Таблицы стилей переносятся по ссылке на объекты стилей
+        for attr, values in self.style_tables.items():
+            setattr(result_wb, attr, IndexedList(values))
+        result_wb._cell_styles = IndexedList([StyleArray()])
+        result_wb._named_styles = NamedStyleList()
+        for named_style in self.named_styles:
+            named_style = _named_style_copy(named_style)
+            result_wb._named_styles.append(named_style)
+            named_style.bind(result_wb)
+
+        # Ячейки создаются напрямую с готовыми индексами стилей
+        styles = self.styles
+        result_cells = result_ws._cells
+        for row, column, value, data_type, style_id, merged in self.cells:
+            style_array = StyleArray(styles[style_id]) if style_id is not None else None
+            if merged:
+                new_cell = MergedCell(result_ws, row, column)
+                if style_array is not None:
+                    new_cell._style = style_array
+            else:
+                new_cell = Cell(result_ws, row=row, column=column, style_array=style_array)
+                new_cell._value = value
+                new_cell.data_type = data_type
+            result_cells[(row, column)] = new_cell
+
+        # Объединённые ячейки уже созданы со стилями шаблона, поэтому
+        # диапазоны добавляются без пересоздания ячеек и границ
+        for merged_range in self.merged_ranges:
+            result_ws.merged_cells.add(MergedCellRange(result_ws, merged_range))
+
+        for params, style_id in self.column_dimensions:
+            dimension = ColumnDimension(result_ws, **params)
+            if style_id is not None:
+                dimension._style = StyleArray(styles[style_id])
+            result_ws.column_dimensions[params["index"]] = dimension
+
+        for params, style_id in self.row_dimensions:
+            dimension = RowDimension(result_ws, **params)
+            if style_id is not None:
+                dimension._style = StyleArray(styles[style_id])
+            result_ws.row_dimensions[params["index"]] = dimension
+
+        for attr, (settings_class, xml) in self.sheet_settings.items():
+            setattr(result_ws, attr, settings_class.from_tree(fromstring(xml)))
+        result_ws.page_setup._parent = result_ws
+
+        result_ws.protection.sheet = False
+        return result_wb
+
+    def create_write_only(self, page_name="Отчёт"):
+        """Создаёт книгу только для записи (потоковую) с оформлением шаблона.
+
+        Переносятся таблицы стилей, размеры столбцов и строк, объединения
+        и параметры печати. Ячейки шаблона не записываются: их строки
+        возвращает write_only_rows(), и записывать их нужно по порядку
+        вместе с остальными строками отчёта. Возвращает (книга, лист).
+        """
+        result_wb = openpyxl.Workbook(write_only=True)
+        result_ws = result_wb.create_sheet(page_name)
+
+        for attr, values in self.style_tables.items():
+            setattr(result_wb, attr, IndexedList(values))
+        result_wb._cell_styles = IndexedList([StyleArray()])
+        result_wb._named_styles = NamedStyleList()
+        for named_style in self.named_styles:
+            named_style = _named_style_copy(named_style)
+            result_wb._named_styles.append(named_style)
+            named_style.bind(result_wb)
+
+        # На потоковом листе нет ячеек, объединения хранятся только как диапазоны
+        styles = self.styles
+        for merged_range in self.merged_ranges:
+            result_ws.merged_cells.add(CellRange(merged_range))
+
+        for params, style_id in self.column_dimensions:
+            dimension = ColumnDimension(result_ws, **params)
+            if style_id is not None:
+                dimension._style = StyleArray(styles[style_id])
+            result_ws.column_dimensions[params["index"]] = dimension
+
+        for params, style_id in self.row_dimensions:
+            dimension = RowDimension(result_ws, **params)
+            if style_id is not None:
+                dimension._style = StyleArray(styles[style_id])
+            result_ws.row_dimensions[params["index"]] = dimension
+
+        for attr, (settings_class, xml) in self.sheet_settings.items():
+            setattr(result_ws, attr, settings_class.from_tree(fromstring(xml)))
+        result_ws.page_setup._parent = result_ws
+
+        result_ws.protection.sheet = False
+        return result_wb, result_ws
+
+    def write_only_rows(self, ws):
+        """Возвращает ячейки шаблона для листа только для записи: {строка: {столбец: Cell}}.
+
+        Объединённые ячейки с оформлением записываются как пустые ячейки
+        с тем же стилем (границы объединённых областей сохраняются).
+        """
+        styles = self.styles
+        rows = {}
+        for row, column, value, data_type, style_id, merged in self.cells:
+            if merged and style_id is None:
+                continue
+            style_array = StyleArray(styles[style_id]) if style_id is not None else None
+            new_cell = Cell(ws, row=row, column=column, style_array=style_array)
+            if not merged:
+                new_cell._value = value
+                new_cell.data_type = data_type
+            rows.setdefault(row, {})[column] = new_cell
+        return rows
+
+
+def compile_template(template_path, source_hash=None):
+    """Компилирует xlsx-шаблон в CompiledTemplate"""
+    source_wb = openpyxl.load_workbook(template_path)
+    source_ws = source_wb.active  # Получаем лист с изображением
+
+    style_tables = {
+        attr: list(getattr(source_wb, attr))
+        for attr in ("_fonts", "_fills", "_borders", "_alignments", "_protections", "_number_formats")
+    }
+    named_styles = [_named_style_copy(named_style) for named_style in source_wb._named_styles]
+
+    # Карта уникальных стилей: одинаковое оформление хранится один раз
+    styles = []
+    style_map = {}
+
+    def style_id_of(styleable):
+        if not styleable.has_style:
+            return None
+        key = tuple(styleable._style)
+        style_id = style_map.get(key)
+        if style_id is None:
+            style_id = style_map[key] = len(styles)
+            styles.append(key)
+        return style_id
+
+    cells = []
+    for row in source_ws.iter_rows():
+        for cell in row:
+            merged = isinstance(cell, MergedCell)
+            if merged:
+                cells.append((cell.row, cell.column, None, None, style_id_of(cell), True))
+            else:
+                cells.append((cell.row, cell.column, cell._value, cell.data_type, style_id_of(cell), False))
+
+    column_dimensions = [
+        (dict(index=letter, width=dimension.width, bestFit=dimension.bestFit,
+              hidden=dimension.hidden, outlineLevel=dimension.outlineLevel,
+              collapsed=dimension.collapsed, min=dimension.min, max=dimension.max),
+         style_id_of(dimension))
+        for letter, dimension in source_ws.column_dimensions.items()
+    ]
+    row_dimensions = [
+        (dict(index=index, ht=dimension.ht, hidden=dimension.hidden,
+              outlineLevel=dimension.outlineLevel, collapsed=dimension.collapsed),
+         style_id_of(dimension))
+        for index, dimension in source_ws.row_dimensions.items()
+    ]
+    merged_ranges = [str(merged_range) for merged_range in source_ws.merged_cells.ranges]
+
+    sheet_settings = {}
+    for attr in SHEET_SETTINGS:
+        settings = getattr(source_ws, attr)
+        sheet_settings[attr] = (type(settings), tostring(settings.to_tree()))
+
+    return CompiledTemplate(source_hash, style_tables, named_styles, styles, cells,
+                            column_dimensions, row_dimensions, merged_ranges, sheet_settings)
+
+
+class TemplateCache:
+    """Кэш скомпилированных шаблонов.
+
+    Ключ — абсолютный путь к файлу и SHA-256 содержимого (файл хэшируется
+    заново, только если изменились его время изменения или размер);
+    на диске шаблон хранится под SHA-256, версией компилятора и версией openpyxl.
+    Шаблоны хранятся в памяти и, если задан cache_dir, сохраняются на диск,
+    чтобы следующий запуск программы не компилировал их заново.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries = {}  # {абсолютный путь: (hash, CompiledTemplate)}
+        self._lock = threading.Lock()
+
+    def get(self, template_path):
+        """Возвращает скомпилированный шаблон, компилируя его при необходимости"""
+        path = os.path.abspath(template_path)
+        source_hash = file_content_hash(path)
+        if source_hash is None:
+            raise FileNotFoundError(f"Шаблон не найден: {path}")
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == source_hash:
+                return entry[1]
+
+        compiled = self._load_from_disk(source_hash)
+        if compiled is None:
+            compiled = compile_template(path, source_hash)
+            self._save_to_disk(compiled)
+
+        with self._lock:
+            self._entries[path] = (source_hash, compiled)
+        return compiled
+
+    def invalidate(self, template_path=None):
+        """Сбрасывает кэш для шаблона (или весь кэш, если путь не указан)"""
+        with self._lock:
+            if template_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(template_path), None)
+
+    def _disk_path(self, source_hash):
+        # В шаблоне сохранены объекты openpyxl: после обновления openpyxl он компилируется заново
+        return self.cache_dir / f"{source_hash}.v{COMPILER_VERSION}.openpyxl-{openpyxl.__version__}.pickle"
+
+    def _load_from_disk(self, source_hash):
+        if not self.cache_dir:
+            return None
+        disk_path = self._disk_path(source_hash)
+        if not disk_path.exists():
+            return None
+        try:
+            with open(disk_path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"Не удалось загрузить шаблон из кэша: {e}")
+            return None
+
+    def _save_to_disk(self, compiled):
+        if not self.cache_dir:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            disk_path = self._disk_path(compiled.source_hash)
+            temp_path = disk_path.with_name(f"{disk_path.name}.{os.getpid()}.tmp")
+            with open(temp_path, "wb") as f:
+                pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, disk_path)
+        except Exception as e:
+            print(f"Не удалось сохранить шаблон в кэш: {e}")
+
+
+# Общий кэш шаблонов приложения
+template_cache = TemplateCache(TEMPLATE_CACHE_DIR)
+
+
+def get_compiled_template(template_path):
+    """Возвращает скомпилированный шаблон из общего кэша"""
+    return template_cache.get(template_path)
+
+
+def invalidate_template(template_path=None):
+    """Сбрасывает общий кэш для шаблона (например, после его замены)"""
+    template_cache.invalidate(template_path)
@@ -0,0 +1,158 @@
+"""Тесты статистики адгезии: compute, combine и потоковый AdhesionAccumulator"""
+import math
+
+import numpy as np
+import pytest
+
+from adhesion_stats import (
+    AdhesionAccumulator, adhesion_of, combine_adhesion_stats, compute_adhesion_stats,
+)
+
+
+FORCES = [2.1, 2.4, 1.9, 2.6, 2.2, 3.0, 1.7, 2.5, 2.3]
+SQUARE = 25
+
+
+def test_compute_matches_formulas():
+    stats = compute_adhesion_stats(FORCES, SQUARE)
+    adhesion = np.array(FORCES) * 1000 / (SQUARE * 100)
+
+    assert stats.count == len(FORCES)
+    assert stats.plot_numbers == list(range(1, len(FORCES) + 1))
+    np.testing.assert_allclose(stats.adhesion, adhesion)
+    assert stats.mean == pytest.approx(adhesion.mean())
+    assert stats.std == pytest.approx(adhesion.std(ddof=1))
+    assert stats.cv == pytest.approx(adhesion.std(ddof=1) / adhesion.mean())
+    assert stats.min == pytest.approx(adhesion.min())
+    assert stats.max == pytest.approx(adhesion.max())
+    assert stats.lower_bound == pytest.approx(adhesion.mean() * 0.85)
+    assert stats.upper_bound == pytest.approx(adhesion.mean() * 1.15)
+    np.testing.assert_array_equal(
+        stats.within_band, (adhesion >= stats.lower_bound) & (adhesion <= stats.upper_bound))
+
+
+def test_conformity_rule():
+    """Соответствие — как в исходной таблице отчёта: сила/(площадь*100) < норматив"""
+    normative = 0.0009
+    stats = compute_adhesion_stats(FORCES, SQUARE, normative)
+
+    expected = np.array(FORCES) / (SQUARE * 100) < normative
+    np.testing.assert_array_equal(stats.conforms, expected)
+    assert expected.any() and not expected.all()
+    assert not stats.all_conform
+    assert compute_adhesion_stats(FORCES, SQUARE).all_conform
+
+
+def test_compute_single_value():
+    stats = compute_adhesion_stats([2.0], SQUARE)
+
+    assert stats.count == 1
+    assert stats.mean == stats.min == stats.max == pytest.approx(0.8)
+    assert stats.std == 0.0
+    assert stats.cv == 0.0
+    assert stats.average_text == "0,8"
+
+
+def test_compute_empty_raises():
+    with pytest.raises(ValueError):
+        compute_adhesion_stats([], SQUARE)
+
+
+def test_compute_result_is_read_only():
+    stats = compute_adhesion_stats(FORCES, SQUARE)
+    with pytest.raises(ValueError):
+        stats.adhesion[0] = 0.0
+
+
+def test_combine_equals_single_compute():
+    whole = compute_adhesion_stats(FORCES, SQUARE)
+    combined = combine_adhesion_stats([
+        compute_adhesion_stats(FORCES[:4], SQUARE),
+        compute_adhesion_stats(FORCES[4:5], SQUARE),
+        compute_adhesion_stats(FORCES[5:], SQUARE),
+    ])
+
+    np.testing.assert_allclose(combined.forces, whole.forces)
+    np.testing.assert_allclose(combined.adhesion, whole.adhesion)
+    np.testing.assert_array_equal(combined.conforms, whole.conforms)
+    np.testing.assert_array_equal(combined.within_band, whole.within_band)
+    for name in ("mean", "std", "cv", "min", "max", "lower_bound", "upper_bound"):
+        assert getattr(combined, name) == pytest.approx(getattr(whole, name)), name
+    assert combined.square == SQUARE
+    assert combined.normative_value == whole.normative_value
+
+
+def test_combine_different_squares():
+    first = compute_adhesion_stats([2.0, 2.5], 25)
+    second = compute_adhesion_stats([2.0], 16)
+    combined = combine_adhesion_stats([first, second])
+
+    assert math.isnan(combined.square)
+    np.testing.assert_allclose(combined.adhesion, np.concatenate([first.adhesion, second.adhesion]))
+    assert combined.max == pytest.approx(adhesion_of(2.0, 16))
+
+
+def test_combine_single_and_empty():
+    stats = compute_adhesion_stats(FORCES, SQUARE)
+    assert combine_adhesion_stats([stats]) is stats
+    with pytest.raises(ValueError):
+        combine_adhesion_stats([])
+
+
+@pytest.mark.parametrize("chunks", [
+    [FORCES],
+    [FORCES[:1], FORCES[1:]],
+    [FORCES[:4], [], FORCES[4:]],
+    [[value] for value in FORCES],
+])
+def test_accumulator_equals_single_compute(chunks):
+    """Объединение дисперсии по порциям (алгоритм Чана) даёт то же, что расчёт по всей серии"""
+    whole = compute_adhesion_stats(FORCES, SQUARE)
+    accumulator = AdhesionAccumulator(SQUARE)
+    adhesion_parts = []
+    conforms_parts = []
+    for chunk in chunks:
+        adhesion, conforms = accumulator.add(chunk)
+        adhesion_parts.append(adhesion)
+        conforms_parts.append(conforms)
+
+    assert accumulator.count == whole.count
+    np.testing.assert_allclose(np.concatenate(adhesion_parts), whole.adhesion)
+    np.testing.assert_array_equal(np.concatenate(conforms_parts), whole.conforms)
+    for name in ("mean", "std", "cv", "min", "max", "lower_bound", "upper_bound"):
+        assert getattr(accumulator, name) == pytest.approx(getattr(whole, name)), name
+    assert accumulator.all_conform == whole.all_conform
+    assert accumulator.average_text == whole.average_text
+
+
+def test_accumulator_conformity_rule():
+    normative = 0.0009
+    accumulator = AdhesionAccumulator(SQUARE, normative)
+    accumulator.add(FORCES[:1])
+    assert accumulator.all_conform
+    accumulator.add(FORCES[1:])
+    assert not accumulator.all_conform
+    assert accumulator.all_conform == compute_adhesion_stats(FORCES, SQUARE, normative).all_conform
+
+
+def test_accumulator_single_value():
+    accumulator = AdhesionAccumulator(SQUARE)
+    accumulator.add([2.0])
+
+    assert accumulator.count == 1
+    assert accumulator.mean == accumulator.min == accumulator.max == pytest.approx(0.8)
+    assert accumulator.std == 0.0
+    assert accumulator.cv == 0.0
+
+
+def test_accumulator_empty():
+    accumulator = AdhesionAccumulator(SQUARE)
+    adhesion, conforms = accumulator.add([])
+
+    assert adhesion.size == 0 and conforms.size == 0
+    assert accumulator.count == 0
+    assert accumulator.mean == 0.0
+    assert accumulator.min is None and accumulator.max is None
+    assert accumulator.std == 0.0
+    assert accumulator.cv == 0.0
+    assert accumulator.all_conform
@@ -0,0 +1,97 @@
+"""Регрессионный тест макета гидроизоляции: объединённые ячейки таблицы и строки выводов.
+
+Ожидаемые значения сняты с отчёта, который строила программа до перевода
+на макеты (layouts/gidroisolation.json): четыре значения силы по умолчанию,
+график — диаграмма Excel, без изображений.
+"""
+import os
+
+import openpyxl
+import pytest
+from openpyxl.cell.cell import MergedCell
+
+import template_cache
+from betta_gidroisolation import Gidroisolation_report
+from report_layout import LAYOUTS_DIR, PROJECT_DIR, CompiledLayout, load_layout_spec
+
+
+TEMPLATE = os.path.join(PROJECT_DIR, "templates", "Гидроизоляция_gidroisolation_top.xlsx")
+
+# Объединённые ячейки таблицы 1 и выводов (шапка листа берётся из шаблона)
+TABLE_MERGES = {
+    "C64:Q64",
+    "D65:E65", "G65:H65", "I65:J65", "K65:L65", "M65:N65", "O65:P65", "V65:W66",
+    "D66:E66", "G66:H66", "I66:J66", "K66:L66", "M66:N66", "O66:P66",
+    "D67:E70", "F67:F70", "G67:H70", "I67:J70", "O67:P70", "Q67:Q70",
+    "K67:L67", "K68:L68", "K69:L69", "K70:L70",
+    "M67:N67", "M68:N68", "M69:N69", "M70:N70",
+    "C98:R99", "C100:R101", "D103:H103",
+}
+
+CONCLUSION_4_1 = ('="4.1. В рамках выполнения работ по договору "&U29&" с "&U27&" на объекте по адресу: '
+                  '"&U25&" проведены работы по испытанию сцепления гидроизоляционных материалов."')
+CONCLUSION_4_2 = ("4.2. По результатам проведённых работ, приведенных в таблице 1 установлено: что "
+                  "фактическое значение велечины адгезии испытанного материала на контролируемом "
+                  "участке составляет от 0.4 до 1.6 МПа, что соответствет требованиям "
+                  "СП 71.13330.2017 и номративной документации.\"")
+
+# Строки 97–103: {ячейка: (значение, жирный, размер шрифта, по горизонтали, по вертикали, перенос)}
+CONCLUSION_CELLS = {
+    "C97": ("4.ВЫВОДЫ.", True, 14, None, None, None),
+    "C98": (CONCLUSION_4_1, False, 14, "left", "top", True),
+    "C100": (CONCLUSION_4_2, False, 14, "left", "top", True),
+    "D103": ("=D37", False, 14, None, None, None),
+}
+CONCLUSION_HEIGHTS = {97: None, 98: 50, 99: None, 100: 50, 101: None, 102: None, 103: None}
+
+
+@pytest.fixture(scope="module")
+def report_sheet(tmp_path_factory):
+    """Отчёт по макету, скомпилированному из layouts/gidroisolation.json"""
+    work_dir = tmp_path_factory.mktemp("report")
+    layout_path = LAYOUTS_DIR / "gidroisolation.json"
+    layout = CompiledLayout(load_layout_spec(layout_path), str(layout_path))
+
+    cache = template_cache.TemplateCache(work_dir / "templates")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(template_cache, "template_cache", cache)
+        report = Gidroisolation_report(r_f="отчёт.xlsx", chart_backend="native", layout=layout,
+                                       output_dir=str(work_dir))
+        path = report.create_gidroisolation_report("Участок", None, None, TEMPLATE, use_cache=False)
+    assert not report.stage_errors
+    return openpyxl.load_workbook(path).active
+
+
+def test_table_and_conclusion_merges(report_sheet):
+    merges = {str(merged_range) for merged_range in report_sheet.merged_cells.ranges}
+    assert {merged_range for merged_range in merges
+            if report_sheet[merged_range.split(":")[0]].row >= 64} == TABLE_MERGES
+
+
+def test_per_row_merged_cells(report_sheet):
+    """Столбцы значения силы и адгезии объединены построчно, значение — в первой ячейке"""
+    for row, force in zip(range(67, 71), (1, 2, 3, 4)):
+        for first, second, value in (("K", "L", force), ("M", "N", force * 0.4)):
+            cell = report_sheet[f"{first}{row}"]
+            assert cell.value == pytest.approx(value)
+            assert (cell.alignment.horizontal, cell.alignment.vertical) == ("center", "center")
+            assert isinstance(report_sheet[f"{second}{row}"], MergedCell)
+        assert report_sheet.row_dimensions[row].height == 30
+
+
+@pytest.mark.parametrize("coordinate", sorted(CONCLUSION_CELLS))
+def test_conclusion_cells(report_sheet, coordinate):
+    value, bold, size, horizontal, vertical, wrap_text = CONCLUSION_CELLS[coordinate]
+    cell = report_sheet[coordinate]
+    assert cell.value == value
+    assert (cell.font.b, cell.font.sz) == (bold, size)
+    assert (cell.alignment.horizontal, cell.alignment.vertical, cell.alignment.wrap_text) == \
+        (horizontal, vertical, wrap_text)
+
+
+def test_conclusion_rows(report_sheet):
+    for row, height in CONCLUSION_HEIGHTS.items():
+        assert report_sheet.row_dimensions[row].height == height, row
+        values = {cell.coordinate for cell in report_sheet[row] if cell.value is not None}
+        assert values == {coordinate for coordinate in CONCLUSION_CELLS
+                          if report_sheet[coordinate].row == row}, row
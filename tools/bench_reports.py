@@ -0,0 +1,434 @@
+"""Набор бенчмарков создания отчётов и базы данных на синтетических данных.
+
+Отчёты (Gidroisolation_report.create_gidroisolation_report) замеряются
+при разных параметрах:
+  размер шаблона   — число дополнительных оформленных ячеек в шаблоне;
+  число измерений  — от 4 до 10 000 значений силы;
+  график           — с графиком или без него;
+  размер картинок  — шапка и формула в k раз больше размера на листе.
+По умолчанию каждый параметр меняется отдельно от базового случая
+(--full-matrix — все сочетания). База данных (Database) замеряется на
+синтетических объектах, приборах и пользователях.
+
+Каждый случай выполняется в отдельном процессе с отдельной рабочей папкой
+(кэши шаблонов и изображений не переходят из случая в случай), кэши готовых
+отчётов и графиков выключены. Для каждого случая сохраняются число отчётов
+в секунду, процентили времени по этапам (report.metrics), время первого
+отчёта, пиковый объём памяти процесса и размер файла. Случай, который не
+уложился в --case-timeout секунд, прерывается и считается ошибкой.
+
+Результаты записываются в JSON (--output) вместе со сведениями о версии
+программы и окружении; --compare сравнивает их с результатами прошлого запуска.
+
+Запуск из корня проекта:
+    python tools/bench_reports.py [--values 4,100,1000,10000] [--repeat 5] [--case-timeout 300]
+                                  [--output bench_results.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TEMPLATE = os.path.join(PROJECT_DIR, "templates", "Гидроизоляция_gidroisolation_top.xlsx")
+
+# Базовый случай: от него меняется по одному параметру
+BASELINE = {"template_cells": 0, "values": 100, "chart": True, "image_scale": 1}
+
+# Размер изображений на листе (как в макете гидроизоляции), точки
+HEADER_SIZE = (800, 175)
+FORMULA_SIZE = (145, 70)
+
+PERCENTILES = (50, 90, 99)
+
+# Наибольшее время одного случая (прогрев и все повторы), с
+CASE_TIMEOUT = 300
+
+
+# ========== Вспомогательные функции ==========
+
+def percentile(values, q):
+    """Процентиль q (0–100) с линейной интерполяцией"""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(samples):
+    """Сводка выборки времени, с: среднее, процентили и максимум"""
+    summary = {"mean": sum(samples) / len(samples), "max": max(samples)}
+    for q in PERCENTILES:
+        summary[f"p{q}"] = percentile(samples, q)
+    return summary
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux — в килобайтах
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_revision():
+    try:
+        process = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+                                 capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return process.stdout.strip() or None
+
+
+def package_version(name):
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+def environment_info():
+    """Сведения о версии программы и окружении для сравнения запусков"""
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": {name: package_version(name) for name in ("openpyxl", "matplotlib", "numpy", "Pillow")},
+        "chart_executor": os.environ.get("PSFOSL_CHART_EXECUTOR"),
+    }
+
+
+# ========== Синтетические входные данные ==========
+
+def make_template(template_path, extra_cells, work_dir):
+    """Копия шаблона с extra_cells дополнительными оформленными ячейками
+    в десяти столбцах справа от заполненной части листа"""
+    if not extra_cells:
+        return template_path
+    import openpyxl
+    from openpyxl.styles import Border, Font, PatternFill, Side
+
+    wb = openpyxl.load_workbook(template_path)
+    ws = wb.active
+    first_column = ws.max_column + 2
+    thin = Side(style="thin")
+    styles = [
+        (Font(bold=True), PatternFill("solid", start_color="DDEBF7"), Border(left=thin, right=thin)),
+        (Font(italic=True), PatternFill(), Border(top=thin, bottom=thin)),
+        (Font(name="Arial", size=9), PatternFill("solid", start_color="FFF2CC"), Border()),
+    ]
+    for index in range(extra_cells):
+        row, column = divmod(index, 10)
+        cell = ws.cell(row=row + 1, column=first_column + column, value=f"Ячейка {index}")
+        cell.font, cell.fill, cell.border = styles[index % len(styles)]
+    path = os.path.join(work_dir, f"template_{extra_cells}.xlsx")
+    wb.save(path)
+    return path
+
+
+def make_image(path, width, height, seed):
+    """PNG с шумом: плохо сжимается, как фотография или скан"""
+    from PIL import Image, ImageFilter
+
+    noise = Image.effect_noise((width, height), 64).filter(ImageFilter.GaussianBlur(1))
+    channels = (noise, noise.rotate(90 * seed), noise.transpose(Image.FLIP_LEFT_RIGHT))
+    Image.merge("RGB", channels).save(path)
+    return path
+
+
+def make_values(count, seed=0):
+    rnd = random.Random(seed)
+    return [round(rnd.uniform(0.5, 3.5), 2) for _ in range(count)]
+
+
+# ========== Случаи, выполняемые в отдельном процессе ==========
+
+def report_class(chart):
+    """Класс отчёта; без графика этапы графика пропускаются"""
+    from betta_gidroisolation import Gidroisolation_report
+    if chart:
+        return Gidroisolation_report
+
+    class ReportWithoutChart(Gidroisolation_report):
+        def start_chart_rendering(self):
+            self._chart_jobs = {}
+            self.get_stats()
+
+        def insert_chart_into_report(self):
+            pass
+
+    return ReportWithoutChart
+
+
+def run_report_case(case):
+    work_dir = os.getcwd()
+    template_path = make_template(case["template"], case["template_cells"], work_dir)
+    header = formula = None
+    if case["image_scale"]:
+        scale = case["image_scale"]
+        header = make_image(os.path.join(work_dir, "header.png"),
+                            HEADER_SIZE[0] * scale, HEADER_SIZE[1] * scale, 1)
+        formula = make_image(os.path.join(work_dir, "formula.png"),
+                             FORMULA_SIZE[0] * scale, FORMULA_SIZE[1] * scale, 2)
+
+    report_type = report_class(case["chart"])
+    values = make_values(case["values"])
+    output_dir = os.path.join(work_dir, "reports")
+
+    stage_samples = {}
+    totals = []
+    first_run_s = None
+    file_bytes = None
+    for run in range(case["warmup"] + case["repeat"]):
+        report = report_type(
+            r_f=f"report_{run}.xlsx", v=values, p_l="Участок 1", w_d="01.01.24", p_name="Слой",
+            chart_backend=case["chart_backend"], output_dir=output_dir
+        )
+        start = time.perf_counter()
+        file_path = report.create_gidroisolation_report(
+            "Участок", header, formula, template_path, user_info="Инженер Иванов И.И.", use_cache=False
+        )
+        elapsed = time.perf_counter() - start
+        file_bytes = os.path.getsize(file_path)
+        os.remove(file_path)
+        if run == 0:
+            first_run_s = elapsed
+        if run < case["warmup"]:
+            continue
+        totals.append(elapsed)
+        for name, (wall_s, _) in report.metrics.stage_totals().items():
+            stage_samples.setdefault(name, []).append(wall_s)
+
+    return {
+        "reports_per_second": len(totals) / sum(totals),
+        "first_run_s": first_run_s,
+        "total_s": summarize(totals),
+        "stages_s": {name: summarize(samples) for name, samples in stage_samples.items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "file_kb": file_bytes / 1024,
+    }
+
+
+def run_db_case(case):
+    from database import Database
+
+    db_path = os.path.join(os.getcwd(), "bench.db")
+    rows = case["db_rows"]
+    samples = {}
+
+    def timed(name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        samples.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    db = timed("open", Database, db_path)
+    object_ids = [timed("add_object", db.add_object, f"Объект {i}", f"Адрес {i}", "") for i in range(rows)]
+    device_ids = [timed("add_device", db.add_device, f"Прибор {i}", "ПСО-МГ4", f"INV-{i:06d}", "01.01.30", "")
+                  for i in range(rows)]
+    for i in range(rows):
+        timed("add_user", db.add_user, f"Пользователь {i}", f"user{i}", "password", "user", "Инженер")
+
+    rnd = random.Random(0)
+    for _ in range(case["repeat"]):
+        timed("open", Database, db_path)
+        timed("get_all_objects", db.get_all_objects)
+        timed("get_all_devices", db.get_all_devices)
+        timed("get_all_users", db.get_all_users)
+        timed("get_all_test_types", db.get_all_test_types)
+        timed("get_template", db.get_template, "Гидроизоляция")
+        timed("get_images_by_test_type", db.get_images_by_test_type, "Гидроизоляция")
+        for _ in range(20):
+            timed("get_object", db.get_object, rnd.choice(object_ids))
+            timed("get_device", db.get_device, rnd.choice(device_ids))
+            timed("authenticate_user", db.authenticate_user, f"user{rnd.randrange(rows)}", "password")
+            timed("get_report_reference_data", db.get_report_reference_data,
+                  rnd.sample(object_ids, 5), rnd.sample(device_ids, 5))
+
+    return {
+        "operations_s": {name: summarize(values) for name, values in samples.items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "db_kb": os.path.getsize(db_path) / 1024,
+    }
+
+
+def run_case_in_process(case, timeout=CASE_TIMEOUT):
+    """Выполняет случай в отдельном процессе с чистой рабочей папкой.
+    Если процесс не завершился за timeout секунд, он прерывается (RuntimeError)"""
+    env = dict(os.environ, PSFOSL_REPORT_CACHE="0", PSFOSL_CHART_CACHE="0")
+    env.pop("PSFOSL_METRICS_LOG", None)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [PROJECT_DIR, env.get("PYTHONPATH")]))
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Кэши программы — в рабочей папке случая, а не в общей папке проекта
+        env["PSFOSL_CACHE_DIR"] = os.path.join(work_dir, "cache")
+        try:
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case)],
+                cwd=work_dir, env=env, capture_output=True, text=True, timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"превышено время случая ({timeout:g} с)")
+    if process.returncode:
+        lines = process.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else "ошибка")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+# ========== Набор случаев ==========
+
+def case_id(case):
+    if case["kind"] == "db":
+        return f"db/rows{case['db_rows']}"
+    return (f"report/cells{case['template_cells']}/values{case['values']}/"
+            f"chart-{'on' if case['chart'] else 'off'}/images-x{case['image_scale']}")
+
+
+def report_cases(axes, full_matrix):
+    """Сочетания параметров отчёта: все (full_matrix) или по одному от базового случая"""
+    if full_matrix:
+        combinations = [{}]
+        for name, options in axes.items():
+            combinations = [dict(combo, **{name: option}) for combo in combinations for option in options]
+    else:
+        combinations = [dict(BASELINE)]
+        for name, options in axes.items():
+            combinations.extend(dict(BASELINE, **{name: option}) for option in options)
+    cases = []
+    seen = set()
+    for combo in combinations:
+        key = tuple(sorted(combo.items()))
+        if key not in seen:
+            seen.add(key)
+            cases.append(combo)
+    return cases
+
+
+def parse_list(text, convert=int):
+    return [convert(value) for value in text.split(",") if value.strip()]
+
+
+def parse_chart(value):
+    if value in ("on", "1", "true"):
+        return True
+    if value in ("off", "0", "false"):
+        return False
+    raise argparse.ArgumentTypeError(f"график: on или off, а не {value}")
+
+
+# ========== Вывод и сравнение ==========
+
+def format_result(result):
+    if "error" in result:
+        return f"{result['id']:<52} ошибка: {result['error']}"
+    if result["kind"] == "db":
+        operations = result["operations_s"]
+        slowest = sorted(operations.items(), key=lambda item: -item[1]["p50"])[:3]
+        details = ", ".join(f"{name} p50 {summary['p50'] * 1000:.2f} мс" for name, summary in slowest)
+        return f"{result['id']:<52} {details}"
+    total = result["total_s"]
+    return (f"{result['id']:<52} {result['reports_per_second']:>7.2f} {total['p50'] * 1000:>9.0f} "
+            f"{total['p90'] * 1000:>9.0f} {result['peak_rss_mb'] or 0:>8.1f} {result['file_kb']:>8.0f}")
+
+
+def compare(results, baseline_path):
+    """Печатает изменение скорости относительно результатов прошлого запуска"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {result["id"]: result for result in json.load(f)["results"]}
+    print(f"\nСравнение с {baseline_path}:")
+    for result in results:
+        old = baseline.get(result["id"])
+        if old is None or "error" in result or "error" in old:
+            continue
+        if result["kind"] == "db":
+            for name, summary in result["operations_s"].items():
+                old_summary = old["operations_s"].get(name)
+                if old_summary:
+                    change = (summary["p50"] / old_summary["p50"] - 1) * 100
+                    print(f"  {result['id']} {name}: p50 {old_summary['p50'] * 1000:.2f} → "
+                          f"{summary['p50'] * 1000:.2f} мс ({change:+.0f}%)")
+        else:
+            change = (result["total_s"]["p50"] / old["total_s"]["p50"] - 1) * 100
+            print(f"  {result['id']}: {old['reports_per_second']:.2f} → {result['reports_per_second']:.2f} "
+                  f"отчётов/с, p50 {change:+.0f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки создания отчётов и базы данных")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="исходный шаблон отчёта")
+    parser.add_argument("--template-cells", default="0,5000,50000",
+                        help="дополнительных оформленных ячеек в шаблоне, через запятую")
+    parser.add_argument("--values", default="4,100,1000,10000", help="числа измерений через запятую")
+    parser.add_argument("--chart", default="on,off", help="график: on, off")
+    parser.add_argument("--image-scales", default="0,1,4",
+                        help="размер изображений относительно размера на листе (0 — без изображений)")
+    parser.add_argument("--chart-backend", default="matplotlib", choices=("matplotlib", "native"))
+    parser.add_argument("--full-matrix", action="store_true", help="все сочетания параметров")
+    parser.add_argument("--repeat", type=int, default=5, help="замеряемых отчётов на случай")
+    parser.add_argument("--warmup", type=int, default=1, help="отчётов для прогрева (не замеряются)")
+    parser.add_argument("--case-timeout", type=float, default=CASE_TIMEOUT,
+                        help="наибольшее время одного случая, с (дольше — ошибка)")
+    parser.add_argument("--db-rows", default="1000", help="строк в таблицах базы данных, через запятую")
+    parser.add_argument("--skip-reports", action="store_true", help="не замерять отчёты")
+    parser.add_argument("--skip-db", action="store_true", help="не замерять базу данных")
+    parser.add_argument("--output", default="bench_results.json", help="файл результатов (JSON)")
+    parser.add_argument("--compare", help="результаты прошлого запуска для сравнения")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        case = json.loads(args.run_case)
+        result = run_db_case(case) if case["kind"] == "db" else run_report_case(case)
+        print(json.dumps(result))
+        return 0
+
+    cases = []
+    if not args.skip_reports:
+        axes = {
+            "template_cells": parse_list(args.template_cells),
+            "values": parse_list(args.values),
+            "chart": [parse_chart(value) for value in args.chart.split(",")],
+            "image_scale": parse_list(args.image_scales),
+        }
+        for combo in report_cases(axes, args.full_matrix):
+            cases.append(dict(combo, kind="report", template=os.path.abspath(args.template),
+                              chart_backend=args.chart_backend, repeat=args.repeat, warmup=args.warmup))
+    if not args.skip_db:
+        for rows in parse_list(args.db_rows):
+            cases.append({"kind": "db", "db_rows": rows, "repeat": args.repeat})
+
+    print(f"{'случай':<52} {'отчёт/с':>7} {'p50, мс':>9} {'p90, мс':>9} {'RSS, МБ':>8} {'файл, КБ':>8}")
+    results = []
+    for case in cases:
+        result = {"id": case_id(case), **case}
+        try:
+            result.update(run_case_in_process(case, args.case_timeout))
+        except RuntimeError as e:
+            result["error"] = str(e)
+        results.append(result)
+        print(format_result(result))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment_info(), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены: {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Бенчмарк потокового режима отчёта на длинных сериях измерений.
+
+Для каждого числа измерений создаёт отчёт в обычном и в потоковом режиме,
+каждый в отдельном процессе, и печатает время и пиковый объём памяти
+процесса (ru_maxrss). В потоковом режиме память не должна расти
+с числом измерений.
+
+Запуск из корня проекта:
+    python tools/bench_streaming.py [--rows 1000,10000,100000] [--modes regular,stream]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TEMPLATE = os.path.join("templates", "Гидроизоляция_gidroisolation_top.xlsx")
+
+# Код, который выполняется в отдельном процессе для одного замера
+CASE_SCRIPT = r"""
+import json, os, random, resource, sys, time
+from betta_gidroisolation import Gidroisolation_report
+
+mode, rows, template, backend, output = sys.argv[1], int(sys.argv[2]), sys.argv[3], sys.argv[4], sys.argv[5]
+
+def measurements():
+    rnd = random.Random(rows)
+    for _ in range(rows):
+        yield round(rnd.uniform(0.5, 3.5), 2)
+
+start = time.perf_counter()
+if mode == "stream":
+    report = Gidroisolation_report(r_f=output, chart_backend=backend)
+    report.create_streaming_report(measurements(), "Участок", template_path=template)
+else:
+    report = Gidroisolation_report(r_f=output, v=list(measurements()), chart_backend=backend)
+    report.create_gidroisolation_report("Участок", template_path=template, use_cache=False)
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "file_kb": os.path.getsize(output) / 1024,
+}))
+"""
+
+
+def run_case(mode, rows, template, backend):
+    """Создаёт один отчёт в отдельном процессе и возвращает результаты замера"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = os.path.join(temp_dir, f"{mode}_{rows}.xlsx")
+        process = subprocess.run(
+            [sys.executable, "-c", CASE_SCRIPT, mode, str(rows), template, backend, output],
+            cwd=PROJECT_DIR, capture_output=True, text=True
+        )
+    if process.returncode:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr else "ошибка")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк потокового режима отчёта")
+    parser.add_argument("--rows", default="1000,10000,100000", help="числа измерений через запятую")
+    parser.add_argument("--modes", default="regular,stream", help="режимы: regular, stream")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE)
+    parser.add_argument("--chart-backend", default="native", choices=("matplotlib", "native"))
+    parser.add_argument("--json", help="файл для сохранения результатов в JSON")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'режим':<10} {'строк':>8} {'время, с':>10} {'память, МБ':>11} {'файл, КБ':>10}")
+    for rows in [int(value) for value in args.rows.split(",")]:
+        for mode in args.modes.split(","):
+            try:
+                result = run_case(mode, rows, args.template, args.chart_backend)
+            except RuntimeError as e:
+                print(f"{mode:<10} {rows:>8} ошибка: {e}")
+                continue
+            results.append({"mode": mode, "rows": rows, **result})
+            print(f"{mode:<10} {rows:>8} {result['seconds']:>10.2f} {result['peak_rss_mb']:>11.1f} "
+                  f"{result['file_kb']:>10.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
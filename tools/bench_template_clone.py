@@ -0,0 +1,108 @@
+"""Бенчмарк клонирования шаблона отчёта.
+
+Сравнивает старое копирование шаблона (новые Font/PatternFill/Border/Alignment
+для каждой ячейки) с клонированием скомпилированного шаблона по карте стилей.
+
+Запуск из корня проекта:
+    python tools/bench_template_clone.py [путь к шаблону] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl
+from openpyxl.styles import Font, PatternFill, Border, Alignment
+
+from template_cache import compile_template
+
+
+DEFAULT_TEMPLATE = os.path.join("templates", "Гидроизоляция_gidroisolation_top.xlsx")
+
+
+def legacy_copy(source_ws, page_name="Участок"):
+    """Копирование шаблона так, как это делал create_empty_report раньше"""
+    result_wb = openpyxl.Workbook()
+    result_ws = result_wb.active
+    result_ws.title = page_name
+    result_ws.protection.sheet = False
+
+    for row in source_ws.iter_rows():
+        for cell in row:
+            new_cell = result_ws.cell(row=cell.row, column=cell.column)
+            new_cell.value = cell.value
+            if cell.font:
+                new_cell.font = Font(
+                    name=cell.font.name, size=cell.font.size, bold=cell.font.bold,
+                    italic=cell.font.italic, underline=cell.font.underline,
+                    strike=cell.font.strike, color=cell.font.color
+                )
+            if cell.fill:
+                new_cell.fill = PatternFill(
+                    start_color=cell.fill.start_color, end_color=cell.fill.end_color,
+                    fill_type=cell.fill.fill_type
+                )
+            if cell.border:
+                new_cell.border = Border(
+                    left=cell.border.left, right=cell.border.right, top=cell.border.top,
+                    bottom=cell.border.bottom, diagonal=cell.border.diagonal,
+                    diagonal_direction=cell.border.diagonal_direction,
+                    outline=cell.border.outline, vertical=cell.border.vertical,
+                    horizontal=cell.border.horizontal
+                )
+            if cell.alignment:
+                new_cell.alignment = Alignment(
+                    horizontal=cell.alignment.horizontal, vertical=cell.alignment.vertical,
+                    text_rotation=cell.alignment.text_rotation, wrap_text=cell.alignment.wrap_text,
+                    shrink_to_fit=cell.alignment.shrink_to_fit, indent=cell.alignment.indent
+                )
+
+    for col_letter, col_dimension in source_ws.column_dimensions.items():
+        result_ws.column_dimensions[col_letter].width = col_dimension.width
+    for merged_range in source_ws.merged_cells.ranges:
+        result_ws.merge_cells(str(merged_range))
+    return result_wb
+
+
+def measure(func, repeat):
+    """Возвращает лучшее время выполнения func из repeat запусков"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк клонирования шаблона отчёта")
+    parser.add_argument("template", nargs="?", default=DEFAULT_TEMPLATE)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    source_ws = openpyxl.load_workbook(args.template).active
+    compiled = compile_template(args.template)
+    cells = compiled.cell_count
+
+    def save(wb):
+        wb.save(BytesIO())
+
+    results = [
+        ("до: копирование по ячейкам", measure(lambda: legacy_copy(source_ws), args.repeat)),
+        ("после: клонирование по карте стилей", measure(compiled.clone, args.repeat)),
+        ("до: копирование + сохранение", measure(lambda: save(legacy_copy(source_ws)), args.repeat)),
+        ("после: клонирование + сохранение", measure(lambda: save(compiled.clone()), args.repeat)),
+    ]
+
+    print(f"Шаблон: {args.template}")
+    print(f"Ячеек: {cells}, уникальных стилей: {len(compiled.styles)}, повторов: {args.repeat}")
+    for name, elapsed in results:
+        print(f"{name:<40} {elapsed * 1000:8.2f} мс  {cells / elapsed:12.0f} ячеек/с")
+
+
+if __name__ == "__main__":
+    main()
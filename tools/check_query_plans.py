@@ -0,0 +1,152 @@
+"""Проверка планов запросов базы данных (EXPLAIN QUERY PLAN).
+
+Вызывает методы Database на временной базе с данными, перехватывает
+выполненные SQL-запросы (set_trace_callback) и проверяет их планы:
+  - полное чтение таблицы (SCAN без индекса) допускается только там,
+    где метод по смыслу возвращает всю таблицу;
+  - сортировка во временном B-дереве (USE TEMP B-TREE) — только там,
+    где она явно разрешена.
+Если в Database появится метод чтения, изменения или удаления, для которого
+здесь нет проверки, проверка тоже не пройдёт — новый запрос не останется
+без индекса незамеченным.
+
+Запуск из корня проекта:
+    python tools/check_query_plans.py [--verbose]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+ROWS = 200
+MISSING_ID = 10 ** 9
+
+# Методы, которые не выполняют запросов с условиями (вставка, служебные)
+NOT_LOOKUPS = {
+    "add_object", "add_device", "add_user", "add_image", "add_template",
+    "init_database", "create_default_admin", "create_developer", "hash_password",
+    "get_connection", "transaction", "read_transaction", "close",
+}
+
+# Проверяемые вызовы: метод, аргументы, таблицы, которые можно читать целиком,
+# разрешена ли сортировка во временном B-дереве
+CHECKS = [
+    ("get_all_objects", (), {"objects"}, False),
+    ("get_object", (1,), set(), False),
+    ("update_object", (MISSING_ID, "Объект"), set(), False),
+    ("delete_object", (MISSING_ID,), set(), False),
+    ("get_all_devices", (), {"devices"}, False),
+    ("get_device", (1,), set(), False),
+    ("update_device", (MISSING_ID, "Прибор"), set(), False),
+    ("delete_device", (MISSING_ID,), set(), False),
+    ("get_report_reference_data", ([1, 2, 3], [1, 2, 3]), set(), False),
+    ("get_all_users", (), {"users"}, False),
+    ("get_user", (1,), set(), False),
+    ("authenticate_user", ("user1", "password"), set(), False),
+    ("update_user", (MISSING_ID, "Пользователь", "nobody"), set(), False),
+    ("delete_user", (MISSING_ID,), set(), False),
+    ("get_all_images", (), set(), False),
+    ("get_images_by_test_type", ("Тип 1",), set(), False),
+    ("get_image", (1,), set(), False),
+    ("get_image_by_test_type_and_name", ("Тип 1", "Изображение 1"), set(), False),
+    ("update_image", (MISSING_ID, "Тип 1", "Изображение", "нет.png"), set(), False),
+    ("delete_image", (MISSING_ID,), set(), False),
+    ("get_all_test_types", (), set(), False),
+    ("get_template", ("Тип 1",), set(), False),
+    ("update_template", ("Нет такого типа", "нет.xlsx"), set(), False),
+    ("delete_template", ("Нет такого типа",), set(), False),
+    ("delete_test_type", ("Нет такого типа",), set(), False),
+    ("get_existing_inventory_numbers", (["INV-00001", "нет"],), set(), False),
+    ("get_existing_logins", (["user1", "нет"],), set(), False),
+    ("upsert_objects", ([(1, "Объект 1", "Адрес 1", "")],), set(), False),
+    ("upsert_devices", ([("Прибор 1", "ПСО-МГ4", "INV-00001", "01.01.30", "")],), set(), False),
+    ("upsert_users", ([("Пользователь 1", "user1", "", "user", "Инженер")],), set(), False),
+]
+
+# Запросы, которых пока нет в Database, но индексы под них уже есть
+EXTRA_QUERIES = [
+    ("приборы по сроку действия", "SELECT * FROM devices WHERE valid_until = '01.01.30'", set(), False),
+]
+
+SKIPPED_STATEMENTS = ("PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+def fill_database(db):
+    """Заполняет базу данными, похожими на рабочие"""
+    with db.transaction():
+        for i in range(ROWS):
+            db.add_object(f"Объект {i}", f"Адрес {i}", "")
+            db.add_device(f"Прибор {i}", "ПСО-МГ4", f"INV-{i:05d}", f"01.01.{i % 40:02d}", "")
+            db.add_user(f"Пользователь {i}", f"user{i}", "password", "user", "Инженер")
+            db.add_image(f"Тип {i % 20}", f"Изображение {i}", f"images/{i}.png", "")
+        for i in range(20):
+            db.add_template(f"Тип {i}", f"templates/{i}.xlsx")
+
+
+def plan_problems(connection, sql, allowed_scans, allow_temp_sort):
+    """Возвращает (строки плана, найденные нарушения)"""
+    plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    problems = []
+    for detail in plan:
+        match = FULL_SCAN.match(detail)
+        if match and match.group(1) not in allowed_scans:
+            problems.append(f"полное чтение таблицы {match.group(1)}")
+        if "USE TEMP B-TREE" in detail and not allow_temp_sort:
+            problems.append(f"сортировка без индекса ({detail})")
+    return plan, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка планов запросов базы данных")
+    parser.add_argument("--verbose", action="store_true", help="печатать планы всех запросов")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        db = Database(os.path.join(work_dir, "plans.db"))
+        fill_database(db)
+        connection = db.get_connection()
+
+        lookups = {name for name in dir(Database) if not name.startswith("_") and callable(getattr(Database, name))}
+        for name in sorted(lookups - NOT_LOOKUPS - {check[0] for check in CHECKS}):
+            failures.append(f"{name}: нет проверки плана запроса (добавьте метод в CHECKS)")
+
+        checks = []
+        for name, call_args, allowed_scans, allow_temp_sort in CHECKS:
+            statements = []
+            connection.set_trace_callback(statements.append)
+            try:
+                getattr(db, name)(*call_args)
+            finally:
+                connection.set_trace_callback(None)
+            queries = [sql for sql in statements if not sql.lstrip().upper().startswith(SKIPPED_STATEMENTS)]
+            checks.extend((name, sql, allowed_scans, allow_temp_sort) for sql in queries)
+        checks.extend(EXTRA_QUERIES)
+
+        for name, sql, allowed_scans, allow_temp_sort in checks:
+            if sql.lstrip().upper().startswith("INSERT") and "SELECT" not in sql.upper():
+                continue
+            plan, problems = plan_problems(connection, sql, allowed_scans, allow_temp_sort)
+            failures.extend(f"{name}: {problem}\n    {' '.join(sql.split())}" for problem in problems)
+            if args.verbose or problems:
+                print(f"{'НЕТ' if problems else 'ок '} {name}: {' | '.join(plan)}")
+        db.close()
+
+    if failures:
+        print("\nПроверка планов запросов не пройдена:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"Планы запросов в порядке: проверено {len(checks)} запросов")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
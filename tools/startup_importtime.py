@@ -0,0 +1,101 @@
+"""Замер времени импорта модулей при запуске приложения (по данным python -X importtime).
+
+Каждый модуль импортируется в отдельном процессе, чтобы кэш импортов
+не искажал результат. Скрипт печатает общее время импорта и самые
+тяжёлые зависимости и может проверять, что тяжёлые библиотеки отчётов
+не загружаются при старте:
+
+    python tools/startup_importtime.py main report --forbid matplotlib,openpyxl,numpy
+    python tools/startup_importtime.py main --max-ms 800 --json startup.json
+
+Код возврата 1, если импорт не удался, превышен --max-ms или загружен
+запрещённый модуль.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(module):
+    """Импортирует модуль в отдельном процессе, возвращает словарь с результатами"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    imports = []
+    errors = []
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append({
+                "name": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": len(indent) // 2,
+            })
+        elif not line.startswith("import time:"):
+            errors.append(line)
+
+    top_level = [item for item in imports if item["depth"] == 0]
+    return {
+        "module": module,
+        "ok": process.returncode == 0,
+        "error": "\n".join(errors[-5:]) if process.returncode else "",
+        "total_ms": sum(item["cumulative_ms"] for item in top_level),
+        "modules": sorted({item["name"] for item in imports}),
+        "top": sorted(imports, key=lambda item: item["cumulative_ms"], reverse=True)[:15],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер времени импорта модулей приложения")
+    parser.add_argument("modules", nargs="*", default=["main"], help="модули для замера (по умолчанию main)")
+    parser.add_argument("--forbid", default="",
+                        help="модули, которые не должны загружаться, через запятую")
+    parser.add_argument("--max-ms", type=float, help="допустимое время импорта, мс")
+    parser.add_argument("--json", help="файл для сохранения результатов в JSON")
+    args = parser.parse_args()
+
+    forbidden = [name.strip() for name in args.forbid.split(",") if name.strip()]
+    results = []
+    failed = False
+
+    for module in args.modules:
+        result = measure_import(module)
+        results.append(result)
+
+        print(f"== {module}: {result['total_ms']:.1f} мс")
+        if not result["ok"]:
+            print(f"   ошибка импорта:\n{result['error']}")
+            failed = True
+            continue
+        for item in result["top"]:
+            print(f"   {item['cumulative_ms']:9.1f} мс  {'  ' * item['depth']}{item['name']}")
+
+        loaded = [name for name in forbidden
+                  if any(m == name or m.startswith(name + ".") for m in result["modules"])]
+        if loaded:
+            print(f"   загружены запрещённые модули: {', '.join(loaded)}")
+            failed = True
+        if args.max_ms is not None and result["total_ms"] > args.max_ms:
+            print(f"   превышено допустимое время импорта ({args.max_ms:.0f} мс)")
+            failed = True
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([{key: value for key, value in result.items() if key != "modules"}
+                       for result in results], f, ensure_ascii=False, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""Нагрузочная проверка базы данных несколькими процессами.
+
+Несколько процессов-писателей (транзакция: новый прибор и изменение объекта)
+и процессов-читателей (согласованное чтение списка приборов и справочных
+данных отчёта) одновременно работают с одной базой заданное время, как
+пакетная генерация и администратор на разных рабочих местах. Проверка
+проходит, если:
+  - каждый процесс сделал хотя бы min-ops операций;
+  - ни один писатель не оттеснён другими: его число транзакций не меньше
+    min-writer-share от среднего по писателям, а p99 времени транзакции
+    не больше max-writer-p99-ms;
+  - ни одна операция не завершилась ошибкой «database is locked»;
+  - в базе ровно столько новых приборов, сколько записали писатели.
+
+Режимы: rollback — обычный журнал с busy_timeout и повторами,
+wal — журнал WAL (только для базы на локальном диске).
+
+Запуск из корня проекта:
+    python tools/stress_db.py [--writers 4] [--readers 4] [--seconds 5] [--modes rollback,wal]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_connection import is_busy_error
+
+
+PREFILL_ROWS = 200
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def worker(role, number, db_path, wal, busy_timeout, hold_s, deadline, start_event, results):
+    """Процесс нагрузки: пишет или читает до deadline и кладёт итоги в results"""
+    from database import Database
+
+    db = Database(db_path, wal=wal, busy_timeout=busy_timeout)
+    rnd = random.Random(number)
+    object_ids = [row[0] for row in db.get_all_objects()]
+    device_ids = [row[0] for row in db.get_all_devices()]
+    latencies = []
+    errors = []
+    written = 0
+    start_event.wait()
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            if role == "writer":
+                with db.transaction():
+                    db.add_device(f"Прибор {number}-{written}", "ПСО-МГ4", f"W{number}-{written}", "01.01.30")
+                    db.update_object(rnd.choice(object_ids), f"Объект {rnd.random():.6f}", "Адрес", "")
+                    # Транзакция держит блокировку записи, как медленное окно редактирования
+                    time.sleep(hold_s)
+                written += 1
+            else:
+                with db.read_transaction():
+                    db.get_all_devices()
+                    db.get_report_reference_data(rnd.sample(object_ids, 5), rnd.sample(device_ids, 5))
+        except sqlite3.Error as e:
+            errors.append(f"{'занято' if is_busy_error(e) else 'ошибка'}: {e}")
+            continue
+        latencies.append(time.perf_counter() - start)
+    db.close()
+    results.put({
+        "role": role, "number": number, "ops": len(latencies), "written": written,
+        "errors": errors, "retries": db.connections.busy_retry_count,
+        "p50_ms": percentile(latencies, 50) * 1000, "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+    })
+
+
+def run_mode(mode, args, work_dir):
+    """Один прогон нагрузки; возвращает (итоги процессов, сообщения о нарушениях)"""
+    from database import Database
+
+    db_path = args.db or os.path.join(work_dir, f"stress_{mode}.db")
+    wal = mode == "wal"
+    db = Database(db_path, wal=wal)
+    with db.transaction():
+        for i in range(PREFILL_ROWS):
+            db.add_object(f"Объект {i}", f"Адрес {i}", "")
+            db.add_device(f"Прибор {i}", "ПСО-МГ4", f"P{mode}-{os.getpid()}-{i}", "01.01.30")
+    devices_before = len(db.get_all_devices())
+    db.close()
+
+    context = multiprocessing.get_context("spawn")  # Как отдельные программы на рабочих местах
+    results = context.Queue()
+    start_event = context.Event()
+    startup_s = 3.0  # Запас на запуск процессов; отсчёт нагрузки — от start_event
+    deadline = time.time() + startup_s + args.seconds
+    processes = []
+    for role, count in (("writer", args.writers), ("reader", args.readers)):
+        for number in range(count):
+            process = context.Process(target=worker, args=(
+                role, number, db_path, wal, args.busy_timeout, args.hold_ms / 1000,
+                deadline, start_event, results
+            ))
+            process.start()
+            processes.append(process)
+    time.sleep(max(0.0, deadline - args.seconds - time.time()))
+    start_event.set()
+
+    stats = [results.get(timeout=args.seconds + 120) for _ in processes]
+    for process in processes:
+        process.join()
+
+    problems = []
+    writers = [item for item in stats if item["role"] == "writer"]
+    mean_writer_ops = sum(item["ops"] for item in writers) / len(writers) if writers else 0
+    for item in stats:
+        name = f"{item['role']} {item['number']}"
+        if item["ops"] < args.min_ops:
+            problems.append(f"{name}: {item['ops']} операций (меньше {args.min_ops})")
+        if item["role"] == "writer":
+            # Доля от среднего по писателям: близка к 1, если база делится поровну
+            item["share"] = item["ops"] / mean_writer_ops if mean_writer_ops else 0.0
+            if item["share"] < args.min_writer_share:
+                problems.append(f"{name}: {item['ops']} транзакций — {item['share']:.2f} от среднего "
+                                f"по писателям ({mean_writer_ops:.0f}), меньше {args.min_writer_share:g}")
+            if item["p99_ms"] > args.max_writer_p99_ms:
+                problems.append(f"{name}: p99 транзакции {item['p99_ms']:.0f} мс "
+                                f"(больше {args.max_writer_p99_ms:g} мс)")
+        for error in item["errors"][:3]:
+            problems.append(f"{name}: {error}")
+    db = Database(db_path, wal=wal)
+    written = sum(item["written"] for item in stats)
+    devices_after = len(db.get_all_devices())
+    db.close()
+    if devices_after - devices_before != written:
+        problems.append(f"записано {written} приборов, а в базе прибавилось {devices_after - devices_before}")
+    return sorted(stats, key=lambda item: (item["role"], item["number"])), problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка базы данных несколькими процессами")
+    parser.add_argument("--writers", type=int, default=4, help="процессов-писателей")
+    parser.add_argument("--readers", type=int, default=4, help="процессов-читателей")
+    parser.add_argument("--seconds", type=float, default=5, help="длительность нагрузки, с")
+    parser.add_argument("--modes", default="rollback,wal", help="режимы журнала: rollback, wal")
+    parser.add_argument("--busy-timeout", type=float, default=None,
+                        help="ожидание занятой базы, с (по умолчанию PSFOSL_DB_BUSY_TIMEOUT)")
+    parser.add_argument("--hold-ms", type=float, default=5, help="сколько писатель держит транзакцию, мс")
+    parser.add_argument("--min-ops", type=int, default=5, help="наименьшее число операций каждого процесса")
+    parser.add_argument("--min-writer-share", type=float, default=0.25,
+                        help="наименьшая доля транзакций писателя от среднего по писателям")
+    parser.add_argument("--max-writer-p99-ms", type=float, default=1000,
+                        help="наибольший p99 времени транзакции писателя, мс")
+    parser.add_argument("--db", help="файл базы (по умолчанию — временный; только на локальном диске для wal)")
+    parser.add_argument("--json", help="файл для сохранения результатов в JSON")
+    args = parser.parse_args()
+
+    report = {}
+    failed = False
+    with tempfile.TemporaryDirectory() as work_dir:
+        for mode in args.modes.split(","):
+            stats, problems = run_mode(mode, args, work_dir)
+            report[mode] = {"processes": stats, "problems": problems}
+            print(f"\nРежим {mode}: {args.writers} писателей, {args.readers} читателей, {args.seconds:g} с")
+            print(f"{'процесс':<10} {'операций':>9} {'в секунду':>10} {'p50, мс':>8} {'p99, мс':>8} "
+                  f"{'макс, мс':>9} {'повторов':>9} {'доля':>6}")
+            for item in stats:
+                print(f"{item['role'] + ' ' + str(item['number']):<10} {item['ops']:>9} "
+                      f"{item['ops'] / args.seconds:>10.1f} {item['p50_ms']:>8.2f} {item['p99_ms']:>8.2f} "
+                      f"{item['max_ms']:>9.1f} {item['retries']:>9} "
+                  f"{format(item['share'], '.2f') if 'share' in item else '-':>6}")
+            if problems:
+                failed = True
+                print("НЕ ПРОЙДЕНО:")
+                for problem in problems:
+                    print(f"  {problem}")
+            else:
+                print("Пройдено: все процессы работали одновременно без ошибок блокировки, "
+                      "писатели получали базу поровну")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())